@@ -0,0 +1,278 @@
+'''
+Throughput benchmarks of the registered envs (FairMOT/JDE x Parallel/
+Sequential) over synthetic sequences (synthetic.py) of each density
+profile: env steps per second, reset latency (median, the first reset of
+an env is reported apart) and the peak RSS of the process. Every env runs
+in a fresh spawned process with seeded random actions, the best of
+--repeats runs is kept. Results are written as JSON and compared with
+a stored baseline, metrics worse than it by more than the tolerance are
+flagged and the exit status is 1.
+Run from ahm-agent/:
+    python benchmarks/run_benchmarks.py [--profiles mot17 mot20] [--envs 'JDE/*']
+        [--steps 2000] [--repeats 3] [--output results.json] [--baseline benchmarks/baseline.json]
+        [--save-baseline]
+'''
+import argparse
+import contextlib
+import datetime as dt
+import fnmatch
+import json
+import multiprocessing as mp
+import os
+import os.path as osp
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from queue import Empty
+
+import gym
+import numpy as np
+from gym.envs.registration import load
+
+import motgym
+from synthetic import PROFILES, generate, profile_params
+
+BENCH_DIR = osp.dirname(osp.abspath(__file__))
+DEFAULT_BASELINE = osp.join(BENCH_DIR, 'baseline.json')
+DEFAULT_CACHE = osp.join(tempfile.gettempdir(), 'motgym_benchmarks')
+
+# Metrics checked against the baseline -> (True if higher is better,
+# changes too small to flag whatever the tolerance). The first reset is a
+# single sample, reported but not checked
+METRICS = {
+    "steps_per_sec": (True, 0.),
+    "reset_ms": (False, 5.),  # Resets of the parallel envs take a few ms
+    "peak_rss_mb": (False, 10.),
+}
+
+
+def env_ids(profile, pattern):
+    '''Registered tracker env ids run on a profile, e.g. FairMOT/Mot17ParallelEnv-v0'''
+    prefix = PROFILES[profile]["env_prefix"]
+    ids = []
+    for tracker in ['FairMOT', 'JDE']:
+        for kind in ['Parallel', 'Sequential']:
+            env_id = f'{tracker}/{prefix}{kind}Env-v0'
+            if env_id in gym.envs.registry.env_specs and fnmatch.fnmatch(env_id, pattern):
+                ids.append(env_id)
+    return ids
+
+
+def make_env(env_id, data_dir, dets_dir):
+    '''
+    The env of env_id over a synthetic profile: its tracker env class (the
+    registered class fixes the real dataset paths) built with absolute
+    paths, which the envs join onto their gym path unchanged
+    '''
+    env_cls = load(gym.spec(env_id).entry_point).__bases__[0]
+    return env_cls(data_dir, dets_dir)
+
+
+def _clear_warm_starts(dets_dir):
+    for seq in os.listdir(dets_dir):
+        shutil.rmtree(osp.join(dets_dir, seq, 'warm_start'), ignore_errors=True)
+
+
+def peak_rss_kb():
+    '''
+    High water mark of the process RSS. VmHWM starts over on exec, unlike
+    ru_maxrss which a spawned process inherits from its parent
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+
+
+def bench_env(env_id, data_dir, dets_dir, steps, resets, seed):
+    _clear_warm_starts(dets_dir)
+    env = make_env(env_id, data_dir, dets_dir)
+    random.seed(seed)  # Sequence, target and auxiliary actions
+    np.random.seed(seed)
+    rng = np.random.default_rng(seed)
+
+    start = time.perf_counter()
+    env.reset()
+    first_reset = time.perf_counter() - start
+
+    step_time, step_count, reset_times = 0., 0, []
+    while step_count < steps or len(reset_times) < resets:
+        if step_count >= steps:
+            done = True  # Enough steps, time the remaining resets
+        else:
+            start = time.perf_counter()
+            _, _, done, _ = env.step(int(rng.integers(env.action_space.n)))
+            step_time += time.perf_counter() - start
+            step_count += 1
+        if done:
+            start = time.perf_counter()
+            env.reset()
+            reset_times.append(time.perf_counter() - start)
+    env.close()
+
+    reset_ms = np.asarray(reset_times) * 1e3
+    return {
+        "steps": step_count,
+        "episodes": len(reset_times),
+        "steps_per_sec": step_count / step_time,
+        "reset_ms": float(np.median(reset_ms)),
+        "reset_p95_ms": float(np.percentile(reset_ms, 95)),
+        "first_reset_ms": first_reset * 1e3,
+        "peak_rss_mb": peak_rss_kb() / 1024,
+    }
+
+
+def _worker(queue, verbose, *args):
+    try:
+        with contextlib.ExitStack() as stack:
+            if not verbose:  # The envs print every load and 100 frames
+                devnull = stack.enter_context(open(os.devnull, 'w'))
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+            queue.put(bench_env(*args))
+    except Exception as e:
+        queue.put({"error": f'{type(e).__name__}: {e}'})
+
+
+def run_isolated(verbose, *args):
+    '''bench_env in a spawned process, so peak RSS only counts that env'''
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_worker, args=(queue, verbose) + args)
+    proc.start()
+    while True:
+        try:
+            result = queue.get(timeout=1.)
+            break
+        except Empty:
+            if not proc.is_alive():  # Killed before reporting, e.g. out of memory
+                result = {"error": f'exit code {proc.exitcode}'}
+                break
+    proc.join()
+    return result
+
+
+def best_of(runs):
+    '''Best of each metric over repeated runs of an env, as timeit does'''
+    errors = [r for r in runs if "error" in r]
+    if errors:
+        return errors[0]
+    best = dict(max(runs, key=lambda r: r["steps_per_sec"]))
+    for metric in ["reset_ms", "reset_p95_ms", "first_reset_ms", "peak_rss_mb"]:
+        best[metric] = min(r[metric] for r in runs)
+    best["repeats"] = len(runs)
+    return best
+
+
+def compare(results, baseline, tolerance):
+    '''Print results against baseline, returns the regressed (key, metric)s'''
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None or "error" in result or "error" in base:
+            print(f'{key}: no baseline')
+            continue
+        for metric, (higher_is_better, noise) in METRICS.items():
+            new, old = result[metric], base[metric]
+            change = (new - old) / old if old else 0.
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance and abs(new - old) > noise:
+                flag = '  REGRESSION'
+                regressions.append((key, metric))
+            print(f'{key:<45} {metric:<15} {old:10.1f} -> {new:10.1f} ({change:+.1%}){flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument('--envs', default='*', help='fnmatch pattern of env ids')
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--resets', type=int, default=10, help='min timed resets')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='runs of each env, the best of each metric is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frames', type=int, help='override the profile sequence length')
+    parser.add_argument('--objects', type=int, help='override the profile density')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative change of a metric flagged as a regression')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    overrides = {"frames": args.frames, "objects": args.objects}
+    results = {}
+    for profile in args.profiles:
+        ids = env_ids(profile, args.envs)
+        trackers = sorted({env_id.split('/')[0] for env_id in ids})
+        if not trackers:
+            continue
+        data_dir, dets_dirs = generate(
+            args.cache_dir, profile, trackers, seed=args.seed, **overrides)
+        for env_id in ids:
+            key = f'{env_id}@{profile}'
+            dets_dir = dets_dirs[env_id.split('/')[0]]
+            result = best_of([run_isolated(args.verbose, env_id, data_dir, dets_dir,
+                                           args.steps, args.resets, args.seed)
+                              for _ in range(args.repeats)])
+            results[key] = result
+            if "error" in result:
+                print(f'{key}: failed, {result["error"]}')
+            else:
+                print(f'{key}: {result["steps_per_sec"]:.1f} steps/s, reset '
+                      f'{result["reset_ms"]:.1f} ms (first {result["first_reset_ms"]:.1f} ms), '
+                      f'peak RSS {result["peak_rss_mb"]:.0f} MB')
+
+    report = {
+        "meta": {
+            "time": dt.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "steps": args.steps,
+            "resets": args.resets,
+            "repeats": args.repeats,
+            "seed": args.seed,
+            "profiles": {p: profile_params(p, **overrides) for p in args.profiles},
+        },
+        "results": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Baseline written to {args.baseline}')
+        return 0
+    if not osp.isfile(args.baseline):
+        print(f'No baseline at {args.baseline}, create one with --save-baseline')
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    profiles = json.loads(json.dumps(report["meta"]["profiles"]))
+    if any(baseline["meta"]["profiles"].get(p) != params for p, params in profiles.items()) or \
+            baseline["meta"]["steps"] != args.steps:
+        print('Warning: baseline was run with different profiles or steps')
+    regressions = compare(results, baseline["results"], args.tolerance)
+    failed = [key for key, result in results.items() if "error" in result]
+    print(f'{len(regressions)} regressions, {len(failed)} failed envs')
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
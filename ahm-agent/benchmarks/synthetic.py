@@ -0,0 +1,199 @@
+'''
+Synthetic MOT sequences for the env benchmarks: ground truth (gt.txt,
+seqinfo.ini, an img1/ listing of empty frames) and the cached detections of
+each tracker, written in the layouts the envs read (datasets/<profile>/<seq>
+and detections/<tracker>/<profile>/<seq> under a cache root). Objects move
+at constant velocity and are detected with box noise, misses and false
+positives, their embeddings are a fixed unit vector per object plus noise.
+Profiles set the density, MOT17-like (~30 objects per frame at 30 fps) and
+MOT20-like (~150 smaller objects per frame at 25 fps).
+'''
+import json
+import os
+import os.path as osp
+import shutil
+
+import numpy as np
+
+from motgym.envs.utils.det_store import load_store, save_store
+from motgym.envs.utils.gt_index import GroundTruthIndex
+from motgym.envs.utils.gt_labels import save_labels
+
+PROFILES = {
+    'mot17': {
+        "env_prefix": 'Mot17',  # Env ids benchmarked on the profile
+        "frame_rate": 30,
+        "frames": 300,
+        "seqs": 1,
+        "objects": 30,  # Mean objects per frame
+        "lifetime": (60, 300),  # Frames an object is visible
+        "height": (80, 300),  # Box heights in pixels, width is 0.35-0.5x
+        "speed": 3.,  # Std of the velocity in pixels per frame
+        "miss_rate": 0.1,
+        "false_positives": 2.,  # Mean per frame
+        "box_noise": 0.03,  # Std relative to the box size
+        "feat_noise": 0.3,
+    },
+    'mot20': {
+        "env_prefix": 'Mot20',
+        "frame_rate": 25,
+        "frames": 300,
+        "seqs": 1,
+        "objects": 150,
+        "lifetime": (100, 300),
+        "height": (50, 140),
+        "speed": 1.5,
+        "miss_rate": 0.15,
+        "false_positives": 5.,
+        "box_noise": 0.04,
+        "feat_noise": 0.35,
+    },
+}
+
+IM_WIDTH, IM_HEIGHT = 1920, 1080
+# Embedding size and detection row layout of each tracker's caches, see
+# detections/<tracker>/gen_*.py
+FEAT_DIMS = {'FairMOT': 128, 'JDE': 512}
+PARAMS_FILE = 'synthetic.json'
+
+
+def profile_params(profile, **overrides):
+    params = dict(PROFILES[profile])
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    return params
+
+
+def seq_names(params):
+    return [f'SYN{params["env_prefix"][3:]}-{i + 1:02d}' for i in range(params["seqs"])]
+
+
+def _objects(rng, params):
+    '''(N, 2) first/last frames, (N, 2) tl at frame 0, (N, 2) velocities, (N, 2) wh'''
+    frames, objects = params["frames"], params["objects"]
+    life_lo, life_hi = params["lifetime"]
+    # Enough candidates, then as many as make objects per frame on average
+    candidates = 4 * int(np.ceil(objects * frames / min(life_lo, frames))) + 1
+    lifetimes = rng.integers(life_lo, life_hi + 1, candidates)
+    first = rng.integers(2 - lifetimes, frames + 1)
+    last = np.minimum(first + lifetimes - 1, frames)
+    first = np.maximum(first, 1)
+    num = int(np.searchsorted(np.cumsum(last - first + 1), objects * frames)) + 1
+    first, last = first[:num], last[:num]
+
+    heights = rng.uniform(*params["height"], num)
+    wh = np.c_[heights * rng.uniform(0.35, 0.5, num), heights]
+    vel = rng.normal(0, params["speed"], (num, 2))
+    # Start positions so the box stays (mostly) in the image while visible
+    mid = np.c_[rng.uniform(0, IM_WIDTH, num), rng.uniform(0, IM_HEIGHT, num)]
+    tl = mid - wh / 2 - vel * ((first + last) / 2)[:, None]
+    return np.c_[first, last], tl, vel, wh
+
+
+def _write_dataset(seq_dir, params, spans, tl, vel, wh):
+    os.makedirs(osp.join(seq_dir, 'gt'), exist_ok=True)
+    os.makedirs(osp.join(seq_dir, 'img1'), exist_ok=True)
+    with open(osp.join(seq_dir, 'seqinfo.ini'), 'w') as f:
+        f.write(f'[Sequence]\nname={osp.basename(seq_dir)}\nimDir=img1\n'
+                f'frameRate={params["frame_rate"]}\nseqLength={params["frames"]}\n'
+                f'imWidth={IM_WIDTH}\nimHeight={IM_HEIGHT}\nimExt=.jpg\n')
+    # Frames are only listed (ImageList), never decoded by the benchmarks
+    for frame_id in range(1, params["frames"] + 1):
+        open(osp.join(seq_dir, 'img1', f'{frame_id:06d}.jpg'), 'w').close()
+
+    rows = []
+    for tid, ((first, last), tl0, v, size) in enumerate(zip(spans, tl, vel, wh), start=1):
+        for frame_id in range(first, last + 1):
+            x, y = tl0 + v * frame_id
+            rows.append(f'{frame_id},{tid},{x:.2f},{y:.2f},{size[0]:.2f},{size[1]:.2f},1,1,1.0\n')
+    rows.sort(key=lambda r: int(r.split(',', 1)[0]))
+    gt_filename = osp.join(seq_dir, 'gt', 'gt.txt')
+    with open(gt_filename, 'w') as f:
+        f.writelines(rows)
+
+
+def _detections(rng, feat_rng, params, spans, tl, vel, wh, feat_dim):
+    '''
+    {str(frame_id): (N, 5) tlbr + score}, {str(frame_id): (N, d) unit feats}.
+    Boxes only draw from rng, so they are the same whatever feat_dim
+    '''
+    identities = feat_rng.normal(0, 1, (len(spans), feat_dim))
+    identities /= np.linalg.norm(identities, axis=1, keepdims=True)
+    dets, feats = {}, {}
+    for frame_id in range(1, params["frames"] + 1):
+        visible = np.flatnonzero((spans[:, 0] <= frame_id) & (spans[:, 1] >= frame_id))
+        visible = visible[rng.random(len(visible)) >= params["miss_rate"]]
+        size = wh[visible] * (1 + rng.normal(0, params["box_noise"], (len(visible), 2)))
+        box_tl = tl[visible] + vel[visible] * frame_id + \
+            rng.normal(0, params["box_noise"], (len(visible), 2)) * wh[visible]
+        scores = rng.uniform(0.5, 1., len(visible))
+        frame_feats = identities[visible] + \
+            feat_rng.normal(0, params["feat_noise"] / np.sqrt(feat_dim), (len(visible), feat_dim))
+
+        num_fp = rng.poisson(params["false_positives"])
+        fp_size = rng.uniform(*params["height"], num_fp)[:, None] * [0.4, 1.]
+        fp_tl = np.c_[rng.uniform(0, IM_WIDTH, num_fp), rng.uniform(0, IM_HEIGHT, num_fp)]
+        fp_feats = feat_rng.normal(0, 1, (num_fp, feat_dim))
+
+        tlbr = np.r_[np.c_[box_tl, box_tl + size], np.c_[fp_tl, fp_tl + fp_size]]
+        scores = np.r_[scores, rng.uniform(0.4, 0.7, num_fp)]
+        frame_feats = np.r_[frame_feats, fp_feats]
+        frame_feats /= np.linalg.norm(frame_feats, axis=1, keepdims=True)
+        dets[str(frame_id)] = np.c_[tlbr, scores].astype(np.float32)
+        feats[str(frame_id)] = frame_feats.astype(np.float32)
+    return dets, feats
+
+
+def _write_detections(seq_dir, tracker, dets, feats, gt_filename):
+    if tracker == 'JDE':
+        # 0:4 tlbr, 4 score, 5 class, 6: embedding in one store
+        rows = {k: np.c_[d, np.zeros(len(d), np.float32), feats[k]] for k, d in dets.items()}
+        save_store(seq_dir, rows)
+    else:
+        save_store(seq_dir, dets, feats)
+    labelled, _ = load_store(seq_dir)
+    save_labels(seq_dir, labelled, GroundTruthIndex.load(gt_filename))
+
+
+def generate(root, profile, trackers=('FairMOT', 'JDE'), seed=0, **overrides):
+    '''
+    Write the sequences of a profile under root, unless they were already
+    written with the same parameters. Returns (dataset dir, {tracker:
+    detections dir}), as passed to the envs.
+    '''
+    params = profile_params(profile, **overrides)
+    data_dir = osp.join(root, 'datasets', profile)
+    dets_dirs = {t: osp.join(root, 'detections', t, profile) for t in trackers}
+    stamp = dict(params, seed=seed, feat_dims=FEAT_DIMS)
+    params_file = osp.join(root, f'{profile}.{PARAMS_FILE}')
+
+    written = {}
+    if osp.isfile(params_file):
+        with open(params_file) as f:
+            written = json.load(f)
+    if written.get("params") != json.loads(json.dumps(stamp)):
+        written = {"params": stamp, "trackers": []}
+        shutil.rmtree(data_dir, ignore_errors=True)
+    missing = [t for t in trackers if t not in written["trackers"]]
+    if not missing:
+        return data_dir, dets_dirs
+
+    rng = np.random.default_rng(seed)
+    for seq in seq_names(params):
+        spans, tl, vel, wh = _objects(rng, params)
+        gt_filename = osp.join(data_dir, seq, 'gt', 'gt.txt')
+        if not written["trackers"]:  # Kept otherwise, so labels stay current
+            _write_dataset(osp.join(data_dir, seq), params, spans, tl, vel, wh)
+        for tracker in missing:
+            # Every tracker gets the same boxes
+            seq_seed = [seed, int(seq[-2:])]
+            dets, feats = _detections(
+                np.random.default_rng(seq_seed + [0]), np.random.default_rng(seq_seed + [1]),
+                params, spans, tl, vel, wh, FEAT_DIMS[tracker])
+            seq_dir = osp.join(dets_dirs[tracker], seq)
+            shutil.rmtree(seq_dir, ignore_errors=True)
+            _write_detections(seq_dir, tracker, dets, feats, gt_filename)
+
+    written["trackers"] = sorted(written["trackers"] + missing)
+    with open(params_file, 'w') as f:
+        json.dump(written, f, indent=2)
+    return data_dir, dets_dirs
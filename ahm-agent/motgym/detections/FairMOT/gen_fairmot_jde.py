@@ -6,6 +6,7 @@ import os.path as osp
 from pathlib import Path
 
 import motgym
+from motgym.envs.utils.det_store import save_store
 import FairMOT.src._init_paths
 import datasets.dataset.jde as datasets
 from opts import opts
@@ -101,7 +102,4 @@ if __name__ == "__main__":
             feats[str(frame_id)] = id_feature
 
         print(f"Saving {seq} JDE to: {output_dir}")
-        dets_file = osp.join(output_dir, 'dets.npz')
-        feats_file = osp.join(output_dir, 'feats.npz')
-        np.savez(dets_file, **dets)
-        np.savez(feats_file, **feats)
+        save_store(output_dir, dets, feats)
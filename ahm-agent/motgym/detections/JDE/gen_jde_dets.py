@@ -5,6 +5,7 @@ import sys
 from pathlib import Path
 
 import motgym
+from motgym.envs.utils.det_store import save_store
 import torch
 import numpy as np
 
@@ -93,7 +94,6 @@ if __name__ == "__main__":
                 dets[str(frame_id)] = det
 
             print(f"Saving {seq} dets to: {output_dir}")
-            dets_file = osp.join(output_dir, 'dets.npz') # 0:5 is bbox, 6: is embedding
-            np.savez(dets_file, **dets)
+            save_store(output_dir, dets) # 0:5 is bbox, 6: is embedding
         except:
             print(f"Failed to process {seq}")
@@ -0,0 +1,24 @@
+'''
+Convert dets.npz/feats.npz caches (one zip member per frame) into the
+memory-mapped store read by the envs (dets.npy, feats.npy, frame_offsets.npy).
+    python convert_npz.py [detections_dir]
+'''
+import os
+import os.path as osp
+import sys
+
+import motgym
+from motgym.envs.utils.det_store import convert_npz, has_store
+
+
+if __name__ == "__main__":
+    root_dir = sys.argv[1] if len(sys.argv) == 2 else osp.dirname(osp.abspath(__file__))
+
+    for seq_dir, _, files in sorted(os.walk(root_dir)):
+        if 'dets.npz' not in files:
+            continue
+        if has_store(seq_dir):
+            print('Skipping %s' % seq_dir)
+            continue
+        print(f'Converting {seq_dir}')
+        convert_npz(seq_dir)
@@ -0,0 +1,39 @@
+'''
+Label every cached detection of a split with its ground truth id
+(gt_ids.npy next to the detection store, see motgym/envs/utils/gt_labels.py).
+The envs label a sequence on first load, this labels them ahead of training.
+npz caches are converted to the memory-mapped store first.
+    python label_gt.py <detections_dir> <dataset_dir>
+e.g.
+    python label_gt.py FairMOT/MOT17/train_half ../datasets/MOT17/train_half
+'''
+import os
+import os.path as osp
+import sys
+
+import numpy as np
+
+import motgym
+from motgym.envs.utils.det_store import load_or_convert
+from motgym.envs.utils.gt_index import GroundTruthIndex
+from motgym.envs.utils.gt_labels import IGNORED, UNMATCHED, save_labels
+
+
+if __name__ == "__main__":
+    dets_dir, data_dir = sys.argv[1:3]
+
+    for seq in sorted(os.listdir(dets_dir)):
+        seq_dir = osp.join(dets_dir, seq)
+        gt_filename = osp.join(data_dir, seq, 'gt', 'gt.txt')
+        if not osp.isdir(seq_dir) or not osp.isfile(gt_filename):
+            continue
+        store = load_or_convert(seq_dir)
+        if store is None:
+            print(f'Skipping {seq_dir}, unable to write the detection store')
+            continue
+        dets, _ = store
+        save_labels(seq_dir, dets, GroundTruthIndex.load(gt_filename))
+
+        labels = np.load(osp.join(seq_dir, 'gt_ids.npy'))
+        print(f'{seq}: {len(labels)} detections, {np.sum(labels >= 0)} matched, '
+              f'{np.sum(labels == UNMATCHED)} false positives, {np.sum(labels == IGNORED)} ignored')
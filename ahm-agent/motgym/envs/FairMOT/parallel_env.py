@@ -1,7 +1,5 @@
-import copy
 import os.path as osp
 
-import cv2
 import numpy as np
 from gym import spaces
 import FairMOT.src._init_paths
@@ -9,10 +7,16 @@ from modified.fairmot_train import TrainAgentJDETracker as Tracker
 from opts import opts
 from tracker.basetrack import BaseTrack
 
+from ..utils.lookahead import SharedLookahead
 from .base_fairmot_env import BaseFairmotEnv
 
 
 class ParallelFairmotEnv(BaseFairmotEnv):
+    # Simulate the look-ahead once and share it between the tracks of a
+    # frame while their gallery actions leave it unchanged (SharedLookahead),
+    # False simulates it for every track
+    shared_lookahead = True
+
     def __init__(self, dataset, detections):
         super().__init__(dataset, detections)
 
@@ -62,7 +66,12 @@ class ParallelFairmotEnv(BaseFairmotEnv):
             "gallery_size": len(track.features),
             "track_idx": self.track_idx
         }
-        seq_info = {"seq_len": self.seq_len, "frame_rate": self.frame_rate}
+        seq_info = {
+            "seq_len": self.seq_len,
+            "frame_rate": self.frame_rate,
+            "load": self.seq_load,  # Prefetch hit/miss and load time
+            "lookahead": self.lookahead_counts
+        }
         return {
             "curr_frame": self.frame_id,
             "ep_reward": self.ep_reward,
@@ -74,9 +83,12 @@ class ParallelFairmotEnv(BaseFairmotEnv):
     def _reset_state(self):
         self.frame_id = 1
         self.track_idx = 0
+        self.lookahead = None
+        self.lookahead_counts = {"simulated": 0, "reused": 0}
         BaseTrack._count = 0
         self.tracker = Tracker(
             self.tracker_args, self.frame_rate, lookup_gallery=10)
+        self.tracker.phase_timer = self.phase_timer
 
     def reset(self):
         self._reset_seq()
@@ -96,48 +108,52 @@ class ParallelFairmotEnv(BaseFairmotEnv):
 
     def _add_results(self, results_dict, frame_id, online_targets):
         results_dict.setdefault(frame_id, [])
-        for t in online_targets:
+        gt_ids = self._frame_gt_ids(frame_id, online_targets)
+        for t, gt_id in zip(online_targets, gt_ids):
             tlwh = t.tlwh
             tid = t.track_id
             ts = t.score
             vertical = tlwh[2] / tlwh[3] > 1.6
             min_area = self.tracker_args.min_box_area
             if tlwh[2] * tlwh[3] > min_area and not vertical:
-                track_result = (tuple(tlwh), tid, ts)
+                track_result = (tuple(tlwh), tid, ts, gt_id)
                 results_dict[frame_id].append(track_result)
 
     def _evaluate(self, track_id, eval_frame_id):  # TODO: Curr limited to k -> k+1
+        lookahead = self.lookahead
+        with self.phase_timer.phase('reuse_check'):
+            reusable = self.shared_lookahead and lookahead is not None and \
+                lookahead.reusable(self.frame_id, eval_frame_id)
+        if reusable:
+            self.lookahead_counts["reused"] += 1
+        else:
+            lookahead = self.lookahead = self._simulate(eval_frame_id)
+            self.lookahead_counts["simulated"] += 1
+        return lookahead.events.hypothesis_types(track_id)
+
+    def _simulate(self, eval_frame_id):
+        timer = self.phase_timer
         results = {}
         self._add_results(results, self.frame_id, self.online_targets)
 
-        frozen_count = BaseTrack._count
-        forzen_tracks = self.tracker.tracked_stracks
-        frozen_lost = self.tracker.lost_stracks
-        frozen_removed = self.tracker.removed_stracks
-        frozen_kf = self.tracker.kalman_filter
-
-        self.tracker.tracked_stracks = copy.deepcopy(forzen_tracks)
-        self.tracker.lost_stracks = copy.deepcopy(frozen_lost)
-        self.tracker.removed_stracks = copy.deepcopy(frozen_removed)
-        self.tracker.kalman_filter = copy.deepcopy(frozen_kf)
+        with timer.phase('snapshot'):
+            snapshot = self.tracker.snapshot()
+        self.tracker.association_log = [] if self.shared_lookahead else None
 
         curr_frame_id = self.frame_id
         while curr_frame_id < eval_frame_id:
             curr_frame_id += 1
-            dets = self.detections[str(curr_frame_id)]
-            feats = self.features[str(curr_frame_id)]
-            online_targets = self.tracker.update(dets, feats, curr_frame_id)
+            online_targets = self._track_update(curr_frame_id)
             self._add_results(results, curr_frame_id, online_targets)
 
-        BaseTrack._count = frozen_count
-        self.tracker.tracked_stracks = forzen_tracks
-        self.tracker.lost_stracks = frozen_lost
-        self.tracker.removed_stracks = frozen_removed
-        self.tracker.kalman_filter = frozen_kf
+        records, self.tracker.association_log = self.tracker.association_log, None
+        with timer.phase('restore'):
+            self.tracker.restore(snapshot)
 
-        events = self._get_events(results)
-        track_events = events[events['HId'] == track_id]
-        return list(track_events['Type'].values)
+        with timer.phase('events'):
+            events = self._get_events(results)
+        return SharedLookahead(self.frame_id, eval_frame_id, events, records,
+                               self.tracker.embedding_distance)
 
     def _generate_reward(self, track, mm_types):
         '''
@@ -165,17 +181,23 @@ class ParallelFairmotEnv(BaseFairmotEnv):
     @BaseFairmotEnv.calc_fps
     def step(self, action):
         '''Parallel env flow see env-data-flow.png for design'''
+        timer = self.phase_timer
         # Take action
-        track = self.online_targets[self.track_idx]
-        track.update_gallery(action, track.curr_feat)
+        with timer.phase('action'):
+            track = self.online_targets[self.track_idx]
+            track.update_gallery(action, track.curr_feat)
+            if action != 0 and self.lookahead is not None:
+                self.lookahead.changed.add(track)
 
         # Look to future to evaluate if successful action
         reward = 0
         if self.frame_id < self.seq_len:
             step = self.frame_rate * 0.2  # How far into future to evaluate
             eval_frame_id = min(self.seq_len - 1, self.frame_id + step)
-            mm_types = self._evaluate(track.track_id, eval_frame_id)
-            reward = self._generate_reward(track, mm_types)
+            with timer.phase('lookahead'):
+                mm_types = self._evaluate(track.track_id, eval_frame_id)
+            with timer.phase('reward'):
+                reward = self._generate_reward(track, mm_types)
         self.ep_reward += reward
 
         # Move to next frame and generate detections
@@ -183,19 +205,20 @@ class ParallelFairmotEnv(BaseFairmotEnv):
         if self.track_idx < len(self.online_targets) - 1:
             self.track_idx += 1
         else:
-            done = self._step_frame()
+            with timer.phase('next_frame'):
+                done = self._step_frame()
             self.track_idx = 0
 
         # Generate observation and info for new track
-        track = self.online_targets[self.track_idx]
-        obs = self._get_obs(track)
-        info = self._get_info(track)
+        with timer.phase('observation'):
+            track = self.online_targets[self.track_idx]
+            obs = self._get_obs(track)
+            info = self._get_info(track)
 
         return obs, reward, done, info
 
     def render(self, mode="human"):
-        img0 = cv2.imread(self.images[self.frame_id - 1])
-        self._init_rendering(img0.shape)
+        img0 = self._read_frame(self.frame_id, mode)
 
         # Add bounding box for each track in frame
         curr_track = self.online_targets[self.track_idx]
@@ -207,7 +230,7 @@ class ParallelFairmotEnv(BaseFairmotEnv):
                 img0, text, bbox, track.track_id, is_curr_track)
 
         track_id = self.online_targets[self.track_idx].track_id
-        self._display_frame(img0, track_id)
+        return self._display_frame(img0, track_id, mode)
 
 
 class DancetrackParallelEnv(ParallelFairmotEnv):
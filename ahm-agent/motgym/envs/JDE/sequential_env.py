@@ -1,18 +1,18 @@
 import os.path as osp
-from collections import defaultdict
 from math import isnan
 
-import cv2
 import random
 import numpy as np
 
 from modified.jde_train import TrainAgentJdeTracker as Tracker
 from tracker.basetrack import BaseTrack
 
+from ..utils.warm_start import WarmStartCache
 from .base_jde_env import BaseJdeEnv
 
 class SequentialJdeEnv(BaseJdeEnv):
     _instance = 0
+    use_warm_start = True  # Restore reset warm-ups from WarmStartCache
 
     def __init__(self, dataset, detections):
         super().__init__(dataset, detections)
@@ -20,6 +20,7 @@ class SequentialJdeEnv(BaseJdeEnv):
         print(f'Loading data from: {osp.join(self.data_dir, self.seq)}')
         self._load_dataset(self.seq)
         self._load_detections(self.seq)
+        self.warm_start = self._build_warm_start() if self.use_warm_start else None
 
     @staticmethod
     def next_instance():
@@ -27,15 +28,8 @@ class SequentialJdeEnv(BaseJdeEnv):
         return SequentialJdeEnv._instance
 
     def assign_target(self, track_id=None):
-        gts = self.evaluator.gt_frame_dict.items()
-        tid_dict = defaultdict(list)
-        for frame_id, gt in gts:
-            for tlwh, tid, score in gt:
-                tid_dict[tid].append(frame_id)
-
-        self.viable_tids = [
-            tid for tid,
-            frame_ids in tid_dict.items() if len(frame_ids) >= self.frame_rate * 1]
+        gt_index = self.evaluator.gt_index
+        self.viable_tids = gt_index.viable_tids(self.frame_rate * 1).tolist()
         if track_id:  # For debugging
             self.focus_tid = self.viable_tids[track_id]
         else:
@@ -44,7 +38,7 @@ class SequentialJdeEnv(BaseJdeEnv):
             self.focus_tid = self.viable_tids[idx]
             # self.focus_tid = viable_tids[self.next_instance() % len(viable_tids)]
 
-        self.frame_ids = tid_dict[self.focus_tid]
+        self.frame_ids = gt_index.tid_frames(self.focus_tid).tolist()
         print(f'Assigned ground truth TrackID: {self.focus_tid}')
         frame_range = f'{self.frame_ids[0]}-{self.frame_ids[-1]}'
         self.seq_len = self.frame_ids[-1]-self.frame_ids[0]
@@ -104,14 +98,15 @@ class SequentialJdeEnv(BaseJdeEnv):
 
     def _add_results(self, results_dict, frame_id, online_targets):
         results_dict.setdefault(frame_id, [])
-        for t in online_targets:
+        gt_ids = self._frame_gt_ids(frame_id, online_targets)
+        for t, gt_id in zip(online_targets, gt_ids):
             tlwh = t.tlwh
             tid = t.track_id
             ts = t.score
             vertical = tlwh[2] / tlwh[3] > 1.6
             min_area = self.tracker_args.min_box_area
             if tlwh[2] * tlwh[3] > min_area and not vertical:
-                track_result = (tuple(tlwh), tid, ts)
+                track_result = (tuple(tlwh), tid, ts, gt_id)
                 results_dict[frame_id].append(track_result)
 
     def _get_gt_tid(self):
@@ -119,37 +114,83 @@ class SequentialJdeEnv(BaseJdeEnv):
         self._add_results(results, self.frame_id, self.online_targets)
 
         events = self._get_events(results)
-        filtered_events = events[events['OId'] == self.focus_tid]
+        filtered_events = events.object_events(self.focus_tid)
 
-        if filtered_events.size == 0:
+        if len(filtered_events) == 0:
             return None
         else:
-            hypothesis_tid = filtered_events['HId'].item()
+            _, hypothesis_tid = filtered_events[0]
             return int(hypothesis_tid) if not isnan(hypothesis_tid) else None
 
+    def _build_tracker(self):
+        BaseTrack._count = 0  # Track ids of a new tracker start from 1
+        tracker = Tracker(
+            self.tracker_args, self.frame_rate)
+        tracker.phase_timer = self.phase_timer
+        return tracker
+
     def _reset_state(self):
         self.assign_target()
         self.frame_id = self.frame_ids[0]
         self.gt_tid = None
         self.acc_error = 0
-        BaseTrack._count = 0
         self.aux_thres = random.random()
-        self.tracker = Tracker(
-            self.tracker_args, self.frame_rate)
-
-    def reset(self):
-        self._reset_env()
-        self._reset_state()
+        self.tracker = self._build_tracker()
+
+    def _build_warm_start(self):
+        args = self.tracker_args
+        # The target's entry frame depends on how its track is matched to
+        # ground truth, by detection labels or by boxes
+        config = (Tracker.__name__, self.frame_rate, args.track_buffer,
+                  args.conf_thres, args.min_box_area, self.gt_labels is not None)
+        return WarmStartCache(osp.join(self.dets_dir, self.seq), config, [type(self)])
+
+    def _warm_up(self):
+        '''
+        Run the tracker from the first frame of the target until it is
+        matched, or restore that state from the warm start cache.
+        Returns False if the sequence ended before the target was matched.
+        '''
+        if self.warm_start is not None:
+            entry = self.warm_start.load(self.focus_tid)
+            if entry is not None:
+                if entry['gt_tid'] is None:
+                    return False
+                BaseTrack._count = entry['track_count']
+                self.tracker = entry['tracker']
+                self.tracker.phase_timer = self.phase_timer
+                self.online_targets = entry['online_targets']
+                self.frame_id = entry['frame_id']
+                self.gt_tid = entry['gt_tid']
+                self.results = entry['results']
+                return True
 
         self.online_targets = self._track_update(self.frame_id)
+        matched = True
         # Only release loop once the first track(s) confirmed
         while not self.online_targets or self.gt_tid == None:
-            done = self._step_frame()
+            if self._step_frame():
+                matched = False
+                break
             self.gt_tid = self._get_gt_tid()
-            if done:
-                self._reset_env()
-                self._reset_state()
-                self.online_targets = self._track_update(self.frame_id)
+
+        if self.warm_start is not None:
+            if matched:
+                self.warm_start.save(
+                    self.focus_tid, tracker=self.tracker,
+                    track_count=BaseTrack._count,
+                    online_targets=self.online_targets, frame_id=self.frame_id,
+                    gt_tid=self.gt_tid, results=self.results)
+            else:
+                self.warm_start.save(self.focus_tid, gt_tid=None)
+        return matched
+
+    def reset(self):
+        self._reset_env()
+        self._reset_state()
+        while not self._warm_up():
+            self._reset_env()
+            self._reset_state()
 
         self.track = next(filter(lambda x: x.track_id == self.gt_tid,
                                  self.online_targets))
@@ -179,26 +220,30 @@ class SequentialJdeEnv(BaseJdeEnv):
 
     @BaseJdeEnv.calc_fps
     def step(self, action):
-        for track in self.online_targets:
-            if track is self.track:
-                track.update_gallery(action, track.curr_feat)
-            else:
-                aux_action = 1 if random.random() < self.aux_thres else 0
-                track.update_gallery(aux_action, track.curr_feat)
-
-        is_end = self._step_frame()
-        self.gt_tid = self._get_gt_tid()
-        reward, track_lost = self._generate_reward()
+        timer = self.phase_timer
+        with timer.phase('action'):
+            for track in self.online_targets:
+                if track is self.track:
+                    track.update_gallery(action, track.curr_feat)
+                else:
+                    aux_action = 1 if random.random() < self.aux_thres else 0
+                    track.update_gallery(aux_action, track.curr_feat)
+        with timer.phase('next_frame'):
+            is_end = self._step_frame()
+        with timer.phase('events'):
+            self.gt_tid = self._get_gt_tid()
+        with timer.phase('reward'):
+            reward, track_lost = self._generate_reward()
         done = is_end or track_lost
         self.ep_reward += reward
 
-        obs = self._get_obs(self.track)
-        info = self._get_info(self.track)
+        with timer.phase('observation'):
+            obs = self._get_obs(self.track)
+            info = self._get_info(self.track)
         return obs, reward, done, info
 
     def render(self, mode="human"):
-        img0 = cv2.imread(self.images[self.frame_id - 1])
-        self._init_rendering(img0.shape)
+        img0 = self._read_frame(self.frame_id, mode)
 
         # Add bounding box for each track in frame
         for track in self.online_targets:
@@ -216,7 +261,7 @@ class SequentialJdeEnv(BaseJdeEnv):
             else:
                 self._visualize_box(img0, '', bbox, 1, False)
 
-        self._display_frame(img0, self.gt_tid)
+        return self._display_frame(img0, self.gt_tid, mode)
 
 
 class Mot17SequentialEnv(SequentialJdeEnv):
@@ -9,13 +9,33 @@ import time
 import numpy as np
 import datetime as dt
 import motmetrics as mm
+from modified.phase_timer import PhaseTimer
 from .utils.bbox_colors import _COLORS
+from .utils.det_store import FrameStore, load_or_convert
 from .utils.evaluation import Evaluator
+from .utils.events import EventMatcher
+from .utils.gt_labels import UNMATCHED, LabelMatcher, load_or_label
 from .utils.timer import Timer
 from .utils.io import unzip_objs
+from .utils.prefetch import SequencePrefetcher
+from .utils.render import FrameDecoder, VideoRecorder
+from .utils.seq_store import ImageList
 
 # Generalisable to any tracker (Hence obs/action space not defined)
 class BasicMotEnv(gym.Env):
+    metadata = {"render.modes": ["human", "rgb_array"]}
+    # Load the next random sequence in a background thread during each
+    # episode (_reset_seq), two sequences are then held in memory at once
+    prefetch_seqs = False
+    # Pair tracker outputs with ground truth through the GT id labels of
+    # their detections (gt_labels) instead of matching their boxes every
+    # step. Faster, but a Kalman smoothed box can match another object
+    # than its detection, so a few rewards differ, see check_gt_labels.py
+    use_gt_labels = False
+    # Time the phases of steps and tracker updates (PhaseTimer), reported
+    # in the info of the last step of an episode, see PhaseTimerCallbacks
+    time_phases = False
+
     def __init__(self, dataset, detections):
         self.action_space = None
         self.observation_space = None
@@ -23,6 +43,7 @@ class BasicMotEnv(gym.Env):
         random.seed(time.time_ns())
         self.first_render = True
         self.timer = Timer()
+        self.phase_timer = PhaseTimer(enabled=self.time_phases)
 
         self.gym_path = BasicMotEnv._get_gym_path()
         self.data_dir = osp.join(self.gym_path, 'datasets', dataset)
@@ -32,52 +53,128 @@ class BasicMotEnv(gym.Env):
 
         self.tracker_args = None
         self.tracker = None
+        self.prefetcher = None
+        self.seq_load = None  # Load stats of the current sequence, see SequencePrefetcher
+        self.gt_labels = None
+        self.frame_decoder = None
+        self.recorder = None
 
     def _reset_env(self):
         self.ep_reward = 0
         self.fps = None
         self.results = []
+        self.phase_timer.reset()
 
     def _reset_seq(self):
-        self.seq = self.seqs[random.randint(0, len(self.seqs) - 1)]
-        print(f'Loading data from: {osp.join(self.data_dir, self.seq)}')
-        self._load_dataset(self.seq)
-        self._load_detections(self.seq)
+        if not self.prefetch_seqs:
+            self.seq = self._random_seq()
+            print(f'Loading data from: {osp.join(self.data_dir, self.seq)}')
+            start = time.perf_counter()
+            self._load_dataset(self.seq)
+            self._load_detections(self.seq)
+            load_time = time.perf_counter() - start
+            self.seq_load = {"prefetch_hit": False, "load_time": load_time,
+                             "wait_time": load_time}
+            return
+
+        if self.prefetcher is None:
+            self.prefetcher = SequencePrefetcher(self._read_sequence)
+            self.prefetcher.request(self._random_seq())
+        self.seq, data, self.seq_load = self.prefetcher.take()
+        print(f'Loaded data from: {osp.join(self.data_dir, self.seq)} '
+              f'(prefetch {"hit" if self.seq_load["prefetch_hit"] else "miss"})')
+        vars(self).update(data)
+        # Next episode's sequence loads while this one runs
+        self.prefetcher.request(self._random_seq())
+
+    def _random_seq(self):
+        return self.seqs[random.randint(0, len(self.seqs) - 1)]
+
+    def _read_sequence(self, seq):
+        '''Loaded attributes of a sequence, runs in the prefetch thread'''
+        data = self._read_dataset(seq)
+        data.update(self._read_detections(seq))
+        data["gt_labels"] = self._read_gt_labels(seq, data)
+        return data
 
     def _load_dataset(self, seq):
-        self.evaluator = Evaluator(self.data_dir, seq, 'mot')
-        img1_path = osp.join(self.data_dir, seq, 'img1')
-        self.images = sorted(map(lambda x: osp.join(img1_path, x), os.listdir(img1_path)))
+        vars(self).update(self._read_dataset(seq))
+
+    def _load_detections(self, seq):
+        vars(self).update(self._read_detections(seq))
+        self.gt_labels = self._read_gt_labels(seq, vars(self))
+
+    def _read_dataset(self, seq):
+        evaluator = Evaluator(self.data_dir, seq, 'mot')
+        data = {
+            "evaluator": evaluator,
+            "event_matcher": EventMatcher(evaluator),
+            "label_matcher": LabelMatcher(evaluator),
+            "images": ImageList(osp.join(self.data_dir, seq, 'img1'))
+        }
         try:
             meta_info = open(osp.join(self.data_dir, seq, 'seqinfo.ini')).read()
-            self.frame_rate = int(meta_info[meta_info.find('frameRate') + 10:meta_info.find('\nseqLength')])
-            self.seq_len = int(meta_info[meta_info.find('seqLen') + 10:meta_info.find('\nimWidth')])
+            data["frame_rate"] = int(meta_info[meta_info.find('frameRate') + 10:meta_info.find('\nseqLength')])
+            data["seq_len"] = int(meta_info[meta_info.find('seqLen') + 10:meta_info.find('\nimWidth')])
         except:
             print("Unable to load meta data")
+        return data
 
-    def _load_detections(self, seq):
-        self.detections = np.load(osp.join(self.dets_dir, seq, 'dets.npz'))
+    def _read_detections(self, seq):
+        seq_dir = osp.join(self.dets_dir, seq)
+        store = load_or_convert(seq_dir)
+        if store is not None:
+            return dict(zip(("detections", "features"), store))
+
+        print(f'Unable to write memory-mapped detections to {seq_dir}, falling '
+              'back to npz (convert with motgym/detections/convert_npz.py)')
+        data = {"detections": np.load(osp.join(seq_dir, 'dets.npz'))}
         try:
-            self.features = np.load(osp.join(self.dets_dir, seq, 'feats.npz'))
+            data["features"] = np.load(osp.join(seq_dir, 'feats.npz'))
         except:
-            self.features = None
+            data["features"] = None
+        return data
+
+    def _read_gt_labels(self, seq, data):
+        '''
+        GT id labels of the detections, needs the memory-mapped detection
+        store and the sequence's evaluator (read first)
+        '''
+        if not self.use_gt_labels or not isinstance(data["detections"], FrameStore):
+            return None
+        gt_filename = osp.join(self.data_dir, seq, 'gt', 'gt.txt')
+        return load_or_label(osp.join(self.dets_dir, seq), data["detections"],
+                             data["evaluator"].gt_index, gt_filename)
 
     @abstractmethod
     def reset(self):
         pass
 
+    def _frame_gt_ids(self, frame_id, tracks):
+        '''Labels of the detections tracks matched in frame_id, None without labels'''
+        if self.gt_labels is None:
+            return [None] * len(tracks)
+        labels = self.gt_labels[frame_id]
+        return [int(labels[t.det_index]) if t.frame_id == frame_id and t.det_index >= 0
+                else UNMATCHED for t in tracks]
+
     def _get_events(self, results):
-        self.evaluator.reset_accumulator()
+        '''Events of results, {frame_id: [(tlwh, track_id, score, gt_id)]}'''
+        matcher = self.event_matcher if self.gt_labels is None else self.label_matcher
+        matcher.reset()
 
-        frames = sorted(
-            list(set(self.evaluator.gt_frame_dict.keys()) & set(results.keys())))
+        gt_index = self.evaluator.gt_index
+        frames = sorted(f for f in results.keys() if f in gt_index)
         for frame_id in frames:
             trk_objs = results.get(frame_id, [])
-            trk_tlwhs, trk_ids = unzip_objs(trk_objs)[:2]
-            self.evaluator.eval_frame(
-                frame_id, trk_tlwhs, trk_ids, rtn_events=False)
+            if self.gt_labels is None:
+                trk_tlwhs, trk_ids = unzip_objs([obj[:3] for obj in trk_objs])[:2]
+                matcher.update(frame_id, trk_tlwhs, trk_ids)
+            else:
+                trk_ids = [obj[1] for obj in trk_objs]
+                matcher.update(frame_id, [obj[3] for obj in trk_objs], trk_ids)
 
-        events = self.evaluator.acc.mot_events
+        events = matcher.events
         return events
 
     @abstractmethod
@@ -88,6 +185,28 @@ class BasicMotEnv(gym.Env):
     def render(self, mode="human"):
         pass
 
+    def start_recording(self, filename, fps=None):
+        '''
+        Write every frame rendered from now on (in any mode) to an mp4,
+        encoded in a background thread. fps defaults to the frame rate of
+        the sequence, parallel envs render each frame once per track.
+        '''
+        self.stop_recording()
+        self.recorder = VideoRecorder(filename, fps or self.frame_rate)
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            recorder.close()
+
+    def _read_frame(self, frame_id, mode):
+        '''Image of frame_id to draw on, the next frame is decoded meanwhile'''
+        if mode not in self.metadata["render.modes"]:
+            raise ValueError(f'Unsupported render mode {mode}')
+        if self.frame_decoder is None or self.frame_decoder.images is not self.images:
+            self.frame_decoder = FrameDecoder(self.images)
+        return self.frame_decoder.read(frame_id - 1)
+
     def _init_rendering(self, shape):
         # Create empty frame on first load
         if self.first_render:
@@ -99,26 +218,41 @@ class BasicMotEnv(gym.Env):
             time.sleep(1)
             self.first_render = False
 
-    def _display_frame(self, img, track_id):
+    def _display_frame(self, img, track_id, mode="human"):
+        '''Show (human) or return as RGB (rgb_array) the annotated frame'''
         text = f'Frame {self.frame_id}, TrackID {track_id}, {self.fps} fps'
         # scale = 1200/img.shape[1]
         # img = cv2.resize(img, None, fx = scale, fy = scale)
         cv2.putText(img, text, (6, 22), cv2.FONT_HERSHEY_PLAIN,
                     1.25, (0, 0, 255), 2, cv2.LINE_8)
+        if self.recorder is not None:
+            self.recorder.write(img)
+        if mode == "rgb_array":
+            return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        self._init_rendering(img.shape)
         cv2.imshow('env snapshot', img)
         cv2.waitKey(1)
 
     def close(self):
-        cv2.destroyAllWindows()
+        self.stop_recording()
+        if not self.first_render:  # No window without a human render
+            cv2.destroyAllWindows()
         self.first_render = True
 
+    def _add_phase_times(self, info, done):
+        '''Per-phase times of the episode in the info of its last step'''
+        if done and self.phase_timer.enabled:
+            info["phase_times"] = self.phase_timer.summary()
+
     @staticmethod
     def calc_fps(step_func):
         def inner(self, action):
             self.timer.tic()
-            output = step_func(self, action)
+            with self.phase_timer.phase('step'):
+                output = step_func(self, action)
             self.timer.toc()
             self.fps = round(1./self.timer.average_time, 2)
+            self._add_phase_times(output[3], output[2])
             return output
         return inner
 
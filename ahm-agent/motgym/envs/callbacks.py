@@ -0,0 +1,39 @@
+from ray.rllib.agents.callbacks import DefaultCallbacks
+from ray.rllib.env.vector_env import VectorEnv
+
+
+def _mot_envs(env):
+    '''The BasicMotEnvs behind an env created by a rollout worker'''
+    if isinstance(env, VectorEnv):
+        return [e for sub_env in env.get_sub_environments() for e in _mot_envs(sub_env)]
+    env = getattr(env, 'unwrapped', env)
+    if hasattr(env, 'phase_timer'):
+        return [env]
+    inner = getattr(env, 'env', None)  # MultiTargetSequentialEnv
+    return _mot_envs(inner) if inner is not None else []
+
+
+class PhaseTimerCallbacks(DefaultCallbacks):
+    '''
+    Turns on the phase timers (time_phases) of the envs of every rollout
+    worker and reports the per-phase times of each episode as custom
+    metrics phase_times/worker_<i>/<phase path>/<stat>, which RLlib
+    averages per training iteration. Set as "callbacks" in the trainer
+    config.
+    '''
+
+    def on_sub_environment_created(self, *, worker, sub_environment, env_context, **kwargs):
+        for env in _mot_envs(sub_environment):
+            env.phase_timer.enabled = True
+
+    def on_episode_end(self, *, worker, base_env, policies, episode, **kwargs):
+        for agent_id in episode.get_agents():
+            info = episode.last_info_for(agent_id) or {}
+            if "phase_times" in info:
+                break
+        else:
+            return
+        prefix = f'phase_times/worker_{worker.worker_index}'
+        for path, stats in info["phase_times"].items():
+            for stat, value in stats.items():
+                episode.custom_metrics[f'{prefix}/{path}/{stat}'] = value
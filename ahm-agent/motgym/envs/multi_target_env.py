@@ -0,0 +1,193 @@
+import random
+from math import isnan
+
+import gym
+from ray.rllib.env.multi_agent_env import MultiAgentEnv
+
+import motgym
+
+
+class TargetAgent(object):
+    '''Per ground truth track state, as held by a sequential env for its focus_tid'''
+
+    def __init__(self, tid, frame_ids):
+        self.tid = tid
+        self.first_frame = frame_ids[0]
+        self.last_frame = frame_ids[-1]
+        self.seq_len = self.last_frame - self.first_frame
+        self.track = None  # Hypothesis track, assigned once first matched
+        self.acc_error = 0
+        self.ep_reward = 0
+
+
+class MultiTargetSequentialEnv(MultiAgentEnv):
+    '''
+    Multi-agent version of a FairMOT/JDE sequential env where every viable
+    ground truth track of the sequence is an agent (agent id = gt track id)
+    and all agents share one tracker run over the sequence.
+
+    An agent starts once its ground truth track is first matched to an
+    unclaimed tracker track and then controls the gallery of that track,
+    with the rewards and early termination of the sequential env. Tracks
+    not controlled by an agent get random actions as in the sequential env.
+    Frames where no agent is acting are skipped inside step/reset.
+
+    Use with RLlib through register_env, e.g.
+        register_env("multi_target_seq_env", lambda _: MultiTargetSequentialEnv(
+            "motgym:FairMOT/Mot17SequentialEnv-v0"))
+    '''
+
+    def __init__(self, env_id):
+        super().__init__()
+        self.env = gym.make(env_id).unwrapped
+        self.observation_space = self.env.observation_space
+        self.action_space = self.env.action_space
+
+    def _match_targets(self):
+        '''Ground truth track id -> matched tracker track id in current frame'''
+        results = {}
+        self.env._add_results(results, self.frame_id, self.online_targets)
+        events = self.env._get_events(results)
+        matches = {}
+        for oid, hid in zip(events.oids, events.hids):
+            if not isnan(oid) and oid not in matches:
+                matches[int(oid)] = None if isnan(hid) else int(hid)
+        return matches
+
+    def _start_agents(self, matches, obs):
+        claimed = {agent.track.track_id for agent in self.active.values()}
+        tracks = {t.track_id: t for t in self.online_targets}
+        for tid, agent in list(self.pending.items()):
+            if self.frame_id > agent.last_frame:
+                del self.pending[tid]  # Never matched
+                continue
+            hid = matches.get(tid)
+            if self.frame_id < agent.first_frame or hid is None or \
+                    hid in claimed or hid not in tracks:
+                continue
+            agent.track = tracks[hid]
+            claimed.add(hid)
+            self.active[tid] = self.pending.pop(tid)
+            obs[tid] = agent.track.obs
+
+    def _take_actions(self, action_dict):
+        owners = {id(agent.track): tid for tid, agent in self.active.items()}
+        for track in self.online_targets:
+            tid = owners.get(id(track))
+            if tid in action_dict:
+                track.update_gallery(action_dict[tid], track.curr_feat)
+            else:
+                aux_action = 1 if random.random() < self.aux_thres else 0
+                track.update_gallery(aux_action, track.curr_feat)
+
+    def _step_frame(self):
+        if self.frame_id >= self.last_frame:
+            return True
+        self.frame_id += 1
+        self.online_targets = self.env._track_update(self.frame_id)
+        return False
+
+    def _generate_reward(self, agent, gt_tid):
+        TN = not gt_tid and not agent.track in self.online_targets
+        TP = agent.track.track_id == gt_tid
+        prop_reward = 100 / agent.seq_len
+
+        if TN or TP:
+            reward = prop_reward
+            agent.acc_error = 1
+        else:
+            reward = -prop_reward
+            agent.acc_error += 1
+
+        # Track permanently lost
+        done = agent.acc_error > self.buffer_size
+        return reward, done
+
+    def _get_info(self, agent):
+        track_info = {
+            "track_id": agent.track.track_id,
+            "gallery_size": len(agent.track.features),
+        }
+        seq_info = {
+            "seq_len": agent.seq_len,
+            "frame_rate": self.env.frame_rate
+        }
+        return {
+            "curr_frame": self.frame_id,
+            "ep_reward": agent.ep_reward,
+            "curr_track": track_info,
+            "seq_info": seq_info
+        }
+
+    def _advance(self, obs):
+        '''Move through frames until an agent is acting or the sequence ends'''
+        is_end = False
+        while not self.active and self.pending and not is_end:
+            self._take_actions({})
+            is_end = self._step_frame()
+            self._start_agents(self._match_targets(), obs)
+        return is_end
+
+    def reset(self):
+        env = self.env
+        env._reset_env()
+        env.tracker = env._build_tracker()
+        self.aux_thres = random.random()
+        self.buffer_size = int(env.frame_rate / 30.0 * env.tracker_args.track_buffer)
+
+        gt_index = env.evaluator.gt_index
+        tids = gt_index.viable_tids(env.frame_rate * 1).tolist()
+        self.pending = {
+            tid: TargetAgent(tid, gt_index.tid_frames(tid).tolist()) for tid in tids}
+        self.active = {}
+        self._agent_ids = set(tids)
+        self.frame_id = min(a.first_frame for a in self.pending.values())
+        self.last_frame = max(a.last_frame for a in self.pending.values())
+
+        obs = {}
+        self.online_targets = env._track_update(self.frame_id)
+        self._start_agents(self._match_targets(), obs)
+        self._advance(obs)
+        if not obs:
+            raise Exception('No ground truth track was matched in sequence')
+        return obs
+
+    def step(self, action_dict):
+        timer = self.env.phase_timer
+        timer.start('step')
+        with timer.phase('action'):
+            self._take_actions(action_dict)
+        with timer.phase('next_frame'):
+            is_end = self._step_frame()
+        with timer.phase('events'):
+            matches = self._match_targets()
+
+        obs, rewards, dones, infos = {}, {}, {}, {}
+        for tid in action_dict:
+            agent = self.active[tid]
+            reward, track_lost = self._generate_reward(agent, matches.get(tid))
+            agent.ep_reward += reward
+            obs[tid] = agent.track.obs
+            rewards[tid] = reward
+            dones[tid] = is_end or track_lost or self.frame_id >= agent.last_frame
+            infos[tid] = self._get_info(agent)
+            if dones[tid]:
+                del self.active[tid]
+
+        if not is_end:
+            self._start_agents(matches, obs)
+            with timer.phase('advance'):
+                is_end = self._advance(obs)
+        dones["__all__"] = is_end or not (self.active or self.pending)
+        timer.stop()  # step
+        if dones["__all__"]:
+            for info in infos.values():
+                self.env._add_phase_times(info, True)
+        return obs, rewards, dones, infos
+
+    def render(self, mode="human"):
+        self.env.frame_id = self.frame_id
+        self.env.online_targets = self.online_targets
+        self.env.gt_tid = None
+        self.env.track = None
+        return self.env.render(mode)
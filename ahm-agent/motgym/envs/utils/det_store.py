@@ -0,0 +1,107 @@
+import os
+import os.path as osp
+
+import numpy as np
+
+from .seq_store import build_lock, load_npy, save_npy
+
+DETS_FILE = 'dets.npy'
+FEATS_FILE = 'feats.npy'
+OFFSETS_FILE = 'frame_offsets.npy'
+
+
+class FrameStore(object):
+    '''
+    Per-frame rows of one contiguous memory-mapped array. Rows of frame f
+    are array[offsets[f]:offsets[f + 1]]. Indexed like the old npz caches,
+    i.e. store[str(frame_id)], and returns a private writable copy since the
+    trackers normalise features in place.
+    '''
+
+    def __init__(self, array, offsets):
+        self.array = array
+        self.offsets = offsets
+
+    def __getitem__(self, frame_id):
+        frame_id = int(frame_id)
+        if frame_id < 0 or frame_id + 1 >= len(self.offsets):
+            return np.empty((0,) + self.array.shape[1:], dtype=self.array.dtype)
+        return np.array(self.array[self.offsets[frame_id]:self.offsets[frame_id + 1]])
+
+    def __contains__(self, frame_id):
+        return 0 <= int(frame_id) < len(self.offsets) - 1
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+def has_store(seq_dir):
+    return osp.isfile(osp.join(seq_dir, DETS_FILE)) and \
+        osp.isfile(osp.join(seq_dir, OFFSETS_FILE))
+
+
+def load_store(seq_dir):
+    '''Memory-map (dets, feats) of a sequence, feats is None if not cached'''
+    offsets = np.load(osp.join(seq_dir, OFFSETS_FILE))
+    dets = FrameStore(load_npy(osp.join(seq_dir, DETS_FILE)), offsets)
+    feats = None
+    if osp.isfile(osp.join(seq_dir, FEATS_FILE)):
+        feats = FrameStore(load_npy(osp.join(seq_dir, FEATS_FILE)), offsets)
+    return dets, feats
+
+
+def _stack_frames(frames, frame_ids, offsets):
+    rows = [np.asarray(frames[str(fid)], dtype=np.float32) for fid in frame_ids]
+    width = next((r.shape[1] for r in rows if r.ndim == 2 and r.size), 0)
+    rows = [r.reshape(-1, width) for r in rows]
+    array = np.zeros((offsets[-1], width), dtype=np.float32)
+    for fid, r in zip(frame_ids, rows):
+        array[offsets[fid]:offsets[fid + 1]] = r
+    return array
+
+
+def save_store(seq_dir, dets, feats=None):
+    '''
+    Write per-frame {str(frame_id): array} dicts (the layout of the old
+    dets.npz/feats.npz caches) as contiguous float32 arrays plus offsets
+    '''
+    frame_ids = sorted(int(k) for k in dets.keys())
+    counts = np.zeros(frame_ids[-1] + 1 if frame_ids else 1, dtype=np.int64)
+    for fid in frame_ids:
+        counts[fid] = len(dets[str(fid)])
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    os.makedirs(seq_dir, exist_ok=True)
+    save_npy(osp.join(seq_dir, DETS_FILE), _stack_frames(dets, frame_ids, offsets))
+    if feats is not None:
+        save_npy(osp.join(seq_dir, FEATS_FILE), _stack_frames(feats, frame_ids, offsets))
+    # Offsets last, readers treat their presence as a complete store
+    save_npy(osp.join(seq_dir, OFFSETS_FILE), offsets)
+
+
+def convert_npz(seq_dir):
+    '''Convert a dets.npz (and feats.npz) cache in seq_dir to the mmap store'''
+    with np.load(osp.join(seq_dir, 'dets.npz')) as dets_npz:
+        dets = {k: dets_npz[k] for k in dets_npz.files}
+    feats = None
+    if osp.isfile(osp.join(seq_dir, 'feats.npz')):
+        with np.load(osp.join(seq_dir, 'feats.npz')) as feats_npz:
+            feats = {k: feats_npz[k] for k in feats_npz.files}
+    save_store(seq_dir, dets, feats)
+
+
+def load_or_convert(seq_dir):
+    '''
+    load_store, converting the npz caches first if needed. The first worker
+    on a node converts while the others wait and then map its store.
+    Returns None if the store can't be written.
+    '''
+    if has_store(seq_dir):
+        return load_store(seq_dir)
+    with build_lock(osp.join(seq_dir, 'store.lock')):
+        if not has_store(seq_dir):  # Converted while waiting
+            try:
+                convert_npz(seq_dir)
+            except OSError:
+                return None
+    return load_store(seq_dir)
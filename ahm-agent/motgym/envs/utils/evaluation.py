@@ -4,6 +4,7 @@ import copy
 import motmetrics as mm
 mm.lap.default_solver = 'lap'
 
+from .gt_index import GroundTruthIndex
 from .io import read_results, unzip_objs
 
 
@@ -21,8 +22,7 @@ class Evaluator(object):
         assert self.data_type == 'mot'
 
         gt_filename = os.path.join(self.data_root, self.seq_name, 'gt', 'gt.txt')
-        self.gt_frame_dict = read_results(gt_filename, self.data_type, is_gt=True)
-        self.gt_ignore_frame_dict = read_results(gt_filename, self.data_type, is_ignore=True)
+        self.gt_index = GroundTruthIndex.load(gt_filename)
 
     def reset_accumulator(self):
         self.acc = mm.MOTAccumulator(auto_id=True)
@@ -33,12 +33,10 @@ class Evaluator(object):
         trk_ids = np.copy(trk_ids)
 
         # gts
-        gt_objs = self.gt_frame_dict.get(frame_id, [])
-        gt_tlwhs, gt_ids = unzip_objs(gt_objs)[:2]
+        gt_tlwhs, gt_ids = self.gt_index.frame(frame_id)
 
         # ignore boxes
-        ignore_objs = self.gt_ignore_frame_dict.get(frame_id, [])
-        ignore_tlwhs = unzip_objs(ignore_objs)[0]
+        ignore_tlwhs = self.gt_index.ignore(frame_id)
 
         # remove ignored results
         keep = np.ones(len(trk_tlwhs), dtype=bool)
@@ -0,0 +1,125 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def iou_distance_matrix(objs, hyps, max_iou=0.5):
+    '''Same as motmetrics.distances.iou_matrix for (x, y, w, h) boxes'''
+    if np.size(objs) == 0 or np.size(hyps) == 0:
+        return np.empty((0, 0))
+    objs = np.asarray(objs, dtype=float)[:, None]
+    hyps = np.asarray(hyps, dtype=float)[None, :]
+    i_min = np.maximum(objs[..., :2], hyps[..., :2])
+    i_max = np.minimum(objs[..., :2] + objs[..., 2:], hyps[..., :2] + hyps[..., 2:])
+    i_vol = np.prod(np.maximum(i_max - i_min, 0), axis=-1)
+    a_vol = np.prod(np.maximum(objs[..., 2:], 0), axis=-1)
+    b_vol = np.prod(np.maximum(hyps[..., 2:], 0), axis=-1)
+    u_vol = a_vol + b_vol - i_vol
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(i_vol == 0, 0., i_vol / u_vol)
+    dist = 1 - iou
+    return np.where(dist > max_iou, np.nan, dist)
+
+
+def linear_assignment(dists):
+    '''Same as motmetrics.lap.linear_sum_assignment, nan marks do-not-pair'''
+    if dists.size == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    valid = np.isfinite(dists)
+    if not valid.any():
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    # Invalid edge cost large enough that it is never preferred to valid edges
+    large = 2 * min(dists.shape) * (np.abs(dists[valid]).max() + 1) + 1
+    rids, cids = linear_sum_assignment(np.where(valid, dists, large))
+    keep = valid[rids, cids]
+    return rids[keep], cids[keep]
+
+
+class MotEvents(object):
+    '''Flat record of MATCH/SWITCH/MISS/FP events, nan ids as in motmetrics'''
+
+    def __init__(self):
+        self.frame_ids = []
+        self.types = []
+        self.oids = []
+        self.hids = []
+
+    def append(self, frame_id, event_type, oid, hid):
+        self.frame_ids.append(frame_id)
+        self.types.append(event_type)
+        self.oids.append(oid)
+        self.hids.append(hid)
+
+    def __len__(self):
+        return len(self.types)
+
+    def hypothesis_types(self, hid):
+        return [t for t, h in zip(self.types, self.hids) if h == hid]
+
+    def object_events(self, oid):
+        return [(t, h) for t, o, h in zip(self.types, self.oids, self.hids) if o == oid]
+
+
+class EventMatcher(object):
+    '''
+    Incremental, pandas free equivalent of Evaluator.eval_frame feeding a
+    motmetrics.MOTAccumulator. Object/hypothesis pairings are kept across
+    frames until reset() so SWITCH events are raised as in motmetrics. Only
+    the MATCH/SWITCH/MISS/FP event types are produced.
+    '''
+
+    def __init__(self, evaluator, max_iou=0.5):
+        self.gt_index = evaluator.gt_index
+        self.max_iou = max_iou
+        self.reset()
+
+    def reset(self):
+        self.m = {}  # Object id -> last paired hypothesis id
+        self.events = MotEvents()
+
+    def update(self, frame_id, trk_tlwhs, trk_ids):
+        trk_tlwhs = np.asarray(trk_tlwhs, dtype=float).reshape(-1, 4)
+        trk_ids = np.asarray(trk_ids)
+        gt_tlwhs, gt_ids = self.gt_index.frame(frame_id)
+        ignore_tlwhs = self.gt_index.ignore(frame_id)
+
+        # Remove results inside ignore regions
+        iou_distance = iou_distance_matrix(ignore_tlwhs, trk_tlwhs, max_iou=0.5)
+        if len(iou_distance) > 0:
+            _, match_js = linear_assignment(iou_distance)
+            keep = np.ones(len(trk_tlwhs), dtype=bool)
+            keep[match_js] = False
+            trk_tlwhs = trk_tlwhs[keep]
+            trk_ids = trk_ids[keep]
+
+        dists = iou_distance_matrix(gt_tlwhs, trk_tlwhs, max_iou=self.max_iou)
+        dists = dists.reshape(len(gt_ids), len(trk_ids)).copy()
+        oids_masked = np.zeros(len(gt_ids), dtype=bool)
+        hids_masked = np.zeros(len(trk_ids), dtype=bool)
+
+        if dists.size > 0:
+            # 1. Carry forward pairings from previous frames
+            for i, o in enumerate(gt_ids):
+                if o not in self.m:
+                    continue
+                j, = np.where(~hids_masked & (trk_ids == self.m[o]))
+                if j.shape[0] > 0 and np.isfinite(dists[i, j[0]]):
+                    oids_masked[i] = hids_masked[j[0]] = True
+                    self.events.append(frame_id, 'MATCH', o, trk_ids[j[0]])
+
+            # 2. Solve remaining constellations, new pairings may be switches
+            dists[oids_masked, :] = np.nan
+            dists[:, hids_masked] = np.nan
+            for i, j in zip(*linear_assignment(dists)):
+                o, h = gt_ids[i], trk_ids[j]
+                is_switch = o in self.m and self.m[o] != h
+                self.events.append(frame_id, 'SWITCH' if is_switch else 'MATCH', o, h)
+                oids_masked[i] = hids_masked[j] = True
+                self.m[o] = h
+
+        # 3. Unpaired objects are missed, unpaired hypotheses false positives
+        for o in gt_ids[~oids_masked]:
+            self.events.append(frame_id, 'MISS', o, np.nan)
+        for h in trk_ids[~hids_masked]:
+            self.events.append(frame_id, 'FP', np.nan, h)
+
+        return self.events
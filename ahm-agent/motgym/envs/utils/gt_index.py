@@ -0,0 +1,190 @@
+import os
+import os.path as osp
+
+import numpy as np
+
+from .seq_store import build_lock, load_npy, save_npy
+
+# Label conventions of MOT16/17 gt.txt, see read_mot_results
+VALID_LABELS = [1]
+IGNORE_LABELS = [2, 7, 8, 12]
+
+
+class GroundTruthIndex(object):
+    '''
+    Columnar ground truth of one sequence. Boxes are sorted by frame with
+    per-frame offsets (gt and ignore regions), and frame ids are sorted by
+    track id with per-tid offsets. Built once from gt.txt and cached next to
+    it in gt_index/ (one .npy per field) so env resets don't re-parse the
+    text file.
+    '''
+    version = 3
+    fields = ['frame_ids', 'gt_offsets', 'gt_tlwhs', 'gt_ids',
+              'ignore_offsets', 'ignore_tlwhs', 'ignore_ids', 'tids', 'tid_offsets', 'tid_frame_ids',
+              'tid_order']
+
+    def __init__(self, **arrays):
+        for field in self.fields:
+            setattr(self, field, arrays[field])
+        self._frame_pos = {fid: i for i, fid in enumerate(self.frame_ids.tolist())}
+
+    @staticmethod
+    def cache_path(gt_filename):
+        return osp.join(osp.dirname(gt_filename), 'gt_index')
+
+    @classmethod
+    def _load_cache(cls, cache_dir, gt_filename):
+        version_file = osp.join(cache_dir, 'version.npy')
+        if not osp.isfile(version_file) or \
+                osp.getmtime(version_file) < osp.getmtime(gt_filename) or \
+                int(np.load(version_file)) != cls.version:
+            return None
+        return cls(**{field: load_npy(osp.join(cache_dir, f'{field}.npy'))
+                      for field in cls.fields})
+
+    @classmethod
+    def load(cls, gt_filename, use_cache=True):
+        '''
+        Index of gt_filename, memory-mapped read-only from the cache so all
+        workers on a node share one copy (see seq_store)
+        '''
+        if not use_cache:
+            return cls.from_file(gt_filename)
+
+        cache_dir = cls.cache_path(gt_filename)
+        index = cls._load_cache(cache_dir, gt_filename)
+        if index is None:
+            with build_lock(f'{cache_dir}.lock'):
+                index = cls._load_cache(cache_dir, gt_filename)  # Built while waiting
+                if index is None:
+                    index = cls.from_file(gt_filename)
+                    if index.save(cache_dir):
+                        index = cls._load_cache(cache_dir, gt_filename)
+        return index
+
+    def save(self, cache_dir):
+        '''Write the index to cache_dir, returns False if it can't be written'''
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            for field in self.fields:
+                save_npy(osp.join(cache_dir, f'{field}.npy'), getattr(self, field))
+            # Version last, readers treat its presence as a complete cache
+            save_npy(osp.join(cache_dir, 'version.npy'), np.int64(self.version))
+        except OSError:
+            print(f'Unable to cache ground truth index to {cache_dir}')
+            return False
+        return True
+
+    @classmethod
+    def from_file(cls, gt_filename):
+        rows = []
+        if osp.isfile(gt_filename):
+            with open(gt_filename, 'r') as f:
+                for line in f.readlines():
+                    linelist = line.split(',')
+                    if len(linelist) < 7:
+                        continue
+                    extra = linelist[7:9] + ['nan'] * (9 - len(linelist))
+                    rows.append(list(map(float, linelist[:7] + extra)))
+        data = np.asarray(rows, dtype=float).reshape(-1, 9)
+        data = data[data[:, 0] >= 1]
+
+        frames = data[:, 0].astype(int)
+        is_gt = np.ones(len(data), dtype=bool)
+        is_ignore = np.zeros(len(data), dtype=bool)
+        if 'MOT16-' in gt_filename or 'MOT17-' in gt_filename:
+            labels = data[:, 7].astype(int)
+            is_gt = (data[:, 6].astype(int) != 0) & np.isin(labels, VALID_LABELS)
+            is_ignore = np.isin(labels, IGNORE_LABELS) | (data[:, 8] < 0)
+
+        # Every frame in the file is indexed, even if all its boxes are filtered
+        frame_ids = np.unique(frames)
+
+        def by_frame(mask):
+            order = np.argsort(frames[mask], kind='stable')
+            offsets = np.searchsorted(
+                frames[mask][order], np.append(frame_ids, frame_ids[-1] + 1 if len(frame_ids) else 0))
+            return order, offsets
+
+        gt_order, gt_offsets = by_frame(is_gt)
+        gt_data = data[is_gt][gt_order]
+        ignore_order, ignore_offsets = by_frame(is_ignore)
+        ignore_data = data[is_ignore][ignore_order]
+
+        tid_order = np.lexsort((gt_data[:, 0], gt_data[:, 1]))
+        tid_data = gt_data[tid_order, :2].astype(int)
+        tids = np.unique(tid_data[:, 1])
+        tid_offsets = np.searchsorted(
+            tid_data[:, 1], np.append(tids, tids[-1] + 1 if len(tids) else 0))
+
+        # Track ids in the order read_mot_results' dicts meet them: frames in
+        # the order of their first row in the file, rows of a frame in file order
+        _, first_rows = np.unique(frames, return_index=True)
+        frame_rank = np.empty(len(frame_ids), dtype=int)
+        frame_rank[np.argsort(first_rows)] = np.arange(len(frame_ids))
+        gt_rows = np.flatnonzero(is_gt)
+        row_ranks = frame_rank[np.searchsorted(frame_ids, frames[gt_rows])]
+        seen_tids = data[gt_rows[np.lexsort((gt_rows, row_ranks))], 1].astype(int)
+        _, first_seen = np.unique(seen_tids, return_index=True)
+
+        return cls(frame_ids=frame_ids,
+                   gt_offsets=gt_offsets,
+                   gt_tlwhs=gt_data[:, 2:6].copy(),
+                   gt_ids=gt_data[:, 1].astype(int),
+                   ignore_offsets=ignore_offsets,
+                   ignore_tlwhs=ignore_data[:, 2:6].copy(),
+                   ignore_ids=ignore_data[:, 1].astype(int),
+                   tids=tids,
+                   tid_offsets=tid_offsets,
+                   tid_frame_ids=tid_data[:, 0].copy(),
+                   tid_order=seen_tids[np.sort(first_seen)])
+
+    def __contains__(self, frame_id):
+        return frame_id in self._frame_pos
+
+    def __len__(self):
+        return len(self.frame_ids)
+
+    def frame(self, frame_id):
+        '''Ground truth (tlwhs, ids) of a frame as array views'''
+        i = self._frame_pos.get(frame_id)
+        if i is None:
+            return self.gt_tlwhs[:0], self.gt_ids[:0]
+        start, end = self.gt_offsets[i], self.gt_offsets[i + 1]
+        return self.gt_tlwhs[start:end], self.gt_ids[start:end]
+
+    def ignore(self, frame_id):
+        '''Ignore region tlwhs of a frame as an array view'''
+        i = self._frame_pos.get(frame_id)
+        if i is None:
+            return self.ignore_tlwhs[:0]
+        return self.ignore_tlwhs[self.ignore_offsets[i]:self.ignore_offsets[i + 1]]
+
+    def tid_frames(self, tid):
+        '''Sorted frame ids where a ground truth track is present'''
+        i = np.searchsorted(self.tids, tid)
+        if i == len(self.tids) or self.tids[i] != tid:
+            return self.tid_frame_ids[:0]
+        return self.tid_frame_ids[self.tid_offsets[i]:self.tid_offsets[i + 1]]
+
+    def tid_counts(self):
+        return np.diff(self.tid_offsets)
+
+    def viable_tids(self, min_frames):
+        '''Track ids present in at least min_frames frames, in order of first appearance'''
+        counts = self.tid_counts()[np.searchsorted(self.tids, self.tid_order)]
+        return self.tid_order[counts >= min_frames]
+
+    def to_frame_dict(self, ignore=False):
+        '''Same layout as read_mot_results: {frame_id: [(tlwh, id, score)]}'''
+        results_dict = dict()
+        for i, fid in enumerate(self.frame_ids.tolist()):
+            if ignore:
+                start, end = self.ignore_offsets[i], self.ignore_offsets[i + 1]
+                tlwhs, ids = self.ignore_tlwhs[start:end], self.ignore_ids[start:end]
+            else:
+                start, end = self.gt_offsets[i], self.gt_offsets[i + 1]
+                tlwhs, ids = self.gt_tlwhs[start:end], self.gt_ids[start:end]
+            results_dict[fid] = [(tuple(tlwh), tid, 1)
+                                 for tlwh, tid in zip(tlwhs.tolist(), ids.tolist())]
+        return results_dict
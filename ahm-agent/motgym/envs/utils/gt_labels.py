@@ -0,0 +1,124 @@
+'''
+Ground truth identity of every cached detection, computed once per
+sequence and stored next to the detection store as gt_ids.npy (one row per
+detection row, same frame offsets). Detections are labelled with the rule
+Evaluator.eval_frame applies to tracker outputs: boxes paired with an
+ignore region (IoU >= 0.5) are ignored, the others are assigned to ground
+truth boxes with IoU >= 0.5. Tracks record the detection they matched
+(AgentSTrack.det_index), so the envs pair their outputs with ground truth
+by label lookups (LabelMatcher) instead of IoU matching every step.
+'''
+import os.path as osp
+
+import numpy as np
+
+from .det_store import OFFSETS_FILE, FrameStore
+from .events import MotEvents, iou_distance_matrix, linear_assignment
+from .seq_store import build_lock, load_npy, save_npy
+
+GT_IDS_FILE = 'gt_ids.npy'
+
+UNMATCHED = -1  # False positive
+IGNORED = -2  # In an ignore region, not evaluated
+
+
+def label_frame(gt_index, frame_id, tlwhs):
+    '''GT id (or UNMATCHED/IGNORED) of each (N, 4) tlwh box of a frame'''
+    tlwhs = np.asarray(tlwhs, dtype=float).reshape(-1, 4)
+    labels = np.full(len(tlwhs), UNMATCHED, dtype=np.int64)
+
+    # Boxes inside ignore regions
+    iou_distance = iou_distance_matrix(gt_index.ignore(frame_id), tlwhs, max_iou=0.5)
+    if len(iou_distance) > 0:
+        _, match_js = linear_assignment(iou_distance)
+        labels[match_js] = IGNORED
+
+    kept = np.flatnonzero(labels == UNMATCHED)
+    gt_tlwhs, gt_ids = gt_index.frame(frame_id)
+    iou_distance = iou_distance_matrix(gt_tlwhs, tlwhs[kept], max_iou=0.5)
+    if len(iou_distance) > 0:
+        match_is, match_js = linear_assignment(iou_distance)
+        labels[kept[match_js]] = gt_ids[match_is]
+    return labels
+
+
+def label_detections(dets, gt_index):
+    '''Labels of all rows of a detection FrameStore (tlbr in columns 0-3)'''
+    labels = np.full(len(dets.array), UNMATCHED, dtype=np.int64)
+    for frame_id in range(len(dets)):
+        start, end = dets.offsets[frame_id], dets.offsets[frame_id + 1]
+        if start == end:
+            continue
+        tlwhs = np.array(dets.array[start:end, :4], dtype=float)
+        tlwhs[:, 2:] -= tlwhs[:, :2]
+        labels[start:end] = label_frame(gt_index, frame_id, tlwhs)
+    return labels
+
+
+def _is_current(gt_ids_file, seq_dir, gt_filename, num_dets):
+    if not osp.isfile(gt_ids_file):
+        return False
+    sources = [osp.join(seq_dir, OFFSETS_FILE), gt_filename]
+    source_mtime = max((osp.getmtime(f) for f in sources if osp.isfile(f)), default=0.)
+    return osp.getmtime(gt_ids_file) >= source_mtime and \
+        len(load_npy(gt_ids_file)) == num_dets
+
+
+def save_labels(seq_dir, dets, gt_index):
+    save_npy(osp.join(seq_dir, GT_IDS_FILE), label_detections(dets, gt_index))
+
+
+def load_or_label(seq_dir, dets, gt_index, gt_filename):
+    '''
+    Labels of the detection store of seq_dir as a FrameStore, built (under
+    a lock, see seq_store) if missing or older than the detections or
+    gt_filename. Kept in memory if they can't be written.
+    '''
+    gt_ids_file = osp.join(seq_dir, GT_IDS_FILE)
+    if not _is_current(gt_ids_file, seq_dir, gt_filename, len(dets.array)):
+        with build_lock(osp.join(seq_dir, 'gt_ids.lock')):
+            if not _is_current(gt_ids_file, seq_dir, gt_filename, len(dets.array)):
+                try:
+                    save_labels(seq_dir, dets, gt_index)
+                except OSError:
+                    print(f'Unable to write detection labels to {seq_dir}')
+                    return FrameStore(label_detections(dets, gt_index), dets.offsets)
+    return FrameStore(load_npy(gt_ids_file), dets.offsets)
+
+
+class LabelMatcher(object):
+    '''
+    EventMatcher for tracker outputs given as the labels of their
+    detections: an output is paired with the object its detection is
+    labelled with, UNMATCHED outputs are false positives and IGNORED ones
+    are dropped. Pairings carry across frames until reset() so SWITCH
+    events are raised as by EventMatcher.
+    '''
+
+    def __init__(self, evaluator):
+        self.gt_index = evaluator.gt_index
+        self.reset()
+
+    def reset(self):
+        self.m = {}  # Object id -> last paired hypothesis id
+        self.events = MotEvents()
+
+    def update(self, frame_id, trk_gt_ids, trk_ids):
+        _, gt_ids = self.gt_index.frame(frame_id)
+        matched = set()
+        for o, h in zip(trk_gt_ids, trk_ids):
+            if o == IGNORED:
+                continue
+            if o == UNMATCHED:
+                self.events.append(frame_id, 'FP', np.nan, h)
+                continue
+            is_switch = o in self.m and self.m[o] != h
+            self.events.append(frame_id, 'SWITCH' if is_switch else 'MATCH', o, h)
+            self.m[o] = h
+            matched.add(o)
+
+        for o in gt_ids:
+            if o not in matched:
+                self.events.append(frame_id, 'MISS', o, np.nan)
+
+        return self.events
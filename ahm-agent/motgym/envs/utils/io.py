@@ -2,6 +2,8 @@ import os
 from typing import Dict
 import numpy as np
 
+from .gt_index import GroundTruthIndex
+
 
 def write_results(filename, results_dict: Dict, data_type: str):
     if not filename:
@@ -58,6 +60,11 @@ labels={'ped', ...			% 1
 
 
 def read_mot_results(filename, is_gt, is_ignore):
+    # Ground truth is served from the cached columnar index
+    if is_gt or is_ignore:
+        gt_index = GroundTruthIndex.load(filename)
+        return gt_index.to_frame_dict(ignore=is_ignore)
+
     valid_labels = {1}
     ignore_labels = {2, 7, 8, 12}
     results_dict = dict()
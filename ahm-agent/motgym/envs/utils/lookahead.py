@@ -0,0 +1,27 @@
+class SharedLookahead(object):
+    '''
+    Look-ahead rollout of a parallel env, simulated once and shared by the
+    tracks of a frame. The tracker takes no gallery actions in look-ahead
+    frames, so the tracks acted on since the rollout (changed) can only
+    differ from it through their rows of the embedding cost in the first
+    association of each future frame. The rollout is reusable while all of
+    those associations (tracker.association_log) give the same matches with
+    the changed galleries: the tracker would then produce the same results,
+    hence the same events. Otherwise the env simulates it again.
+    '''
+
+    def __init__(self, frame_id, eval_frame_id, events, records, embedding_distance):
+        self.frame_id = frame_id
+        self.eval_frame_id = eval_frame_id
+        self.events = events
+        self.records = records
+        self.embedding_distance = embedding_distance
+        self.changed = set()  # Tracks whose gallery changed since simulated
+
+    def reusable(self, frame_id, eval_frame_id):
+        if frame_id != self.frame_id or eval_frame_id != self.eval_frame_id:
+            return False
+        if not self.changed:
+            return True
+        # In frame order, later records only hold if the earlier ones do
+        return all(r.unchanged(self.changed, self.embedding_distance) for r in self.records)
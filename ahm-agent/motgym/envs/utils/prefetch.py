@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class SequencePrefetcher(object):
+    '''
+    Loads a sequence in a background thread while the current episode runs.
+    load_fn(seq) must not modify the env, it returns the loaded state which
+    the env swaps in on its next reset. Loading is mostly file IO and numpy
+    so it overlaps with the tracker running in the env thread.
+    '''
+
+    def __init__(self, load_fn):
+        self.load_fn = load_fn
+        self.seq = None
+        self._thread = None
+        self._result = None
+
+    def request(self, seq):
+        self.seq = seq
+        self._result = None
+        self._thread = threading.Thread(target=self._load, args=(seq,), daemon=True)
+        self._thread.start()
+
+    def _load(self, seq):
+        start = time.perf_counter()
+        try:
+            data, error = self.load_fn(seq), None
+        except Exception as e:  # Re-raised in the env thread by take()
+            data, error = None, e
+        self._result = (data, error, time.perf_counter() - start)
+
+    def take(self):
+        '''
+        (seq, data, stats) of the requested sequence, waiting for it if still
+        loading. stats has prefetch_hit (loaded before it was needed), the
+        load_time of the background load and the wait_time of the env.
+        '''
+        hit = not self._thread.is_alive()
+        start = time.perf_counter()
+        self._thread.join()
+        wait_time = time.perf_counter() - start
+        data, error, load_time = self._result
+        self._thread, self._result = None, None
+        if error is not None:
+            raise error
+        stats = {"prefetch_hit": hit, "load_time": load_time, "wait_time": wait_time}
+        return self.seq, data, stats
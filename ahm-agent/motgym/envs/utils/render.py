@@ -0,0 +1,105 @@
+import queue
+import threading
+
+import cv2
+
+
+class FrameDecoder(object):
+    '''
+    Decoded frames of a sequence (paths of an ImageList). The last frame
+    read is kept, so the tracks of one frame are rendered from a single
+    decode, and the next frame is decoded in a background thread while the
+    env steps (cv2 releases the GIL while decoding).
+    '''
+
+    def __init__(self, images):
+        self.images = images
+        self.idx = None
+        self.img = None
+        self._next = None  # (idx, thread, result) of the prefetched frame
+
+    def _decode(self, idx, result):
+        result.append(cv2.imread(self.images[idx]))
+
+    def _prefetch(self, idx):
+        self._next = None
+        if idx >= len(self.images):
+            return
+        result = []
+        thread = threading.Thread(target=self._decode, args=(idx, result), daemon=True)
+        thread.start()
+        self._next = (idx, thread, result)
+
+    def read(self, idx):
+        '''Copy of frame idx (BGR) for the caller to draw on'''
+        if idx != self.idx:
+            if self._next is not None and self._next[0] == idx:
+                _, thread, result = self._next
+                thread.join()
+                img = result[0]
+            else:
+                img = cv2.imread(self.images[idx])
+            if img is None:
+                raise IOError(f'Unable to read frame {self.images[idx]}')
+            self.idx, self.img = idx, img
+            self._prefetch(idx + 1)
+        return self.img.copy()
+
+
+class VideoRecorder(object):
+    '''
+    Writes rendered frames to an mp4 with cv2.VideoWriter in a background
+    thread. At most max_queued frames wait for the encoder, write() blocks
+    when it falls behind. Frames are resized to the size of the first one.
+    Encoder errors are raised by the next write() or by close().
+    '''
+
+    def __init__(self, filename, fps, max_queued=64):
+        self.filename = filename
+        self.fps = fps
+        self.frames = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = threading.Thread(target=self._encode, daemon=True)
+        self._thread.start()
+
+    def _open(self, shape):
+        height, width = shape[:2]
+        writer = cv2.VideoWriter(
+            self.filename, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (width, height))
+        if not writer.isOpened():
+            raise IOError(f'Unable to open video writer for {self.filename}')
+        return writer, (width, height)
+
+    def _encode(self):
+        writer, size = None, None
+        while True:
+            img = self._queue.get()
+            if img is None:
+                break
+            if self.error is not None:
+                continue  # Drain so write() never blocks on a failed encoder
+            try:
+                if writer is None:
+                    writer, size = self._open(img.shape)
+                if (img.shape[1], img.shape[0]) != size:
+                    img = cv2.resize(img, size)
+                writer.write(img)
+                self.frames += 1
+            except Exception as e:
+                self.error = e
+        if writer is not None:
+            writer.release()
+
+    def write(self, img):
+        '''Queue a BGR frame, the recorder owns it from here'''
+        if self.error is not None:
+            raise self.error
+        self._queue.put(img)
+
+    def close(self):
+        '''Encode the queued frames and finish the file'''
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,82 @@
+'''
+Node-local sequence caches shared by all env instances of all RLlib
+workers on a node. Caches are .npy files memory-mapped read-only, so the
+page cache holds a single copy per node however many workers attach. The
+first worker to miss a cache builds it under an exclusive file lock while
+the others wait on the lock and then map the result. Files are written
+with a rename, processes that mapped an older version keep it.
+'''
+import os
+import os.path as osp
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # No flock, every process builds the caches it misses
+    fcntl = None
+
+
+@contextmanager
+def build_lock(lock_file):
+    '''Hold an exclusive lock on lock_file, a no-op if it can't be created'''
+    try:
+        f = open(lock_file, 'a') if fcntl is not None else None
+    except OSError:
+        f = None
+    if f is None:
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def save_npy(filename, array):
+    tmp_file = f'{filename}.{os.getpid()}.tmp.npy'
+    np.save(tmp_file, array)
+    os.replace(tmp_file, filename)
+
+
+def load_npy(filename):
+    return np.load(filename, mmap_mode='r')
+
+
+class ImageList(object):
+    '''
+    Sorted image paths of a sequence, from a memory-mapped array of file
+    names cached as img1.npy next to the img1 directory. Indexed like the
+    list of paths it replaces.
+    '''
+
+    def __init__(self, img1_path):
+        self.img1_path = img1_path
+        cache_file = f'{img1_path}.npy'
+        self.names = self._load(cache_file)
+        if self.names is None:
+            with build_lock(f'{img1_path}.lock'):
+                self.names = self._load(cache_file)  # Built while waiting
+                if self.names is None:
+                    names = np.array(sorted(os.listdir(img1_path)), dtype=bytes)
+                    try:
+                        save_npy(cache_file, names)
+                        self.names = load_npy(cache_file)
+                    except OSError:
+                        print(f'Unable to cache image list to {cache_file}')
+                        self.names = names
+
+    def _load(self, cache_file):
+        if osp.isfile(cache_file) and \
+                osp.getmtime(cache_file) >= osp.getmtime(self.img1_path):
+            return load_npy(cache_file)
+        return None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, idx):
+        return osp.join(self.img1_path, self.names[idx].decode())
@@ -0,0 +1,108 @@
+import hashlib
+import io
+import os
+import os.path as osp
+import pickle
+import sys
+from functools import lru_cache
+
+from .det_store import OFFSETS_FILE
+from .gt_labels import GT_IDS_FILE
+
+
+@lru_cache(maxsize=None)
+def _module_hash(name):
+    '''Hash of the source of a loaded module, '' if it has none (extensions)'''
+    path = getattr(sys.modules.get(name), '__file__', None)
+    if not path or not path.endswith('.py'):
+        return ''
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return ''
+
+
+def source_hashes(classes):
+    '''{module: source hash} of the modules defining classes and their bases'''
+    modules = {base.__module__ for cls in classes for base in cls.__mro__}
+    return {name: _module_hash(name) for name in sorted(modules)}
+
+
+class _ClassRecorder(pickle.Pickler):
+    '''Pickler recording the class of every object it pickles'''
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.classes = set()
+
+    def persistent_id(self, obj):
+        self.classes.add(type(obj))
+        return None  # Pickled as usual
+
+
+class WarmStartCache(object):
+    '''
+    On-disk cache of the state a sequential env reaches at the end of its
+    reset warm-up, i.e. the tracker run from a target's first frame until
+    the target is matched (its entry frame). The warm-up takes no gallery
+    actions so the state only depends on the sequence and the target, one
+    pickle per target is written to <seq detections>/warm_start/ on the
+    first reset and restored by later ones.
+
+    Entries are ignored if written by a different tracker config, older
+    than the detections or their ground truth labels (gt_ids.npy), or if the source of a module defining a class of
+    the pickled objects (tracks, galleries, Kalman bank, ...) or of the
+    given classes (the env, whose code runs the warm-up) changed since. Each file
+    holds a header (config and module source hashes) read before the
+    pickled state.
+    '''
+
+    def __init__(self, seq_dir, config, classes=()):
+        self.cache_dir = osp.join(seq_dir, 'warm_start')
+        self.config = config
+        self.classes = set(classes)
+        self.source_mtime = max(
+            (osp.getmtime(osp.join(seq_dir, f)) for f in (OFFSETS_FILE, 'dets.npz', GT_IDS_FILE)
+             if osp.isfile(osp.join(seq_dir, f))), default=0.)
+
+    def _path(self, target_tid):
+        return osp.join(self.cache_dir, f'{target_tid}.pkl')
+
+    def load(self, target_tid):
+        '''Cached warm-up state of a target or None'''
+        path = self._path(target_tid)
+        if not osp.isfile(path) or osp.getmtime(path) < self.source_mtime:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                header = pickle.load(f)
+                if not isinstance(header, dict) or header.get('config') != self.config:
+                    return None
+                sources = header.get('sources', {})
+                if sources != {name: _module_hash(name) for name in sources} or \
+                        not set(source_hashes(self.classes)).issubset(sources):
+                    return None
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    def save(self, target_tid, **state):
+        # Write then rename so concurrent workers never read a partial file
+        path = self._path(target_tid)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        body = io.BytesIO()
+        pickler = _ClassRecorder(body)
+        pickler.dump(state)
+        header = {
+            'config': self.config,
+            'sources': source_hashes(pickler.classes | self.classes),
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(body.getbuffer())
+            os.replace(tmp_path, path)
+        except OSError:
+            print(f'Unable to cache warm start state to {path}')
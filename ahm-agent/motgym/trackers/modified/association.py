@@ -0,0 +1,39 @@
+import numpy as np
+
+from tracker import matching
+
+from .kalman_bank import fuse_motion
+
+
+class AssociationRecord(object):
+    '''
+    First (embedding) association of a training tracker update, logged
+    while tracker.association_log is a list: the track pool and detections,
+    their embedding and gating costs and the resulting matches. Lets a
+    rollout be checked against tracks whose galleries changed after it was
+    simulated without running the tracker again (see SharedLookahead).
+    '''
+    __slots__ = ('tracks', 'detections', 'embedding', 'gating', 'thresh', 'matches')
+
+    def __init__(self, tracks, detections, embedding, gating, thresh):
+        self.tracks = tracks
+        self.detections = detections
+        self.embedding = embedding.copy()  # fuse_motion writes in place
+        self.gating = gating
+        self.thresh = thresh
+        self.matches = None
+
+    def unchanged(self, changed, embedding_distance):
+        '''
+        True if the association gives the same matches with the current
+        features of the changed tracks, only their cost rows are recomputed
+        '''
+        rows = [i for i, track in enumerate(self.tracks) if track in changed]
+        if not rows or self.embedding.size == 0:
+            return True
+        dists = self.embedding.copy()
+        dists[rows] = embedding_distance([self.tracks[i] for i in rows], self.detections)
+        dists = fuse_motion(None, dists, self.tracks, self.detections,
+                            gating_distance=self.gating)
+        matches, _, _ = matching.linear_assignment(dists, thresh=self.thresh)
+        return np.array_equal(matches, self.matches)
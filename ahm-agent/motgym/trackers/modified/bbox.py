@@ -0,0 +1,31 @@
+import numpy as np
+
+
+def bbox_ious(atlbrs, btlbrs):
+    '''
+    Vectorised cython_bbox.bbox_overlaps (used by matching.iou_distance in
+    FairMOT and JDE), including its +1 pixel box size convention
+    :param atlbrs: (N, 4) array of tlbr boxes
+    :param btlbrs: (K, 4) array of tlbr boxes
+    :return: (N, K) array of IoUs
+    '''
+    a = np.asarray(atlbrs, dtype=float)[:, None, :4]
+    b = np.asarray(btlbrs, dtype=float)[None, :, :4]
+    iw = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]) + 1
+    ih = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]) + 1
+    inter = np.where((iw > 0) & (ih > 0), iw * ih, 0.)
+    a_area = (a[..., 2] - a[..., 0] + 1) * (a[..., 3] - a[..., 1] + 1)
+    b_area = (b[..., 2] - b[..., 0] + 1) * (b[..., 3] - b[..., 1] + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(inter > 0, inter / (a_area + b_area - inter), 0.)
+
+
+def get_min_iou_scores(dets):
+    # Calculate maximum overlap of each detection with neighbouring detections
+    # Lower score means more overlap, min iou score = worst overlap
+    n_dets = len(dets)
+    if n_dets < 2:
+        return [1.] * n_dets
+    ious = bbox_ious(dets, dets)
+    np.fill_diagonal(ious, 0.)  # Ignore overlap of a detection with itself
+    return list(1. - ious.max(axis=1))
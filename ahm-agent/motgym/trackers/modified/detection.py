@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class Detection(object):
+    '''
+    Detection of the current frame, holding views of one row of the frame's
+    detection arrays. Matching, Kalman correction and observations only read
+    tlwh/tlbr, curr_feat, score and min_iou_score, a full track object is
+    only created (see AgentSTrack) for the detections that start a new track.
+    index is the row of the detection in the frame, matched tracks record it
+    (AgentSTrack.det_index) so envs can look up detection labels.
+    '''
+    __slots__ = ('_tlwh', 'score', 'curr_feat', 'min_iou_score', 'index')
+
+    def __init__(self, tlwh, score, curr_feat, min_iou_score, index=-1):
+        self._tlwh = tlwh
+        self.score = score
+        self.curr_feat = curr_feat
+        self.min_iou_score = min_iou_score
+        self.index = index
+
+    @property
+    def tlwh(self):
+        return self._tlwh.copy()
+
+    @property
+    def tlbr(self):
+        ret = self._tlwh.copy()
+        ret[2:] += ret[:2]
+        return ret
+
+    def to_xyah(self):
+        ret = self._tlwh.copy()
+        ret[:2] += ret[2:] / 2
+        ret[2] /= ret[3]
+        return ret
+
+    def __repr__(self):
+        return 'Det_({:.2f})'.format(float(self.score))
+
+
+def frame_detections(tlbrs, scores, feats, min_iou_scores):
+    '''
+    Detection per row of the (N, 4) tlbrs, (N,) scores and (N, d) feats of a
+    frame, boxes are converted to tlwh for the whole frame at once
+    '''
+    # Converted in the input dtype then widened, as AgentSTrack does per box
+    tlwhs = np.array(tlbrs)
+    tlwhs[:, 2:] -= tlwhs[:, :2]
+    tlwhs = tlwhs.astype(float)
+    return [Detection(tlwh, score, feat, min_iou_score, index)
+            for index, (tlwh, score, feat, min_iou_score)
+            in enumerate(zip(tlwhs, scores, feats, min_iou_scores))]
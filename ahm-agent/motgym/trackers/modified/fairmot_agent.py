@@ -3,9 +3,9 @@ import random
 import numpy as np
 import torch
 import torch.nn.functional as F
-from ray.rllib.agents import dqn, impala, ppo
 
 from .fairmot_train import *
+from .policy import PolicyMLP
 from models import *
 from models.decode import mot_decode
 from models.model import create_model, load_model
@@ -20,14 +20,26 @@ class RandomAgent:
     def compute_single_action(obs):
         return random.randint(0, 1)
 
+    @staticmethod
+    def compute_actions(observations):
+        return {k: random.randint(0, 1) for k in observations}
+
 
 class GreedyAgent:
     @staticmethod
     def compute_single_action(obs):
         return 1
 
+    @staticmethod
+    def compute_actions(observations):
+        return {k: 1 for k in observations}
+
 
 class AgentJDETracker(TrainAgentJDETracker):
+    # One batched compute_actions call for all tracks updated in a frame
+    # instead of compute_single_action per track, see observe_tracks
+    batch_actions = True
+
     def __init__(self, opt, frame_rate=30, lookup_gallery=0, agent_path=None):
         self.opt = opt
         if opt.gpus[0] >= 0:
@@ -52,12 +64,13 @@ class AgentJDETracker(TrainAgentJDETracker):
         self.mean = np.array(opt.mean, dtype=np.float32).reshape(1, 1, 3)
         self.std = np.array(opt.std, dtype=np.float32).reshape(1, 1, 3)
 
-        self.kalman_filter = KalmanFilter()
+        self.kalman_filter = KalmanBank(KalmanFilter())
         self.lookup_gallery = lookup_gallery
 
         self.agent = self.build_agent(agent_path)
-        BaseTrack._count = 0  # THIS IS A HACK, CAN WE EXPORT PYTORCH WEIGHTS
-        # AND USE INDEPENDENTLY OF RESETTING ENV AND CAUSING COUNT TO GO UP?
+        # Restoring an RLlib trainer resets an env, which advances the track
+        # count. Exported policies (.npz, see PolicyMLP) do not need this
+        BaseTrack._count = 0
 
     def build_agent(self, agent_path):
         if not agent_path:
@@ -66,7 +79,12 @@ class AgentJDETracker(TrainAgentJDETracker):
             return GreedyAgent()
         elif agent_path == 'random':
             return RandomAgent()
-        elif 'dqn' in agent_path:
+        elif agent_path.endswith('.npz'):
+            # Policy exported with tools/export_policy.py, no Ray needed
+            return PolicyMLP.load(agent_path)
+
+        from ray.rllib.agents import dqn, impala, ppo
+        if 'dqn' in agent_path:
             config = dqn.DEFAULT_CONFIG.copy()
             config["framework"] = "torch"
             trainer = dqn.DQNTrainer(
@@ -110,13 +128,8 @@ class AgentJDETracker(TrainAgentJDETracker):
                 results[j] = results[j][keep_inds]
         return results
 
-    def update(self, im_blob, img0):
-        self.frame_id += 1
-        activated_starcks = []
-        refind_stracks = []
-        lost_stracks = []
-        removed_stracks = []
-
+    def detect(self, im_blob, img0):
+        '''(N, 5) tlbr + score of the detections above conf_thres, (N, d) embeddings'''
         width = img0.shape[1]
         height = img0.shape[0]
         inp_height = im_blob.shape[2]
@@ -146,8 +159,18 @@ class AgentJDETracker(TrainAgentJDETracker):
         dets = self.merge_outputs([dets])[1]
 
         remain_inds = dets[:, 4] > self.opt.conf_thres
-        dets = dets[remain_inds]
-        id_feature = id_feature[remain_inds]
+        return dets[remain_inds], id_feature[remain_inds]
+
+    def update(self, im_blob, img0):
+        self.frame_id += 1
+        activated_starcks = []
+        refind_stracks = []
+        lost_stracks = []
+        removed_stracks = []
+        observed = []  # (track, detection) pairs to generate observations for
+        kalman_updates = []  # Matched pairs, Kalman corrected in one batch
+
+        dets, id_feature = self.detect(im_blob, img0)
 
         # Calculate maximum overlap of each detection with neighbouring detections
         # Lower score means more overlap, min iou score = worst overlap
@@ -155,8 +178,8 @@ class AgentJDETracker(TrainAgentJDETracker):
 
         if len(dets) > 0:
             '''Detections'''
-            detections = [AgentSTrack(AgentSTrack.tlbr_to_tlwh(tlbrs[:4]), tlbrs[4], f, min_iou_score, agent=self.agent)
-                          for (tlbrs, f, min_iou_score) in zip(dets[:, :5], id_feature, min_iou_scores)]
+            detections = frame_detections(
+                dets[:, :4], dets[:, 4], id_feature, min_iou_scores)
         else:
             detections = []
 
@@ -181,7 +204,7 @@ class AgentJDETracker(TrainAgentJDETracker):
         else:
             dists = matching.embedding_distance(strack_pool, detections)
         # dists = matching.iou_distance(strack_pool, detections)
-        dists = matching.fuse_motion(
+        dists = fuse_motion(
             self.kalman_filter, dists, strack_pool, detections)
         matches, u_track, u_detection = matching.linear_assignment(
             dists, thresh=0.4)
@@ -190,11 +213,14 @@ class AgentJDETracker(TrainAgentJDETracker):
             track = strack_pool[itracked]
             det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(detections[idet], self.frame_id)
+                track.update(det, self.frame_id, update_kalman=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_id, new_id=False)
+                track.re_activate(
+                    det, self.frame_id, new_id=False, update_kalman=False)
                 refind_stracks.append(track)
+            observed.append((track, det))
+            kalman_updates.append((track, det))
 
         ''' Step 3: Second association, with IOU'''
         detections = [detections[i] for i in u_detection]
@@ -208,11 +234,14 @@ class AgentJDETracker(TrainAgentJDETracker):
             track = r_tracked_stracks[itracked]
             det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(det, self.frame_id)
+                track.update(det, self.frame_id, update_kalman=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_id, new_id=False)
+                track.re_activate(
+                    det, self.frame_id, new_id=False, update_kalman=False)
                 refind_stracks.append(track)
+            observed.append((track, det))
+            kalman_updates.append((track, det))
 
         for it in u_track:
             track = r_tracked_stracks[it]
@@ -226,20 +255,30 @@ class AgentJDETracker(TrainAgentJDETracker):
         matches, u_unconfirmed, u_detection = matching.linear_assignment(
             dists, thresh=0.7)
         for itracked, idet in matches:
-            unconfirmed[itracked].update(detections[idet], self.frame_id)
+            unconfirmed[itracked].update(
+                detections[idet], self.frame_id, update_kalman=False)
             activated_starcks.append(unconfirmed[itracked])
+            observed.append((unconfirmed[itracked], detections[idet]))
+            kalman_updates.append((unconfirmed[itracked], detections[idet]))
         for it in u_unconfirmed:
             track = unconfirmed[it]
             track.mark_removed()
             removed_stracks.append(track)
 
+        batch_kalman_update(kalman_updates)
+
         """ Step 4: Init new stracks"""
         for inew in u_detection:
-            track = detections[inew]
-            if track.score < self.det_thresh:
+            det = detections[inew]
+            if det.score < self.det_thresh:
                 continue
+            track = AgentSTrack(det.tlwh, det.score, det.curr_feat, det.min_iou_score,
+                                agent=self.agent)
+            track.det_index = det.index
             track.activate(self.kalman_filter, self.frame_id)
             activated_starcks.append(track)
+            observed.append((track, det))
+        observe_tracks(observed, self.batch_actions)
         """ Step 5: Update state"""
         for track in self.lost_stracks:
             if self.frame_id - track.end_frame > self.max_time_lost:
@@ -262,6 +301,8 @@ class AgentJDETracker(TrainAgentJDETracker):
         self.removed_stracks.extend(removed_stracks)
         self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(
             self.tracked_stracks, self.lost_stracks)
+        # Kalman bank slots of the tracks dropped from both are reused
+        self.kalman_filter.release_unused(self.tracked_stracks + self.lost_stracks)
         output_stracks = [
             track for track in self.tracked_stracks if track.is_activated]
 
@@ -1,20 +1,37 @@
-from collections import deque
-
 import numpy as np
-from scipy.spatial.distance import cdist
 
 import FairMOT.src._init_paths
 from tracker import matching
 from tracker.basetrack import BaseTrack, TrackState
 from tracking_utils.kalman_filter import KalmanFilter
 
+from .association import AssociationRecord
+from .bbox import get_min_iou_scores
+from .detection import frame_detections
+from .gallery import FeatureGallery
+from .kalman_bank import KalmanBank, KalmanSlot, batch_kalman_update, fuse_motion, motion_gating
+from .observation import observe_tracks
+from .phase_timer import PhaseTimer
+from .snapshot import TrackerSnapshot
+
 
-class AgentSTrack(BaseTrack):
+class AgentSTrack(KalmanSlot, BaseTrack):
     shared_kalman = KalmanFilter()
+    # Instance attributes in slots, the per-track __dict__ inherited from
+    # BaseTrack stays empty. Slots shadow the BaseTrack/KalmanSlot class
+    # defaults, so __init__ sets all of them
+    __slots__ = ('_tlwh', 'kalman_filter', 'slot', '_mean', '_covariance',
+                 'is_activated', 'tracklet_len', 'agent', 'score', 'min_iou_score',
+                 'curr_feat', 'smooth_feat', 'features', 'alpha', '_gallery_shared',
+                 'obs', 'det_index', 'track_id', 'state', 'frame_id', 'start_frame')
+    # Update smooth_feat in O(d) on append instead of recomputing it over
+    # the whole gallery, it is still recomputed when the gallery is pruned
+    incremental_smooth = True
 
     def __init__(self, tlwh, score, temp_feat, min_iou_score, agent=None):
         self._tlwh = np.asarray(tlwh, dtype=np.float)
         self.kalman_filter = None
+        self.slot = None
         self.mean, self.covariance = None, None
         self.is_activated = False
         self.tracklet_len = 0
@@ -26,122 +43,128 @@ class AgentSTrack(BaseTrack):
         self.curr_feat = temp_feat
 
         self.smooth_feat = temp_feat
-        self.features = deque([])
+        self.features = FeatureGallery()
         self.alpha = 0.9
+        self._gallery_shared = False
+        self.obs = None
+        # Row of the detection matched at frame_id in that frame's detections
+        self.det_index = -1
+
+        self.track_id = 0
+        self.state = TrackState.New
+        self.frame_id = 0
+        self.start_frame = 0
 
     def gallery_similarity(self, feat):
         max_cosine_simlarity = 0.
         if self.features:
-            dists = cdist(np.array([feat]), np.asarray(
-                self.features), 'cosine')
-            max_cosine_simlarity = np.max(np.ones(dists.shape) - dists)
+            max_cosine_simlarity = float(np.max(self.features.similarities(feat)))
         return max_cosine_simlarity
 
     def average_gallery_distance(self):
-        average_dist = 0.
-        n = len(self.features)
-        if n > 2:
-            feats = np.asarray(self.features)
-            cost_matrix = cdist(feats, feats, 'cosine')
-            pairwise_dists = np.tril(cost_matrix, -1)
-            num_pairs = (n-1)*(n)/2
-            average_dist = np.sum(pairwise_dists) / num_pairs
-        return average_dist
+        # Running pairwise similarity total, see FeatureGallery
+        return self.features.average_pairwise_distance()
 
     def get_observation(self, feat, score, min_iou_score):
-        similarity = self.gallery_similarity(feat)
-        average = 0.
-        if self.features:
-            gallery_avg = np.average(self.features, axis=0)
-            average = cdist([gallery_avg], [feat], 'cosine').item()
-        average_dist = self.average_gallery_distance()
         return np.array([
             score,
-            similarity,
+            self.gallery_similarity(feat),
             len(self.features),
             min_iou_score,
-            average,
-            average_dist
+            self.features.mean_distance(feat),
+            self.average_gallery_distance()
         ], dtype=float)
 
+    def share_gallery(self):
+        '''Hand gallery to a tracker snapshot, it is copied on next write'''
+        self._gallery_shared = True
+        return self.features, self.smooth_feat
+
+    def restore_gallery(self, gallery):
+        self.features, self.smooth_feat = gallery
+        self._gallery_shared = True
+
     def update_gallery(self, action, feat):
         '''Translate action to change in gallery'''
         if action == 0:
             return
-        elif action == 1:
+        if self._gallery_shared:
+            self.features = self.features.copy()
+            self._gallery_shared = False
+        if action == 1:
+            feat /= np.linalg.norm(feat)
             self.features.append(feat)
+            if self.incremental_smooth and len(self.features) > 1:
+                # Next step of the moving average over the gallery, O(d)
+                self.smooth_feat = self.alpha * \
+                    self.smooth_feat + (1 - self.alpha) * self.features[-1]
+                self.smooth_feat /= np.linalg.norm(self.smooth_feat)
+                return
         elif action == -1:
             self.prune_similar()
+        self.recompute_smooth_feat()
 
-        # Recalculate gallery each update same as baseline FairMOT
+    def recompute_smooth_feat(self):
+        # Recalculate gallery same as baseline FairMOT,
+        # gallery features are normalised when appended
         self.smooth_feat = None  # Reset smooth_feature
-        for i, feat in enumerate(self.features):
+        for feat in self.features:
             if self.smooth_feat is None:
-                self.smooth_feat = feat
+                self.smooth_feat = feat.copy()
             else:
-                feat /= np.linalg.norm(feat)
                 self.smooth_feat = self.alpha * \
                     self.smooth_feat + (1 - self.alpha) * feat
             self.smooth_feat /= np.linalg.norm(self.smooth_feat)
 
     def prune_similar(self):
-        # Remove most similar feature from gallery
-        gallery = np.asarray(self.features)
-        n, _ = gallery.shape
-        cost_matrix = np.eye(n) + cdist(gallery, gallery, 'cosine')
-        flatten_idx = np.argmin(cost_matrix)
-        track1_idx, track2_idx = np.unravel_index(flatten_idx, (n, n))
-        self.features.pop(track1_idx)
-
-    def agent_update_features(self, feat, obs):
-        '''New method added for RL agent to manage gallery'''
+        # Remove the older feature of the most similar pair from gallery
+        self.features.pop(self.features.most_similar())
+
+    def agent_update_features(self, feat, obs, action=None):
+        '''
+        New method added for RL agent to manage gallery, action is computed
+        here unless given (already computed in a batch, see observe_tracks)
+        '''
         self.curr_feat = feat
         if self.agent:
-            action = self.agent.compute_single_action(obs)
+            if action is None:
+                action = self.agent.compute_single_action(obs)
             self.update_gallery(action, feat)
 
-    def re_activate(self, new_track, frame_id, new_id=False):
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_track.tlwh)
-        )
-
-        self.obs = self.get_observation(
-            new_track.curr_feat,
-            new_track.score,
-            new_track.min_iou_score
-        )
-        self.agent_update_features(new_track.curr_feat, self.obs)
+    def re_activate(self, new_track, frame_id, new_id=False, update_kalman=True):
+        if update_kalman:
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, self.tlwh_to_xyah(new_track.tlwh)
+            )
+
         self.tracklet_len = 0
         self.state = TrackState.Tracked
         self.is_activated = True
         self.frame_id = frame_id
+        self.det_index = new_track.index
         if new_id:
             self.track_id = self.next_id()
 
-    def update(self, new_track, frame_id):
+    def update(self, new_track, frame_id, update_kalman=True):
         """
         Update a matched track
         :type new_track: STrack
         :type frame_id: int
-        :type update_feature: bool
+        :type update_kalman: bool, False if the caller corrects the Kalman
+            state of all matched tracks at once (batch_kalman_update)
         :return:
         """
         self.frame_id = frame_id
+        self.det_index = new_track.index
         self.tracklet_len += 1
 
-        new_tlwh = new_track.tlwh
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_tlwh))
+        if update_kalman:
+            new_tlwh = new_track.tlwh
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, self.tlwh_to_xyah(new_tlwh))
         self.state = TrackState.Tracked
         self.is_activated = True
 
-        self.obs = self.get_observation(
-            new_track.curr_feat,
-            new_track.score,
-            new_track.min_iou_score
-        )
-        self.agent_update_features(new_track.curr_feat, self.obs)
-
     def predict(self):
         mean_state = self.mean.copy()
         if self.state != TrackState.Tracked:
@@ -152,6 +175,11 @@ class AgentSTrack(BaseTrack):
     @staticmethod
     def multi_predict(stracks):
         if len(stracks) > 0:
+            bank, slots = KalmanSlot.bank_slots(stracks)
+            if bank is not None:
+                stopped = np.array([st.state != TrackState.Tracked for st in stracks])
+                bank.predict_slots(slots, stopped)
+                return
             multi_mean = np.asarray([st.mean.copy() for st in stracks])
             multi_covariance = np.asarray([st.covariance for st in stracks])
             for i, st in enumerate(stracks):
@@ -165,10 +193,8 @@ class AgentSTrack(BaseTrack):
 
     def activate(self, kalman_filter, frame_id):
         """Start a new tracklet"""
-        self.kalman_filter = kalman_filter
         self.track_id = self.next_id()
-        self.mean, self.covariance = self.kalman_filter.initiate(
-            self.tlwh_to_xyah(self._tlwh))
+        self.initiate_kalman(kalman_filter, self.tlwh_to_xyah(self._tlwh))
 
         self.tracklet_len = 0
         self.state = TrackState.Tracked
@@ -178,13 +204,6 @@ class AgentSTrack(BaseTrack):
         self.frame_id = frame_id
         self.start_frame = frame_id
 
-        self.obs = self.get_observation(
-            self.curr_feat,
-            self.score,
-            self.min_iou_score
-        )
-        self.agent_update_features(self.curr_feat, self.obs)
-
     @property
     def tlwh(self):
         """Get current position in bounding box format `(top left x, top left y,
@@ -249,24 +268,49 @@ class TrainAgentJDETracker():
         self.mean = np.array(opt.mean, dtype=np.float32).reshape(1, 1, 3)
         self.std = np.array(opt.std, dtype=np.float32).reshape(1, 1, 3)
 
-        self.kalman_filter = KalmanFilter()
+        self.kalman_filter = KalmanBank(KalmanFilter())
         self.lookup_gallery = lookup_gallery
+        # List to log the first association of each update to (look-ahead)
+        self.association_log = None
+        # Disabled unless an env shares its timer (time_phases)
+        self.phase_timer = PhaseTimer()
 
     def reset(self):
         BaseTrack._count = 0
         self.tracked_stracks = []  # type: list[STrack]
         self.lost_stracks = []  # type: list[STrack]
         self.removed_stracks = []  # type: list[STrack]
-        self.kalman_filter = KalmanFilter()
+        self.kalman_filter = KalmanBank(KalmanFilter())
+
+    def embedding_distance(self, tracks, detections):
+        '''Appearance cost of the first association'''
+        if self.lookup_gallery:
+            return custom_embedding_distance(self.lookup_gallery, tracks, detections)
+        return matching.embedding_distance(tracks, detections)
+
+    def snapshot(self):
+        '''Capture tracker state, cheaper alternative to deepcopying tracks'''
+        return TrackerSnapshot(self, BaseTrack._count)
+
+    def restore(self, snapshot):
+        '''Roll tracker back to a state captured with snapshot()'''
+        snapshot.restore(self)
+        BaseTrack._count = snapshot.track_count
 
     def update(self, dets, id_feature, frame_id):
         activated_starcks = []
         refind_stracks = []
         lost_stracks = []
         removed_stracks = []
+        observed = []  # (track, detection) pairs to generate observations for
+        # Matched (track, detection) pairs, Kalman corrected in one batch
+        kalman_updates = []
+        timer = self.phase_timer
+        timer.start('tracker.update')
 
         ### Detections and features are pre-generated using gen_fairmot_jde.py ###
 
+        timer.start('detections')
         if len(dets) > 0:
             # Calculate maximum overlap of each detection with neighbouring detections
             # Lower score means more overlap, min iou score = worst overlap
@@ -276,10 +320,11 @@ class TrainAgentJDETracker():
                 min_iou_scores = [1.]
 
             '''Detections'''
-            detections = [AgentSTrack(AgentSTrack.tlbr_to_tlwh(tlbrs[:4]), tlbrs[4], f, min_iou_score, agent=None)
-                          for (tlbrs, f, min_iou_score) in zip(dets[:, :5], id_feature, min_iou_scores)]
+            detections = frame_detections(
+                dets[:, :4], dets[:, 4], id_feature, min_iou_scores)
         else:
             detections = []
+        timer.stop()
 
         ''' Add newly detected tracklets to tracked_stracks'''
         unconfirmed = []
@@ -291,33 +336,42 @@ class TrainAgentJDETracker():
                 tracked_stracks.append(track)
 
         ''' Step 2: First association, with embedding'''
+        timer.start('association')
         strack_pool = joint_stracks(tracked_stracks, self.lost_stracks)
         # Predict the current location with KF
         # for strack in strack_pool:
         # strack.predict()
         AgentSTrack.multi_predict(strack_pool)
-        if self.lookup_gallery:
-            dists = custom_embedding_distance(
-                self.lookup_gallery, strack_pool, detections)
-        else:
-            dists = matching.embedding_distance(strack_pool, detections)
+        dists = self.embedding_distance(strack_pool, detections)
         #dists = matching.iou_distance(strack_pool, detections)
-        dists = matching.fuse_motion(
-            self.kalman_filter, dists, strack_pool, detections)
+        gating = motion_gating(self.kalman_filter, strack_pool, detections)
+        if self.association_log is not None:
+            self.association_log.append(
+                AssociationRecord(strack_pool, detections, dists, gating, thresh=0.4))
+        dists = fuse_motion(
+            self.kalman_filter, dists, strack_pool, detections, gating_distance=gating)
         matches, u_track, u_detection = matching.linear_assignment(
             dists, thresh=0.4)
+        if self.association_log is not None:
+            self.association_log[-1].matches = matches
 
         for itracked, idet in matches:
             track = strack_pool[itracked]
             det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(detections[idet], frame_id)
+                track.update(det, frame_id, update_kalman=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, frame_id, new_id=False)
+                track.re_activate(
+                    det, frame_id, new_id=False, update_kalman=False)
                 refind_stracks.append(track)
+            observed.append((track, det))
+            kalman_updates.append((track, det))
+
+        timer.stop()
 
         ''' Step 3: Second association, with IOU'''
+        timer.start('iou_association')
         detections = [detections[i] for i in u_detection]
         r_tracked_stracks = [strack_pool[i]
                              for i in u_track if strack_pool[i].state == TrackState.Tracked]
@@ -329,11 +383,14 @@ class TrainAgentJDETracker():
             track = r_tracked_stracks[itracked]
             det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(det, frame_id)
+                track.update(det, frame_id, update_kalman=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, frame_id, new_id=False)
+                track.re_activate(
+                    det, frame_id, new_id=False, update_kalman=False)
                 refind_stracks.append(track)
+            observed.append((track, det))
+            kalman_updates.append((track, det))
 
         for it in u_track:
             track = r_tracked_stracks[it]
@@ -347,21 +404,38 @@ class TrainAgentJDETracker():
         matches, u_unconfirmed, u_detection = matching.linear_assignment(
             dists, thresh=0.7)
         for itracked, idet in matches:
-            unconfirmed[itracked].update(detections[idet], frame_id)
+            unconfirmed[itracked].update(
+                detections[idet], frame_id, update_kalman=False)
             activated_starcks.append(unconfirmed[itracked])
+            observed.append((unconfirmed[itracked], detections[idet]))
+            kalman_updates.append((unconfirmed[itracked], detections[idet]))
         for it in u_unconfirmed:
             track = unconfirmed[it]
             track.mark_removed()
             removed_stracks.append(track)
+        timer.stop()
+
+        timer.start('kalman_update')
+        batch_kalman_update(kalman_updates)
+        timer.stop()
 
         """ Step 4: Init new stracks"""
+        timer.start('new_tracks')
         for inew in u_detection:
-            track = detections[inew]
-            if track.score < self.det_thresh:
+            det = detections[inew]
+            if det.score < self.det_thresh:
                 continue
+            track = AgentSTrack(det.tlwh, det.score, det.curr_feat, det.min_iou_score)
+            track.det_index = det.index
             track.activate(self.kalman_filter, frame_id)
             activated_starcks.append(track)
+            observed.append((track, det))
+        timer.stop()
+        timer.start('observations')
+        observe_tracks(observed)
+        timer.stop()
         """ Step 5: Update state"""
+        timer.start('bookkeeping')
         for track in self.lost_stracks:
             if frame_id - track.end_frame > self.max_time_lost:
                 track.mark_removed()
@@ -383,12 +457,16 @@ class TrainAgentJDETracker():
         self.removed_stracks.extend(removed_stracks)
         self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(
             self.tracked_stracks, self.lost_stracks)
+        # Kalman bank slots of the tracks dropped from both are reused
+        self.kalman_filter.release_unused(self.tracked_stracks + self.lost_stracks)
 
         # logger.debug('===========Frame {}=========='.format(frame_id))
         # logger.debug('Activated: {}'.format([track.track_id for track in activated_starcks]))
         # logger.debug('Refind: {}'.format([track.track_id for track in refind_stracks]))
         # logger.debug('Lost: {}'.format([track.track_id for track in lost_stracks]))
         # logger.debug('Removed: {}'.format([track.track_id for track in removed_stracks]))
+        timer.stop()
+        timer.stop()  # tracker.update
 
         return self.tracked_stracks
 
@@ -436,67 +514,58 @@ def remove_duplicate_stracks(stracksa, stracksb):
 
 def custom_embedding_distance(n, tracks, detections, metric='cosine'):
     """
+    Embedding distance using, per detection, the average of the n gallery
+    features closest to it (in place of the moving average). Tracks with at
+    most n features use their gallery average, empty galleries smooth_feat.
+    Galleries larger than n are stacked into one zero padded
+    (tracks, gallery, dim) tensor, the n closest features are selected for
+    all detections with one argpartition and averaged with a batched matmul.
+    :param n: number of gallery features to average
     :param tracks: list[STrack]
     :param detections: list[BaseTrack]
-    :param metric:
+    :param metric: only cosine is supported
     :return: cost_matrix np.ndarray
     """
+    if metric != 'cosine':
+        raise ValueError(f'Unsupported metric for lookup gallery: {metric}')
     cost_matrix = np.zeros((len(tracks), len(detections)), dtype=np.float)
     if cost_matrix.size == 0:
         return cost_matrix
     det_features = np.asarray(
-        [track.curr_feat for track in detections], dtype=np.float)
-
-    # Pick n min from gallery as smooth_feat (in place of moving average)
-    num_dets = len(detections)
-    track_features = []  # (num_tracks, num_dets, 128)
-    for i, track in enumerate(tracks):
-        # If gallery is larger than n, take best n features
-        feats = np.asarray(track.features)
-        if len(track.features) > n:
-            gallery_cost_matrix = cdist(feats, det_features, metric)
-            min_row_idxs = np.argpartition(
-                gallery_cost_matrix, n, axis=0)[:n].T
-            assert min_row_idxs.shape == (num_dets, n)
-
-            # Best averaged track feature for each detection
-            smooth_feat_vs_det = np.zeros(
-                (num_dets, 128))  # (num_dets, 128)
-            for det_n in range(num_dets):
-                best_n_feats = feats[min_row_idxs[det_n], :]  # (n, 128)
-                smooth_feat = np.average(best_n_feats, axis=0)  # (128,)
-                smooth_feat_vs_det[det_n, :] = smooth_feat
-        elif track.features:
-            smooth_feat = np.average(feats, axis=0)
-            smooth_feat_vs_det = np.tile(smooth_feat, (num_dets, 1))
-        else:
-            smooth_feat_vs_det = np.tile(track.smooth_feat, (num_dets, 1))
-
-        track_features.append(smooth_feat_vs_det)
-
-    for det_n in range(num_dets):
-        track_features_vs_det = []
-        for track_n in range(len(tracks)):
-            feat = track_features[track_n][det_n]
-            track_features_vs_det.append(feat)
-
-        cost_col = cdist(track_features_vs_det, [det_features[det_n]], metric)
-        cost_matrix[:, det_n] = cost_col.flatten()
+        [track.curr_feat for track in detections], dtype=np.float32)
+    det_normed = det_features / np.linalg.norm(det_features, axis=1, keepdims=True)
+    dim = det_features.shape[1]
+    lengths = np.array([len(track.features) for track in tracks])
+
+    # Same track feature for every detection
+    small = np.flatnonzero(lengths <= n)
+    if len(small):
+        track_feats = np.empty((len(small), dim))
+        for k, i in enumerate(small):
+            track = tracks[i]
+            track_feats[k] = track.features.mean() if lengths[i] else track.smooth_feat
+        track_feats /= np.linalg.norm(track_feats, axis=1, keepdims=True)
+        cost_matrix[small] = 1. - track_feats @ det_normed.T
+
+    # Average of the n closest gallery features to each detection
+    large = np.flatnonzero(lengths > n)
+    if len(large):
+        stacked = np.zeros((len(large), lengths[large].max(), dim), dtype=np.float32)
+        for k, i in enumerate(large):
+            stacked[k, :lengths[i]] = tracks[i].features.array()
+        norms = np.linalg.norm(stacked, axis=2, keepdims=True)
+        normed = stacked / np.where(norms > 0, norms, 1.)
+        gallery_dists = 1. - det_normed @ normed.transpose(0, 2, 1)
+        padding = np.arange(stacked.shape[1]) >= lengths[large][:, None]
+        gallery_dists[padding[:, None, :].repeat(len(detections), axis=1)] = np.inf
+
+        # (tracks, dets, gallery) weights of 1/n on the n closest features
+        closest = np.argpartition(gallery_dists, n - 1, axis=2)[:, :, :n]
+        weights = np.zeros_like(gallery_dists)
+        np.put_along_axis(weights, closest, 1. / n, axis=2)
+        averaged = weights @ stacked  # (tracks, dets, dim)
+        cost_matrix[large] = 1. - np.einsum('tjd,jd->tj', averaged, det_normed) / \
+            np.linalg.norm(averaged, axis=2)
 
     cost_matrix = np.maximum(0.0, cost_matrix)  # Nomalized features
     return cost_matrix
-
-
-def get_min_iou_scores(dets):
-    # Calculate maximum overlap of each detection with neighbouring detections
-    # Lower score means more overlap, min iou score = worst overlap
-    min_iou_scores = []
-    n_dets = dets.shape[0]
-    for idx in range(n_dets):
-        mask = np.ones((n_dets,), dtype=bool)
-        mask[idx] = False
-        neighbours_dets = dets[mask, :]
-        ious = matching.iou_distance(np.expand_dims(
-            dets[idx, :], axis=0), neighbours_dets)
-        min_iou_scores.append(np.min(ious))
-    return min_iou_scores
@@ -0,0 +1,244 @@
+import numpy as np
+
+
+class FeatureGallery(object):
+    '''
+    Feature gallery of an AgentSTrack with running statistics, so the
+    gallery terms of the observation do not need the n x n cosine matrix.
+
+    Keeps the sum of the features (gallery mean) and the sum of the
+    normalised features. The sum of cosine similarities over all pairs is
+    maintained from the latter, since adding x to a gallery with normalised
+    sum S adds x.S / |x| to it. Appending or removing a feature is O(d).
+    Removals subtract from the sums, so they are recomputed from the buffer
+    every refresh_every removals before rounding errors build up.
+
+    Features live in a preallocated float32 buffer, rows
+    [head, head + len) oldest first, so array() is a zero-copy view. With a
+    maxlen the oldest feature is dropped by moving the head, like a deque.
+    When the buffer end is reached the live rows are moved back to the
+    start, or the buffer is doubled if more than half of it is in use.
+
+    The cosine similarity matrix between gallery features, used to prune
+    the most redundant feature, is built on the first most_similar() call
+    and then kept up to date: O(n d) per append, O(n) per removal. Rows and
+    columns are indexed by slot (_slots maps buffer rows to slots) so
+    features moving in the buffer do not move the matrix.
+    '''
+
+    refresh_every = 256
+
+    def __init__(self, maxlen=None, capacity=16):
+        self.maxlen = maxlen
+        self._buffer = None  # Allocated on first append, (capacity, d)
+        self._capacity = capacity if maxlen is None else 2 * maxlen
+        self._head = 0
+        self._len = 0
+        self.feat_sum = None
+        self.normed_sum = None
+        self.pair_similarity = 0.
+        self._removals = 0  # Since the sums were last recomputed
+        self._similarity = None  # (slots, slots), -inf for free slots
+        self._slots = None
+        self._free_slots = None
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return iter(self.array())
+
+    def __getitem__(self, idx):
+        return self.array()[idx]
+
+    def array(self):
+        '''
+        Read-only (n, d) float32 view of the gallery features, oldest first.
+        Only valid until the gallery is next modified.
+        '''
+        if self._buffer is None:
+            return np.empty((0, 0), dtype=np.float32)
+        view = self._buffer[self._head:self._head + self._len]
+        view.flags.writeable = False
+        return view
+
+    def copy(self):
+        gallery = FeatureGallery.__new__(FeatureGallery)
+        gallery.__dict__.update(self.__dict__)
+        if self._buffer is not None:
+            gallery._buffer = self._buffer.copy()
+            gallery.feat_sum = self.feat_sum.copy()
+            gallery.normed_sum = self.normed_sum.copy()
+        if self._similarity is not None:
+            gallery._similarity = self._similarity.copy()
+            gallery._slots = self._slots.copy()
+            gallery._free_slots = list(self._free_slots)
+        return gallery
+
+    def _add_stats(self, feat):
+        normed = feat / np.linalg.norm(feat)
+        self.pair_similarity += np.dot(normed, self.normed_sum)
+        self.normed_sum += normed
+        self.feat_sum += feat
+
+    def _remove_stats(self, feat):
+        normed = feat / np.linalg.norm(feat)
+        self.normed_sum -= normed
+        self.feat_sum -= feat
+        self.pair_similarity -= np.dot(normed, self.normed_sum)
+        self._removals += 1
+
+    def refresh_stats(self):
+        '''Recompute the running sums from the gallery features'''
+        feats = self.array().astype(float)
+        normed = feats / np.linalg.norm(feats, axis=1, keepdims=True)
+        self.feat_sum = feats.sum(axis=0)
+        self.normed_sum = normed.sum(axis=0)
+        # Sum over pairs of x_i.x_j = (|S|^2 - sum |x_i|^2) / 2
+        self.pair_similarity = (np.dot(self.normed_sum, self.normed_sum) -
+                                np.sum(normed * normed)) / 2
+        self._removals = 0
+
+    def _move(self, dst, start, end):
+        # Move buffer rows [start, end) (and their slots) to dst
+        self._buffer[dst:dst + end - start] = self._buffer[start:end].copy()
+        if self._slots is not None:
+            self._slots[dst:dst + end - start] = self._slots[start:end].copy()
+
+    def _reserve(self, dim):
+        if self._buffer is None:
+            self._buffer = np.empty((self._capacity, dim), dtype=np.float32)
+            self.feat_sum = np.zeros(dim)
+            self.normed_sum = np.zeros(dim)
+        elif self._head + self._len == self._capacity:
+            if 2 * self._len > self._capacity:
+                self._capacity *= 2
+                buffer = np.empty((self._capacity, dim), dtype=np.float32)
+                buffer[:self._len] = self.array()
+                self._buffer = buffer
+                if self._slots is not None:
+                    slots = np.empty(self._capacity, dtype=int)
+                    slots[:self._len] = self._slots[self._head:self._head + self._len]
+                    self._slots = slots
+            else:
+                self._move(0, self._head, self._head + self._len)
+            self._head = 0
+
+    def _add_similarity(self, pos):
+        if not self._free_slots:
+            # Double the matrix, existing slots keep their index
+            size = len(self._similarity)
+            similarity = np.full((2 * size, 2 * size), -np.inf, dtype=np.float32)
+            similarity[:size, :size] = self._similarity
+            self._similarity = similarity
+            self._free_slots = list(range(2 * size - 1, size - 1, -1))
+        slot = self._free_slots.pop()
+        self._slots[pos] = slot
+        live = self._slots[self._head:self._head + self._len]
+        feats = self.array()
+        similarities = feats @ feats[pos - self._head] / \
+            (np.linalg.norm(feats, axis=1) * np.linalg.norm(feats[pos - self._head]))
+        self._similarity[slot, live] = similarities
+        self._similarity[live, slot] = similarities
+        self._similarity[slot, slot] = 0.  # As np.eye(n) + cosine distance
+
+    def _remove_similarity(self, pos):
+        slot = self._slots[pos]
+        self._similarity[slot, :] = -np.inf
+        self._similarity[:, slot] = -np.inf
+        self._free_slots.append(slot)
+
+    def append(self, feat):
+        feat = np.asarray(feat, dtype=np.float32)
+        if self._len == self.maxlen:
+            # Drop the oldest feature like deque(maxlen)
+            self._remove_stats(self._buffer[self._head].astype(float))
+            if self._similarity is not None:
+                self._remove_similarity(self._head)
+            self._head += 1
+            self._len -= 1
+        self._reserve(len(feat))
+        pos = self._head + self._len
+        self._buffer[pos] = feat
+        self._len += 1
+        if self._removals >= self.refresh_every:
+            self.refresh_stats()
+        else:
+            self._add_stats(feat.astype(float))
+        if self._similarity is not None:
+            self._add_similarity(pos)
+
+    def pop(self, idx=-1):
+        idx = range(self._len)[idx]
+        pos = self._head + idx
+        feat = self._buffer[pos].copy()
+        if self._similarity is not None:
+            self._remove_similarity(pos)
+        # Close the gap by shifting the shorter side
+        if idx < self._len // 2:
+            self._move(self._head + 1, self._head, pos)
+            self._head += 1
+        else:
+            self._move(pos, pos + 1, self._head + self._len)
+        self._len -= 1
+        if not self._len:
+            self._head = 0
+            self.feat_sum[:] = 0.
+            self.normed_sum[:] = 0.
+            self.pair_similarity = 0.
+            self._removals = 0
+        elif self._removals >= self.refresh_every:
+            self.refresh_stats()
+        else:
+            self._remove_stats(feat.astype(float))
+        return feat
+
+    def _build_similarity(self):
+        feats = self.array()
+        n = self._len
+        size = max(16, 2 * n)
+        normed = feats / np.linalg.norm(feats, axis=1, keepdims=True)
+        self._similarity = np.full((size, size), -np.inf, dtype=np.float32)
+        self._similarity[:n, :n] = normed @ normed.T
+        np.fill_diagonal(self._similarity[:n, :n], 0.)
+        self._slots = np.empty(self._capacity, dtype=int)
+        self._slots[self._head:self._head + n] = np.arange(n)
+        self._free_slots = list(range(size - 1, n - 1, -1))
+
+    def most_similar(self):
+        '''
+        Index of the older feature of the most similar pair in the gallery,
+        the feature pruned by AgentSTrack.prune_similar
+        '''
+        if self._similarity is None:
+            self._build_similarity()
+        slot_a, slot_b = np.unravel_index(
+            np.argmax(self._similarity), self._similarity.shape)
+        if slot_a == slot_b:
+            # No pair closer than orthogonal, np.eye(n) picks the first
+            return 0
+        live = self._slots[self._head:self._head + self._len]
+        return int(np.flatnonzero((live == slot_a) | (live == slot_b))[0])
+
+    def mean(self):
+        return self.feat_sum / self._len
+
+    def mean_distance(self, feat):
+        '''Cosine distance between feat and the gallery mean'''
+        if not self._len:
+            return 0.
+        mean = self.feat_sum / self._len
+        return 1. - np.dot(mean, feat) / (np.linalg.norm(mean) * np.linalg.norm(feat))
+
+    def similarities(self, feat):
+        '''Cosine similarity of feat to each gallery feature'''
+        feats = self.array()
+        return feats @ (feat / np.linalg.norm(feat)).astype(np.float32) / \
+            np.linalg.norm(feats, axis=1)
+
+    def average_pairwise_distance(self):
+        '''Average cosine distance over all pairs, 0 for fewer than 3 features'''
+        n = self._len
+        if n <= 2:
+            return 0.
+        return 1. - self.pair_similarity / (n * (n - 1) / 2)
@@ -12,14 +12,19 @@ Add the following to mapping(item) in rllib/utils/torch_utils.py:
 import sys
 import random
 
+import numpy as np
 import torch
-from ray.rllib.agents import dqn, impala, ppo
 
 
 JDE = __import__('Towards-Realtime-MOT')
 sys.path.insert(0, JDE.__path__._path[0])
 
+from .bbox import get_min_iou_scores
+from .detection import frame_detections
+from .observation import observe_tracks
+from .policy import PolicyMLP
 from .jde_train import TrainAgentJdeTracker, AgentSTrack
+from .kalman_bank import KalmanBank, batch_kalman_update, fuse_motion
 from utils.log import logger
 from utils.kalman_filter import KalmanFilter
 from tracker.basetrack import BaseTrack, TrackState
@@ -31,14 +36,26 @@ class RandomAgent:
     def compute_single_action(obs):
         return random.randint(0, 1)
 
+    @staticmethod
+    def compute_actions(observations):
+        return {k: random.randint(0, 1) for k in observations}
+
 
 class GreedyAgent:
     @staticmethod
     def compute_single_action(obs):
         return 1
 
+    @staticmethod
+    def compute_actions(observations):
+        return {k: 1 for k in observations}
+
 
 class AgentJdeTracker(TrainAgentJdeTracker):
+    # One batched compute_actions call for all tracks updated in a frame
+    # instead of compute_single_action per track, see observe_tracks
+    batch_actions = True
+
     def __init__(self, opt, frame_rate=30, agent_path=None):
         self.opt = opt
         self.model = Darknet(opt.cfg, nID=14455)
@@ -56,11 +73,12 @@ class AgentJdeTracker(TrainAgentJdeTracker):
         self.buffer_size = int(frame_rate / 30.0 * opt.track_buffer)
         self.max_time_lost = self.buffer_size
 
-        self.kalman_filter = KalmanFilter()
+        self.kalman_filter = KalmanBank(KalmanFilter())
 
         self.agent = self.build_agent(agent_path)
-        BaseTrack._count = 0  # THIS IS A HACK, CAN WE EXPORT PYTORCH WEIGHTS
-        # AND USE INDEPENDENTLY OF RESETTING ENV AND CAUSING COUNT TO GO UP?
+        # Restoring an RLlib trainer resets an env, which advances the track
+        # count. Exported policies (.npz, see PolicyMLP) do not need this
+        BaseTrack._count = 0
 
     def build_agent(self, agent_path):
         model = {
@@ -73,7 +91,12 @@ class AgentJdeTracker(TrainAgentJdeTracker):
             return GreedyAgent()
         elif agent_path == 'random':
             return RandomAgent()
-        elif 'dqn' in agent_path.lower():
+        elif agent_path.endswith('.npz'):
+            # Policy exported with tools/export_policy.py, no Ray needed
+            return PolicyMLP.load(agent_path)
+
+        from ray.rllib.agents import dqn, impala, ppo
+        if 'dqn' in agent_path.lower():
             config = dqn.DEFAULT_CONFIG.copy()
             config["framework"] = "torch"
             config["model"] = model
@@ -94,6 +117,27 @@ class AgentJdeTracker(TrainAgentJdeTracker):
         trainer.restore(agent_path)
         return trainer
 
+    def detect(self, im_blob, img0):
+        """
+        Network forward of a frame, (N, 6 + d) rows of the detections after
+        NMS: 0:4 tlbr in img0 coordinates, 4 score, 5 class, 6: embedding,
+        as cached by gen_jde_dets.py
+        """
+        # ''' Step 1: Network forward, get detections & embeddings'''
+        with torch.no_grad():
+            pred = self.model(im_blob)
+        # pred is tensor of all the proposals (default number of proposals: 54264). Proposals have information associated with the bounding box and embeddings
+        pred = pred[pred[:, :, 4] > self.opt.conf_thres]
+        dets = []
+        if len(pred) > 0:
+            dets = non_max_suppression(pred.unsqueeze(
+                0), self.opt.conf_thres, self.opt.nms_thres)[0].cpu()
+            # Final proposals are obtained in dets. Information of bounding box and embeddings also included
+            # Next step changes the detection scales
+            scale_coords(self.opt.img_size, dets[:, :4], img0.shape).round()
+            dets = dets.numpy()
+        return dets
+
     def update(self, im_blob, img0):
         """
         Processes the image frame and finds bounding box(detections).
@@ -122,20 +166,11 @@ class AgentJdeTracker(TrainAgentJdeTracker):
         # The tracks which are not obtained in the current frame but are not removed.(Lost for some time lesser than the threshold for removing)
         lost_stracks = []
         removed_stracks = []
+        observed = []  # (track, detection) pairs to generate observations for
+        kalman_updates = []  # Matched pairs, Kalman corrected in one batch
 
         # t1 = time.time()
-        # ''' Step 1: Network forward, get detections & embeddings'''
-        with torch.no_grad():
-            pred = self.model(im_blob)
-        # pred is tensor of all the proposals (default number of proposals: 54264). Proposals have information associated with the bounding box and embeddings
-        pred = pred[pred[:, :, 4] > self.opt.conf_thres]
-        dets = []
-        if len(pred) > 0:
-            dets = non_max_suppression(pred.unsqueeze(
-                0), self.opt.conf_thres, self.opt.nms_thres)[0].cpu()
-            # Final proposals are obtained in dets. Information of bounding box and embeddings also included
-            # Next step changes the detection scales
-            scale_coords(self.opt.img_size, dets[:, :4], img0.shape).round()
+        dets = self.detect(im_blob, img0)
 
         # pred now has lesser number of proposals. Proposals rejected on basis of object confidence score
         if len(dets) > 0:
@@ -149,8 +184,10 @@ class AgentJdeTracker(TrainAgentJdeTracker):
             else:
                 min_iou_scores = [1.]
 
-            detections = [AgentSTrack(AgentSTrack.tlbr_to_tlwh(tlbrs[:4]), tlbrs[4], f.numpy(), min_iou_score, agent=self.agent)
-                          for (tlbrs, f, min_iou_score) in zip(dets[:, :5], dets[:, 6:], min_iou_scores)]
+            # Converted once per frame, rows as AgentSTrack.curr_feat
+            feats = np.asarray(dets[:, 6:], dtype=float)
+            detections = frame_detections(
+                dets[:, :4], dets[:, 4], feats, min_iou_scores)
         else:
             detections = []
 
@@ -177,7 +214,7 @@ class AgentJdeTracker(TrainAgentJdeTracker):
 
         dists = matching.embedding_distance(strack_pool, detections)
         # dists = matching.gate_cost_matrix(self.kalman_filter, dists, strack_pool, detections)
-        dists = matching.fuse_motion(
+        dists = fuse_motion(
             self.kalman_filter, dists, strack_pool, detections)
         # The dists is the list of distances of the detection with the tracks in strack_pool
         matches, u_track, u_detection = matching.linear_assignment(
@@ -190,12 +227,15 @@ class AgentJdeTracker(TrainAgentJdeTracker):
             det = detections[idet]
             if track.state == TrackState.Tracked:
                 # If the track is active, add the detection to the track
-                track.update(detections[idet], self.frame_id)
+                track.update(det, self.frame_id, update_kalman=False)
                 activated_starcks.append(track)
             else:
                 # We have obtained a detection from a track which is not active, hence put the track in refind_stracks list
-                track.re_activate(det, self.frame_id, new_id=False)
+                track.re_activate(
+                    det, self.frame_id, new_id=False, update_kalman=False)
                 refind_stracks.append(track)
+            observed.append((track, det))
+            kalman_updates.append((track, det))
 
         # None of the steps below happen if there are no undetected tracks.
         ''' Step 3: Second association, with IOU'''
@@ -214,11 +254,14 @@ class AgentJdeTracker(TrainAgentJdeTracker):
             track = r_tracked_stracks[itracked]
             det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(det, self.frame_id)
+                track.update(det, self.frame_id, update_kalman=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_id, new_id=False)
+                track.re_activate(
+                    det, self.frame_id, new_id=False, update_kalman=False)
                 refind_stracks.append(track)
+            observed.append((track, det))
+            kalman_updates.append((track, det))
         # Same process done for some unmatched detections, but now considering IOU_distance as measure
 
         for it in u_track:
@@ -234,8 +277,11 @@ class AgentJdeTracker(TrainAgentJdeTracker):
         matches, u_unconfirmed, u_detection = matching.linear_assignment(
             dists, thresh=0.7)
         for itracked, idet in matches:
-            unconfirmed[itracked].update(detections[idet], self.frame_id)
+            unconfirmed[itracked].update(
+                detections[idet], self.frame_id, update_kalman=False)
             activated_starcks.append(unconfirmed[itracked])
+            observed.append((unconfirmed[itracked], detections[idet]))
+            kalman_updates.append((unconfirmed[itracked], detections[idet]))
 
         # The tracks which are yet not matched
         for it in u_unconfirmed:
@@ -243,14 +289,22 @@ class AgentJdeTracker(TrainAgentJdeTracker):
             track.mark_removed()
             removed_stracks.append(track)
 
+        batch_kalman_update(kalman_updates)
+
         # after all these confirmation steps, if a new detection is found, it is initialized for a new track
         """ Step 4: Init new stracks"""
         for inew in u_detection:
-            track = detections[inew]
-            if track.score < self.det_thresh:
+            det = detections[inew]
+            if det.score < self.det_thresh:
                 continue
+            # smooth_feat starts as a separate copy in the detector dtype
+            track = AgentSTrack(det.tlwh, det.score, det.curr_feat.astype(dets.dtype),
+                                det.min_iou_score, agent=self.agent)
+            track.det_index = det.index
             track.activate(self.kalman_filter, self.frame_id)
             activated_starcks.append(track)
+            observed.append((track, det))
+        observe_tracks(observed, self.batch_actions)
 
         """ Step 5: Update state"""
         # If the tracks are lost for more frames than the threshold number, the tracks are removed.
@@ -276,6 +330,8 @@ class AgentJdeTracker(TrainAgentJdeTracker):
         self.removed_stracks.extend(removed_stracks)
         self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(
             self.tracked_stracks, self.lost_stracks)
+        # Kalman bank slots of the tracks dropped from both are reused
+        self.kalman_filter.release_unused(self.tracked_stracks + self.lost_stracks)
 
         # get scores of lost tracks
         output_stracks = [
@@ -333,18 +389,3 @@ def remove_duplicate_stracks(stracksa, stracksb):
     resa = [t for i, t in enumerate(stracksa) if not i in dupa]
     resb = [t for i, t in enumerate(stracksb) if not i in dupb]
     return resa, resb
-
-
-def get_min_iou_scores(dets):
-    # Calculate maximum overlap of each detection with neighbouring detections
-    # Lower score means more overlap, min iou score = worst overlap
-    min_iou_scores = []
-    n_dets = dets.shape[0]
-    for idx in range(n_dets):
-        mask = np.ones((n_dets,), dtype=bool)
-        mask[idx] = False
-        neighbours_dets = dets[mask, :]
-        ious = matching.iou_distance(np.expand_dims(
-            dets[idx, :], axis=0), neighbours_dets)
-        min_iou_scores.append(np.min(ious))
-    return min_iou_scores
@@ -1,7 +1,4 @@
 import sys
-from collections import deque
-
-from scipy.spatial.distance import cdist
 
 JDE = __import__('Towards-Realtime-MOT')
 sys.path.insert(0, JDE.__path__._path[0])
@@ -14,13 +11,30 @@ from utils.log import logger
 
 from tracker.basetrack import BaseTrack, TrackState
 
+from .association import AssociationRecord
+from .bbox import get_min_iou_scores
+from .detection import frame_detections
+from .gallery import FeatureGallery
+from .kalman_bank import KalmanBank, KalmanSlot, batch_kalman_update, fuse_motion, motion_gating
+from .observation import observe_tracks
+from .phase_timer import PhaseTimer
+from .snapshot import TrackerSnapshot
+
 
-class AgentSTrack(BaseTrack):
+class AgentSTrack(KalmanSlot, BaseTrack):
     shared_kalman = KalmanFilter()
+    # Instance attributes in slots, the per-track __dict__ inherited from
+    # BaseTrack stays empty. Slots shadow the BaseTrack/KalmanSlot class
+    # defaults, so __init__ sets all of them
+    __slots__ = ('_tlwh', 'kalman_filter', 'slot', '_mean', '_covariance',
+                 'is_activated', 'tracklet_len', 'agent', 'score', 'min_iou_score',
+                 'curr_feat', 'smooth_feat', 'features', 'alpha', '_gallery_shared',
+                 'obs', 'det_index', 'track_id', 'state', 'frame_id', 'start_frame')
 
     def __init__(self, tlwh, score, temp_feat, min_iou_score, agent=None):
         self._tlwh = np.asarray(tlwh, dtype=np.float)
         self.kalman_filter = None
+        self.slot = None
         self.mean, self.covariance = None, None
         self.is_activated = False
         self.tracklet_len = 0
@@ -32,53 +46,59 @@ class AgentSTrack(BaseTrack):
         self.curr_feat = np.asarray(temp_feat, dtype=float)
 
         self.smooth_feat = temp_feat
-        self.features = deque([], maxlen=100)
+        self.features = FeatureGallery(maxlen=100)
         self.alpha = 0.9
+        self._gallery_shared = False
+        self.obs = None
+        # Row of the detection matched at frame_id in that frame's detections
+        self.det_index = -1
+
+        self.track_id = 0
+        self.state = TrackState.New
+        self.frame_id = 0
+        self.start_frame = 0
 
     def gallery_similarity(self, feat):
         max_cosine_simlarity = 0.
         if self.features:
-            dists = cdist(np.array([feat]), np.asarray(
-                self.features), 'cosine')
-            max_cosine_simlarity = np.max(np.ones(dists.shape) - dists)
+            max_cosine_simlarity = float(np.max(self.features.similarities(feat)))
         return max_cosine_simlarity
 
     def average_gallery_distance(self):
-        average_dist = 0.
-        n = len(self.features)
-        if n > 2:
-            feats = np.asarray(self.features)
-            cost_matrix = cdist(feats, feats, 'cosine')
-            pairwise_dists = np.tril(cost_matrix, -1)
-            num_pairs = (n-1)*(n)/2
-            average_dist = np.sum(pairwise_dists) / num_pairs
-        return average_dist
+        # Running pairwise similarity total, see FeatureGallery
+        return self.features.average_pairwise_distance()
 
     def get_observation(self, feat, score, min_iou_score):
-        similarity = self.gallery_similarity(feat)
-        average = 0.
-        if self.features:
-            gallery_avg = np.average(self.features, axis=0)
-            average = cdist([gallery_avg], [feat], 'cosine').item()
-        average_dist = self.average_gallery_distance()
         return np.array([
             score,
-            similarity,
+            self.gallery_similarity(feat),
             len(self.features),
             min_iou_score,
-            average,
-            average_dist
+            self.features.mean_distance(feat),
+            self.average_gallery_distance()
         ], dtype=float)
 
+    def share_gallery(self):
+        '''Hand gallery to a tracker snapshot, it is copied on next write'''
+        self._gallery_shared = True
+        return self.features, self.smooth_feat
+
+    def restore_gallery(self, gallery):
+        self.features, self.smooth_feat = gallery
+        self._gallery_shared = True
+
     def update_gallery(self, action, feat):
         '''Translate action to change in gallery'''
         if action == 0:
             return
-        elif action == 1:
+        if self._gallery_shared:
+            self.features = self.features.copy()
+            self._gallery_shared = False
+        feat /= np.linalg.norm(feat)
+        if action == 1:
             self.features.append(feat)
 
         # Recalculate gallery each update same as baseline FairMOT
-        feat /= np.linalg.norm(feat)
         self.curr_feat = feat
         if self.smooth_feat is None:
             self.smooth_feat = feat
@@ -87,55 +107,51 @@ class AgentSTrack(BaseTrack):
                 self.smooth_feat + (1-self.alpha) * feat
         self.smooth_feat /= np.linalg.norm(self.smooth_feat)
 
-    def agent_update_features(self, feat, obs):
-        '''New method added for RL agent to manage gallery'''
+    def agent_update_features(self, feat, obs, action=None):
+        '''
+        New method added for RL agent to manage gallery, action is computed
+        here unless given (already computed in a batch, see observe_tracks)
+        '''
         self.curr_feat = feat
         if self.agent:
-            action = self.agent.compute_single_action(obs)
+            if action is None:
+                action = self.agent.compute_single_action(obs)
             self.update_gallery(action, feat)
 
-    def re_activate(self, new_track, frame_id, new_id=False):
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_track.tlwh)
-        )
-
-        self.obs = self.get_observation(
-            new_track.curr_feat,
-            new_track.score,
-            new_track.min_iou_score
-        )
-        self.agent_update_features(new_track.curr_feat, self.obs)
+    def re_activate(self, new_track, frame_id, new_id=False, update_kalman=True):
+        if update_kalman:
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, self.tlwh_to_xyah(new_track.tlwh)
+            )
+
         self.tracklet_len = 0
         self.state = TrackState.Tracked
         self.is_activated = True
         self.frame_id = frame_id
+        self.det_index = new_track.index
         if new_id:
             self.track_id = self.next_id()
 
-    def update(self, new_track, frame_id):
+    def update(self, new_track, frame_id, update_kalman=True):
         """
         Update a matched track
         :type new_track: STrack
         :type frame_id: int
-        :type update_feature: bool
+        :type update_kalman: bool, False if the caller corrects the Kalman
+            state of all matched tracks at once (batch_kalman_update)
         :return:
         """
         self.frame_id = frame_id
+        self.det_index = new_track.index
         self.tracklet_len += 1
 
-        new_tlwh = new_track.tlwh
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_tlwh))
+        if update_kalman:
+            new_tlwh = new_track.tlwh
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, self.tlwh_to_xyah(new_tlwh))
         self.state = TrackState.Tracked
         self.is_activated = True
 
-        self.obs = self.get_observation(
-            new_track.curr_feat,
-            new_track.score,
-            new_track.min_iou_score
-        )
-        self.agent_update_features(new_track.curr_feat, self.obs)
-
     def predict(self):
         mean_state = self.mean.copy()
         if self.state != TrackState.Tracked:
@@ -146,6 +162,11 @@ class AgentSTrack(BaseTrack):
     @staticmethod
     def multi_predict(stracks, kalman_filter):
         if len(stracks) > 0:
+            bank, slots = KalmanSlot.bank_slots(stracks)
+            if bank is not None:
+                stopped = np.array([st.state != TrackState.Tracked for st in stracks])
+                bank.predict_slots(slots, stopped)
+                return
             multi_mean = np.asarray([st.mean.copy() for st in stracks])
             multi_covariance = np.asarray([st.covariance for st in stracks])
             for i, st in enumerate(stracks):
@@ -159,10 +180,8 @@ class AgentSTrack(BaseTrack):
 
     def activate(self, kalman_filter, frame_id):
         """Start a new tracklet"""
-        self.kalman_filter = kalman_filter
         self.track_id = self.next_id()
-        self.mean, self.covariance = self.kalman_filter.initiate(
-            self.tlwh_to_xyah(self._tlwh))
+        self.initiate_kalman(kalman_filter, self.tlwh_to_xyah(self._tlwh))
 
         self.tracklet_len = 0
         self.state = TrackState.Tracked
@@ -172,13 +191,6 @@ class AgentSTrack(BaseTrack):
         self.frame_id = frame_id
         self.start_frame = frame_id
 
-        self.obs = self.get_observation(
-            self.curr_feat,
-            self.score,
-            self.min_iou_score
-        )
-        self.agent_update_features(self.curr_feat, self.obs)
-
     @property
     def tlwh(self):
         """Get current position in bounding box format `(top left x, top left y,
@@ -242,7 +254,24 @@ class TrainAgentJdeTracker():
         self.buffer_size = int(frame_rate / 30.0 * opt.track_buffer)
         self.max_time_lost = self.buffer_size
 
-        self.kalman_filter = KalmanFilter()
+        self.kalman_filter = KalmanBank(KalmanFilter())
+        # List to log the first association of each update to (look-ahead)
+        self.association_log = None
+        # Disabled unless an env shares its timer (time_phases)
+        self.phase_timer = PhaseTimer()
+
+    def embedding_distance(self, tracks, detections):
+        '''Appearance cost of the first association'''
+        return matching.embedding_distance(tracks, detections)
+
+    def snapshot(self):
+        '''Capture tracker state, cheaper alternative to deepcopying tracks'''
+        return TrackerSnapshot(self, BaseTrack._count)
+
+    def restore(self, snapshot):
+        '''Roll tracker back to a state captured with snapshot()'''
+        snapshot.restore(self)
+        BaseTrack._count = snapshot.track_count
 
     def update(self, dets, frame_id):
         """
@@ -270,6 +299,11 @@ class TrainAgentJdeTracker():
         # The tracks which are not obtained in the current frame but are not removed.(Lost for some time lesser than the threshold for removing)
         lost_stracks = []
         removed_stracks = []
+        observed = []  # (track, detection) pairs to generate observations for
+        # Matched (track, detection) pairs, Kalman corrected in one batch
+        kalman_updates = []
+        timer = self.phase_timer
+        timer.start('tracker.update')
 
         # t1 = time.time()
         # ''' Step 1: Network forward, get detections & embeddings'''
@@ -284,6 +318,7 @@ class TrainAgentJdeTracker():
         #     scale_coords(self.opt.img_size, dets[:, :4], img0.shape).round()
         
         # pred now has lesser number of proposals. Proposals rejected on basis of object confidence score
+        timer.start('detections')
         if len(dets) > 0:
             '''Detections is list of (x1, y1, x2, y2, object_conf, class_score, class_pred)'''
             # class_pred is the embeddings.
@@ -295,10 +330,13 @@ class TrainAgentJdeTracker():
             else:
                 min_iou_scores = [1.]
 
-            detections = [AgentSTrack(AgentSTrack.tlbr_to_tlwh(tlbrs[:4]), tlbrs[4], np.asarray(f), min_iou_score, agent=None)
-                          for (tlbrs, f, min_iou_score) in zip(dets[:, :5], dets[:, 6:], min_iou_scores)]
+            # Converted once per frame, rows as AgentSTrack.curr_feat
+            feats = np.asarray(dets[:, 6:], dtype=float)
+            detections = frame_detections(
+                dets[:, :4], dets[:, 4], feats, min_iou_scores)
         else:
             detections = []
+        timer.stop()
 
         t2 = time.time()
         # print('Forward: {} s'.format(t2-t1))
@@ -316,18 +354,25 @@ class TrainAgentJdeTracker():
                 tracked_stracks.append(track)
 
         ''' Step 2: First association, with embedding'''
+        timer.start('association')
         # Combining currently tracked_stracks and lost_stracks
         strack_pool = joint_stracks(tracked_stracks, self.lost_stracks)
         # Predict the current location with KF
         AgentSTrack.multi_predict(strack_pool, self.kalman_filter)
 
-        dists = matching.embedding_distance(strack_pool, detections)
+        dists = self.embedding_distance(strack_pool, detections)
         # dists = matching.gate_cost_matrix(self.kalman_filter, dists, strack_pool, detections)
-        dists = matching.fuse_motion(
-            self.kalman_filter, dists, strack_pool, detections)
+        gating = motion_gating(self.kalman_filter, strack_pool, detections)
+        if self.association_log is not None:
+            self.association_log.append(
+                AssociationRecord(strack_pool, detections, dists, gating, thresh=0.7))
+        dists = fuse_motion(
+            self.kalman_filter, dists, strack_pool, detections, gating_distance=gating)
         # The dists is the list of distances of the detection with the tracks in strack_pool
         matches, u_track, u_detection = matching.linear_assignment(
             dists, thresh=0.7)
+        if self.association_log is not None:
+            self.association_log[-1].matches = matches
         # The matches is the array for corresponding matches of the detection with the corresponding strack_pool
 
         for itracked, idet in matches:
@@ -336,15 +381,20 @@ class TrainAgentJdeTracker():
             det = detections[idet]
             if track.state == TrackState.Tracked:
                 # If the track is active, add the detection to the track
-                track.update(detections[idet], frame_id)
+                track.update(det, frame_id, update_kalman=False)
                 activated_starcks.append(track)
             else:
                 # We have obtained a detection from a track which is not active, hence put the track in refind_stracks list
-                track.re_activate(det, frame_id, new_id=False)
+                track.re_activate(
+                    det, frame_id, new_id=False, update_kalman=False)
                 refind_stracks.append(track)
+            observed.append((track, det))
+            kalman_updates.append((track, det))
+        timer.stop()
 
         # None of the steps below happen if there are no undetected tracks.
         ''' Step 3: Second association, with IOU'''
+        timer.start('iou_association')
         detections = [detections[i] for i in u_detection]
         # detections is now a list of the unmatched detections
         r_tracked_stracks = []  # This is container for stracks which were tracked till the
@@ -360,11 +410,14 @@ class TrainAgentJdeTracker():
             track = r_tracked_stracks[itracked]
             det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(det, frame_id)
+                track.update(det, frame_id, update_kalman=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, frame_id, new_id=False)
+                track.re_activate(
+                    det, frame_id, new_id=False, update_kalman=False)
                 refind_stracks.append(track)
+            observed.append((track, det))
+            kalman_updates.append((track, det))
         # Same process done for some unmatched detections, but now considering IOU_distance as measure
 
         for it in u_track:
@@ -380,25 +433,44 @@ class TrainAgentJdeTracker():
         matches, u_unconfirmed, u_detection = matching.linear_assignment(
             dists, thresh=0.7)
         for itracked, idet in matches:
-            unconfirmed[itracked].update(detections[idet], frame_id)
+            unconfirmed[itracked].update(
+                detections[idet], frame_id, update_kalman=False)
             activated_starcks.append(unconfirmed[itracked])
+            observed.append((unconfirmed[itracked], detections[idet]))
+            kalman_updates.append((unconfirmed[itracked], detections[idet]))
 
         # The tracks which are yet not matched
         for it in u_unconfirmed:
             track = unconfirmed[it]
             track.mark_removed()
             removed_stracks.append(track)
+        timer.stop()
+
+        timer.start('kalman_update')
+        batch_kalman_update(kalman_updates)
+        timer.stop()
 
         # after all these confirmation steps, if a new detection is found, it is initialized for a new track
         """ Step 4: Init new stracks"""
+        timer.start('new_tracks')
         for inew in u_detection:
-            track = detections[inew]
-            if track.score < self.det_thresh:
+            det = detections[inew]
+            if det.score < self.det_thresh:
                 continue
+            # smooth_feat starts as a separate copy in the detector dtype
+            track = AgentSTrack(det.tlwh, det.score, det.curr_feat.astype(dets.dtype),
+                                det.min_iou_score)
+            track.det_index = det.index
             track.activate(self.kalman_filter, frame_id)
             activated_starcks.append(track)
+            observed.append((track, det))
+        timer.stop()
+        timer.start('observations')
+        observe_tracks(observed)
+        timer.stop()
 
         """ Step 5: Update state"""
+        timer.start('bookkeeping')
         # If the tracks are lost for more frames than the threshold number, the tracks are removed.
         for track in self.lost_stracks:
             if frame_id - track.end_frame > self.max_time_lost:
@@ -422,6 +494,8 @@ class TrainAgentJdeTracker():
         self.removed_stracks.extend(removed_stracks)
         self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(
             self.tracked_stracks, self.lost_stracks)
+        # Kalman bank slots of the tracks dropped from both are reused
+        self.kalman_filter.release_unused(self.tracked_stracks + self.lost_stracks)
 
         # get scores of lost tracks
         output_stracks = [
@@ -433,6 +507,8 @@ class TrainAgentJdeTracker():
         # logger.debug('Lost: {}'.format([track.track_id for track in lost_stracks]))
         # logger.debug('Removed: {}'.format([track.track_id for track in removed_stracks]))
         # print('Final {} s'.format(t5-t4))
+        timer.stop()
+        timer.stop()  # tracker.update
         return self.tracked_stracks
 
 
@@ -475,18 +551,3 @@ def remove_duplicate_stracks(stracksa, stracksb):
     resa = [t for i, t in enumerate(stracksa) if not i in dupa]
     resb = [t for i, t in enumerate(stracksb) if not i in dupb]
     return resa, resb
-
-
-def get_min_iou_scores(dets):
-    # Calculate maximum overlap of each detection with neighbouring detections
-    # Lower score means more overlap, min iou score = worst overlap
-    min_iou_scores = []
-    n_dets = dets.shape[0]
-    for idx in range(n_dets):
-        mask = np.ones((n_dets,), dtype=bool)
-        mask[idx] = False
-        neighbours_dets = dets[mask, :]
-        ious = matching.iou_distance(np.expand_dims(
-            dets[idx, :], axis=0), neighbours_dets)
-        min_iou_scores.append(np.min(ious))
-    return min_iou_scores
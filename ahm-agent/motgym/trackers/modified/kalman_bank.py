@@ -0,0 +1,231 @@
+import numpy as np
+
+# 0.95 quantile of the chi-square distribution with 4 degrees of freedom,
+# gating threshold of kalman_filter.chi2inv95 for (x, y, a, h) measurements
+CHI2INV95_4 = 9.4877
+
+
+class KalmanBank(object):
+    '''
+    Kalman filter state of all tracks of a tracker in contiguous arrays,
+    means (slots, 8) and covariances (slots, 8, 8) indexed by track slot
+    (see KalmanSlot), with predict, update and gating distance batched over
+    many slots. Uses the constant velocity model of the wrapped
+    KalmanFilter, whose per-track methods are forwarded so the bank can be
+    passed wherever the trackers expect a KalmanFilter (e.g. activate).
+
+    Slots of tracks the tracker no longer holds (removed, or dropped as
+    duplicates) are released by release_unused() and reused by new
+    tracks, so the bank grows with the live track count, not with the
+    sequence. Tracker snapshots save the allocation state() and restore()
+    it to drop the tracks simulated after them.
+    '''
+
+    def __init__(self, kalman_filter, capacity=64):
+        self.kalman_filter = kalman_filter
+        self._motion_mat = kalman_filter._motion_mat
+        self._std_weight_position = kalman_filter._std_weight_position
+        self._std_weight_velocity = kalman_filter._std_weight_velocity
+        self.means = np.zeros((capacity, 8))
+        self.covariances = np.zeros((capacity, 8, 8))
+        self.size = 0  # Slots ever allocated, rows after size are unused
+        self.free_slots = []  # Released slots below size, the last is reused first
+
+    def initiate(self, measurement):
+        return self.kalman_filter.initiate(measurement)
+
+    def predict(self, mean, covariance):
+        return self.kalman_filter.predict(mean, covariance)
+
+    def multi_predict(self, mean, covariance):
+        return self.kalman_filter.multi_predict(mean, covariance)
+
+    def update(self, mean, covariance, measurement):
+        return self.kalman_filter.update(mean, covariance, measurement)
+
+    def gating_distance(self, mean, covariance, measurements, only_position=False, metric='maha'):
+        return self.kalman_filter.gating_distance(
+            mean, covariance, measurements, only_position, metric)
+
+    def allocate(self):
+        '''Index of a new slot, a released one if any, the arrays are doubled when full'''
+        if self.free_slots:
+            return self.free_slots.pop()
+        if self.size == len(self.means):
+            self.means = np.concatenate([self.means, np.zeros_like(self.means)])
+            self.covariances = np.concatenate(
+                [self.covariances, np.zeros_like(self.covariances)])
+        self.size += 1
+        return self.size - 1
+
+    def release_unused(self, stracks):
+        '''
+        Release the slots of all tracks but stracks (the tracked and lost
+        tracks), the Kalman state of released tracks is no longer valid
+        '''
+        used = np.zeros(self.size, dtype=bool)
+        used[np.fromiter((st.slot for st in stracks if st.kalman_filter is self),
+                         dtype=int)] = True
+        self.free_slots = np.flatnonzero(~used)[::-1].tolist()
+
+    def state(self):
+        '''Allocation state, restore() releases the slots allocated after it'''
+        return self.size, list(self.free_slots)
+
+    def restore(self, state):
+        size, free_slots = state
+        self.size = size
+        self.free_slots = list(free_slots)
+
+    def predict_slots(self, slots, stopped):
+        '''
+        Predict the state of slots one frame ahead, as multi_predict.
+        Slots where stopped is True (tracks not in Tracked state) have their
+        height velocity reset first.
+        '''
+        mean = self.means[slots]
+        mean[stopped, 7] = 0
+        height = mean[:, 3]
+        std = np.empty((len(slots), 8))
+        std[:, [0, 1, 3]] = self._std_weight_position * height[:, None]
+        std[:, 2] = 1e-2
+        std[:, [4, 5, 7]] = self._std_weight_velocity * height[:, None]
+        std[:, 6] = 1e-5
+        motion_cov = np.zeros((len(slots), 8, 8))
+        motion_cov[:, np.arange(8), np.arange(8)] = np.square(std)
+
+        self.means[slots] = mean @ self._motion_mat.T
+        self.covariances[slots] = \
+            self._motion_mat @ self.covariances[slots] @ self._motion_mat.T + motion_cov
+
+    def _project(self, slots):
+        # Measurement space (x, y, a, h) is the first 4 state dimensions
+        mean = self.means[slots, :4]
+        height = mean[:, 3]
+        std = np.empty((len(slots), 4))
+        std[:, [0, 1, 3]] = self._std_weight_position * height[:, None]
+        std[:, 2] = 1e-1
+        covariance = self.covariances[slots, :4, :4]
+        covariance[:, np.arange(4), np.arange(4)] += np.square(std)
+        return mean, covariance
+
+    def update_slots(self, slots, measurements):
+        '''Kalman correction of slots with one (x, y, a, h) measurement each'''
+        projected_mean, projected_cov = self._project(slots)
+        covariance = self.covariances[slots]
+        # K = P H^T S^-1, from S K^T = H P as S is symmetric
+        kalman_gain = np.linalg.solve(
+            projected_cov, covariance[:, :4, :]).transpose(0, 2, 1)
+        innovation = measurements - projected_mean
+        self.means[slots] += np.einsum('nij,nj->ni', kalman_gain, innovation)
+        self.covariances[slots] = covariance - \
+            kalman_gain @ projected_cov @ kalman_gain.transpose(0, 2, 1)
+
+    def gating_distance_slots(self, slots, measurements):
+        '''(slots, measurements) squared Mahalanobis distances'''
+        projected_mean, projected_cov = self._project(slots)
+        d = measurements[None, :, :] - projected_mean[:, None, :]
+        cholesky_factor = np.linalg.cholesky(projected_cov)
+        z = np.linalg.solve(cholesky_factor, d.transpose(0, 2, 1))
+        return np.sum(z * z, axis=1)
+
+
+class KalmanSlot(object):
+    '''
+    Track mixin keeping the Kalman mean and covariance in a row of the
+    KalmanBank the track was activated with. Tracks activated with a plain
+    KalmanFilter (or not yet activated) keep them as attributes.
+    '''
+    slot = None
+    _mean = None
+    _covariance = None
+
+    @property
+    def mean(self):
+        if self.slot is None:
+            return self._mean
+        return self.kalman_filter.means[self.slot]
+
+    @mean.setter
+    def mean(self, mean):
+        if self.slot is None:
+            self._mean = mean
+        else:
+            self.kalman_filter.means[self.slot] = mean
+
+    @property
+    def covariance(self):
+        if self.slot is None:
+            return self._covariance
+        return self.kalman_filter.covariances[self.slot]
+
+    @covariance.setter
+    def covariance(self, covariance):
+        if self.slot is None:
+            self._covariance = covariance
+        else:
+            self.kalman_filter.covariances[self.slot] = covariance
+
+    def initiate_kalman(self, kalman_filter, measurement):
+        self.kalman_filter = kalman_filter
+        if isinstance(kalman_filter, KalmanBank):
+            self.slot = kalman_filter.allocate()
+        self.mean, self.covariance = kalman_filter.initiate(measurement)
+
+    @staticmethod
+    def bank_slots(stracks):
+        '''(bank, slots) if all stracks share a KalmanBank else (None, None)'''
+        bank = stracks[0].kalman_filter
+        if not isinstance(bank, KalmanBank) or \
+                any(st.kalman_filter is not bank for st in stracks):
+            return None, None
+        return bank, np.fromiter((st.slot for st in stracks), dtype=int, count=len(stracks))
+
+
+def batch_kalman_update(kalman_updates):
+    '''
+    Kalman correction of matched (track, detection) pairs in one batch,
+    the tracks were updated with update_kalman=False
+    '''
+    if not kalman_updates:
+        return
+    tracks = [track for track, _ in kalman_updates]
+    measurements = np.asarray([det.to_xyah() for _, det in kalman_updates])
+    bank, slots = KalmanSlot.bank_slots(tracks)
+    if bank is None:
+        for track, measurement in zip(tracks, measurements):
+            track.mean, track.covariance = track.kalman_filter.update(
+                track.mean, track.covariance, measurement)
+        return
+    bank.update_slots(slots, measurements)
+
+
+def motion_gating(kf, tracks, detections):
+    '''
+    (tracks, detections) squared Mahalanobis distances of the detections to
+    the predicted track states, in one batch when the tracks share a
+    KalmanBank
+    '''
+    if not tracks or not detections:
+        return np.zeros((len(tracks), len(detections)))
+    measurements = np.asarray([det.to_xyah() for det in detections])
+    bank, slots = KalmanSlot.bank_slots(tracks)
+    if bank is None:
+        return np.array([kf.gating_distance(
+            track.mean, track.covariance, measurements, False, metric='maha')
+            for track in tracks])
+    return bank.gating_distance_slots(slots, measurements)
+
+
+def fuse_motion(kf, cost_matrix, tracks, detections, lambda_=0.98, gating_distance=None):
+    '''
+    matching.fuse_motion with the gating distances of all tracks computed
+    in one batch when they share a KalmanBank, or given (motion_gating)
+    '''
+    if cost_matrix.size == 0:
+        return cost_matrix
+    if gating_distance is None:
+        gating_distance = motion_gating(kf, tracks, detections)
+    cost_matrix[gating_distance > CHI2INV95_4] = np.inf
+    cost_matrix = lambda_ * cost_matrix + (1 - lambda_) * gating_distance
+    return cost_matrix
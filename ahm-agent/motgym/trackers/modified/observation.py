@@ -0,0 +1,107 @@
+import numpy as np
+
+
+def get_observations(galleries, feats, scores, min_iou_scores):
+    '''
+    Batched AgentSTrack.get_observation for T tracks at once. Galleries are
+    stacked into one zero padded float32 (T, N, D) tensor with a length mask
+    and compared against the detection features with a single matrix
+    multiply over normalised features. Mean and pairwise terms come from the running
+    statistics of each FeatureGallery.
+    :param galleries: T FeatureGallery
+    :param feats: (T, D) detection features
+    :param scores: T detection confidences
+    :param min_iou_scores: T min iou scores of the detections
+    :return: (T, 6) observations
+    '''
+    feats = np.asarray(feats, dtype=np.float32)
+    num_tracks, dim = feats.shape
+    lengths = np.array([len(g) for g in galleries], dtype=int)
+    stacked = np.zeros((num_tracks, lengths.max(initial=0), dim), dtype=np.float32)
+    for i, gallery in enumerate(galleries):
+        if lengths[i]:
+            stacked[i, :lengths[i]] = gallery.array()
+    mask = np.arange(stacked.shape[1]) < lengths[:, None]  # (T, N)
+    has_gallery = lengths > 0
+
+    norms = np.linalg.norm(stacked, axis=2, keepdims=True)
+    normed = stacked / np.where(norms > 0, norms, 1.)
+    feat_normed = feats / np.linalg.norm(feats, axis=1, keepdims=True)
+
+    # Max cosine similarity between detection and gallery
+    similarities = np.einsum('tnd,td->tn', normed, feat_normed)
+    max_similarity = np.where(mask, similarities, -np.inf).max(axis=1, initial=-np.inf)
+    max_similarity = np.where(has_gallery, max_similarity, 0.)
+
+    # Cosine distance between detection and gallery average
+    gallery_sums = np.zeros((num_tracks, dim))
+    for i, gallery in enumerate(galleries):
+        if lengths[i]:
+            gallery_sums[i] = gallery.feat_sum
+    sum_norms = np.linalg.norm(gallery_sums, axis=1)
+    avg_similarity = np.einsum('td,td->t', gallery_sums, feat_normed) / \
+        np.where(sum_norms > 0, sum_norms, 1.)
+    average = np.where(has_gallery, 1. - avg_similarity, 0.)
+
+    # Average pairwise cosine distance in gallery
+    average_dist = [g.average_pairwise_distance() for g in galleries]
+
+    return np.stack([
+        np.asarray(scores, dtype=float),
+        max_similarity,
+        lengths,
+        np.asarray(min_iou_scores, dtype=float),
+        average,
+        average_dist
+    ], axis=1)
+
+
+def compute_actions(tracks, observations):
+    '''
+    Gallery action of every track with an agent, one compute_actions call
+    (a single batched policy forward pass) per agent instead of a
+    compute_single_action call per track. Agents without compute_actions
+    are queried per track.
+    :param tracks: T tracks
+    :param observations: (T, 6) observations
+    :return: T actions, None for tracks without an agent
+    '''
+    actions = [None] * len(tracks)
+    by_agent = {}
+    for i, track in enumerate(tracks):
+        if track.agent:
+            by_agent.setdefault(id(track.agent), (track.agent, []))[1].append(i)
+    for agent, indices in by_agent.values():
+        if hasattr(agent, 'compute_actions'):
+            # RLlib style, observations and actions keyed by track index
+            agent_actions = agent.compute_actions({i: observations[i] for i in indices})
+            for i in indices:
+                actions[i] = agent_actions[i]
+        else:
+            for i in indices:
+                actions[i] = agent.compute_single_action(observations[i])
+    return actions
+
+
+def observe_tracks(observed, batch_actions=True):
+    '''
+    Set the observation of every (track, detection) pair updated in a frame
+    with one batched call, then let each track's agent manage its gallery.
+    With batch_actions the agents' actions are computed in one batch
+    (compute_actions) before they are applied, else per track.
+    '''
+    if not observed:
+        return
+    tracks, dets = zip(*observed)
+    observations = get_observations(
+        [track.features for track in tracks],
+        [det.curr_feat for det in dets],
+        [det.score for det in dets],
+        [det.min_iou_score for det in dets])
+    if batch_actions:
+        actions = compute_actions(tracks, observations)
+    else:
+        actions = [None] * len(tracks)
+    for track, det, obs, action in zip(tracks, dets, observations, actions):
+        track.obs = obs
+        track.agent_update_features(det.curr_feat, obs, action)
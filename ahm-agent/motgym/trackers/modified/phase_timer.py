@@ -0,0 +1,127 @@
+import random
+import time
+
+import numpy as np
+
+
+class PhaseTimer(object):
+    '''
+    Wall clock time (perf_counter_ns) of nested phases of an env step or
+    tracker update. A phase is named by its path from the outermost running
+    phase, e.g. step/next_frame/tracker.update/association, and its times
+    are kept per path until reset(). A disabled timer only checks a flag.
+
+    Phases are timed with start(name)/stop() pairs or `with timer.phase(name)`.
+    Envs share their timer with their tracker so tracker phases nest under
+    the env phase that ran the update.
+
+    Each path keeps its call count, total and max time and a uniform sample
+    of at most reservoir_size durations for the percentiles, so memory
+    stays bounded however long the timer runs between resets.
+    '''
+    reservoir_size = 1024
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stats = {}  # Path -> _PhaseStats
+        self._stack = []  # (path, start) of the running phases
+        # Own generator, sampling leaves the env's random state alone
+        self._random = random.Random(0)
+
+    def __reduce__(self):
+        # Copies (e.g. trackers in the warm start cache) are fresh timers
+        return PhaseTimer, ()
+
+    def reset(self):
+        self.stats = {}
+        self._stack = []
+
+    def start(self, name):
+        if not self.enabled:
+            return
+        path = f'{self._stack[-1][0]}/{name}' if self._stack else name
+        self._stack.append((path, time.perf_counter_ns()))
+
+    def stop(self):
+        if not self.enabled or not self._stack:
+            return
+        path, start = self._stack.pop()
+        elapsed = time.perf_counter_ns() - start
+        stats = self.stats.get(path)
+        if stats is None:
+            stats = self.stats[path] = _PhaseStats()
+        stats.calls += 1
+        stats.total += elapsed
+        if elapsed > stats.max:
+            stats.max = elapsed
+        # Reservoir sampling (algorithm R)
+        if len(stats.reservoir) < self.reservoir_size:
+            stats.reservoir.append(elapsed)
+        else:
+            i = self._random.randrange(stats.calls)
+            if i < self.reservoir_size:
+                stats.reservoir[i] = elapsed
+
+    def phase(self, name):
+        return _Phase(self, name) if self.enabled else _NO_PHASE
+
+    def summary(self):
+        '''
+        {path: stats} of the phases timed since reset(), times in ms.
+        Percentiles are estimated from the sampled durations once a path
+        ran more than reservoir_size times
+        '''
+        summary = {}
+        for path, stats in self.stats.items():
+            p50, p95, p99 = np.percentile(
+                np.asarray(stats.reservoir, dtype=float) / 1e6, [50, 95, 99])
+            summary[path] = {
+                "calls": stats.calls,
+                "total_ms": stats.total / 1e6,
+                "mean_ms": stats.total / stats.calls / 1e6,
+                "max_ms": stats.max / 1e6,
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+            }
+        return summary
+
+
+class _PhaseStats(object):
+    '''Running stats of one phase path, durations in ns'''
+    __slots__ = ('calls', 'total', 'max', 'reservoir')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.max = 0
+        self.reservoir = []
+
+
+class _Phase(object):
+    __slots__ = ('timer', 'name')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.start(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.stop()
+        return False
+
+
+class _NoPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
@@ -0,0 +1,118 @@
+import numpy as np
+
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "linear": lambda x: x,
+    None: lambda x: x,
+}
+
+
+class PolicyMLP(object):
+    '''
+    Gallery policy of a trained RLlib agent without Ray or torch, exported
+    with tools/export_policy.py to an npz of the policy network weights.
+    Implements the compute_single_action/compute_actions agent interface of
+    the trackers (see observe_tracks).
+
+    PPO/IMPALA checkpoints hold a fully connected network (fcnet_hiddens
+    with fcnet_activation) and a logits layer. DQN checkpoints hold the
+    same trunk followed by dueling advantage and value heads (relu), with
+    Q = V + A - mean(A). The value function of PPO is not exported.
+
+    Actions are greedy (argmax of logits or Q-values) unless explore is
+    set, then logits policies sample from their categorical distribution
+    and DQN is epsilon-greedy with the epsilon reached in training, as
+    RLlib's compute_single_action does by default.
+    '''
+
+    def __init__(self, weights, explore=False, seed=None):
+        self.algorithm = str(weights["algorithm"])
+        self.activation = ACTIVATIONS[str(weights["activation"])]
+        self.epsilon = float(weights.get("epsilon", 0.))
+        self.trunk = PolicyMLP._layers(weights, "trunk")
+        self.logits = PolicyMLP._layers(weights, "logits")
+        self.advantage = PolicyMLP._layers(weights, "advantage")
+        self.value = PolicyMLP._layers(weights, "value")
+        self.explore = explore
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with np.load(path) as f:
+            weights = {k: f[k] for k in f.files}
+        return cls(weights, **kwargs)
+
+    @staticmethod
+    def _layers(weights, name):
+        # (weight (out, in), bias) pairs stored as <name>_<i>_w/_b
+        layers = []
+        while f'{name}_{len(layers)}_w' in weights:
+            i = len(layers)
+            layers.append((np.asarray(weights[f'{name}_{i}_w'], dtype=np.float32),
+                           np.asarray(weights[f'{name}_{i}_b'], dtype=np.float32)))
+        return layers
+
+    @staticmethod
+    def _dense(x, layers, activation):
+        # Every layer but the last of a head is followed by the activation
+        for i, (w, b) in enumerate(layers):
+            x = x @ w.T + b
+            if i < len(layers) - 1:
+                x = activation(x)
+        return x
+
+    def action_scores(self, obs):
+        '''(N, actions) logits or Q-values of (N, obs) observations'''
+        x = np.asarray(obs, dtype=np.float32).reshape(len(obs), -1)
+        for w, b in self.trunk:
+            x = self.activation(x @ w.T + b)
+        if self.logits:
+            return PolicyMLP._dense(x, self.logits, self.activation)
+        relu = ACTIVATIONS["relu"]
+        advantage = PolicyMLP._dense(x, self.advantage, relu)
+        if not self.value:
+            return advantage
+        value = PolicyMLP._dense(x, self.value, relu)
+        return value + advantage - advantage.mean(axis=1, keepdims=True)
+
+    def _select(self, scores):
+        actions = scores.argmax(axis=1)
+        if not self.explore:
+            return actions
+        if self.algorithm != 'dqn':
+            # Sample from softmax(logits), Gumbel-max trick
+            return (scores + self.rng.gumbel(size=scores.shape)).argmax(axis=1)
+        random_actions = self.rng.integers(0, scores.shape[1], len(scores))
+        return np.where(self.rng.random(len(scores)) < self.epsilon, random_actions, actions)
+
+    def compute_single_action(self, obs):
+        return int(self._select(self.action_scores(np.asarray(obs)[None]))[0])
+
+    def compute_actions(self, observations):
+        '''Actions for a dict of observations, keyed as RLlib does'''
+        keys = list(observations)
+        if not keys:
+            return {}
+        actions = self._select(self.action_scores(np.stack([observations[k] for k in keys])))
+        return {k: int(a) for k, a in zip(keys, actions)}
+
+
+def export_weights(state_dict, algorithm, activation, epsilon=0.):
+    '''
+    npz contents for PolicyMLP from the numpy state_dict of an RLlib torch
+    FullyConnectedNetwork (PPO/IMPALA) or DQNTorchModel policy model
+    '''
+    def layer_keys(prefix):
+        # Linear layers of SlimFC modules under prefix, in module order
+        return [k[:-len('.weight')] for k in state_dict
+                if k.startswith(prefix) and k.endswith('._model.0.weight')]
+
+    weights = {"algorithm": algorithm, "activation": activation, "epsilon": epsilon}
+    heads = {"trunk": layer_keys('_hidden_layers.'), "logits": layer_keys('_logits.'),
+             "advantage": layer_keys('advantage_module.'), "value": layer_keys('value_module.')}
+    for name, keys in heads.items():
+        for i, key in enumerate(keys):
+            weights[f'{name}_{i}_w'] = state_dict[key + '.weight']
+            weights[f'{name}_{i}_b'] = state_dict[key + '.bias']
+    return weights
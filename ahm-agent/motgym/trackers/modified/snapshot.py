@@ -0,0 +1,74 @@
+import numpy as np
+
+from .kalman_bank import KalmanBank
+
+
+class TrackerSnapshot(object):
+    '''
+    Compact copy of the mutable state of a training tracker, used to roll
+    the tracker back after simulating future frames (look-ahead rewards).
+
+    Kalman means/covariances are held in contiguous arrays indexed by track
+    slot, per-track scalars in a columnar track table. The Kalman bank
+    allocation is restored too, which releases the slots of tracks created
+    after the snapshot and takes back those released since.
+    Galleries are not copied, they are shared with the live tracks and
+    copied on first write (see AgentSTrack.share_gallery).
+    '''
+
+    def __init__(self, tracker, track_count):
+        self.track_count = track_count
+        self.tracked_stracks = list(tracker.tracked_stracks)
+        self.lost_stracks = list(tracker.lost_stracks)
+        self.num_removed = len(tracker.removed_stracks)
+        bank = tracker.kalman_filter
+        self.bank_state = bank.state() if isinstance(bank, KalmanBank) else None
+
+        # Slot i of every column refers to self.tracks[i]
+        self.tracks = self.tracked_stracks + self.lost_stracks
+        n = len(self.tracks)
+        self.means = np.empty((n, 8), dtype=float)
+        self.covariances = np.empty((n, 8, 8), dtype=float)
+        for i, t in enumerate(self.tracks):
+            self.means[i] = t.mean
+            self.covariances[i] = t.covariance
+
+        self.states = np.array([t.state for t in self.tracks], dtype=int)
+        self.is_activated = np.array(
+            [t.is_activated for t in self.tracks], dtype=bool)
+        self.frame_ids = np.array([t.frame_id for t in self.tracks], dtype=int)
+        self.det_indices = np.array([t.det_index for t in self.tracks], dtype=int)
+        self.tracklet_lens = np.array(
+            [t.tracklet_len for t in self.tracks], dtype=int)
+        self.track_ids = np.array([t.track_id for t in self.tracks], dtype=int)
+
+        # Arrays below are replaced (never written in place) by the tracker
+        self.obs = [t.obs for t in self.tracks]
+        self.curr_feats = [t.curr_feat for t in self.tracks]
+        self.galleries = [t.share_gallery() for t in self.tracks]
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def restore(self, tracker):
+        # Copy once so the same snapshot can be restored more than once
+        means = self.means.copy()
+        covariances = self.covariances.copy()
+        for i, t in enumerate(self.tracks):
+            t.mean = means[i]
+            t.covariance = covariances[i]
+            t.state = int(self.states[i])
+            t.is_activated = bool(self.is_activated[i])
+            t.frame_id = int(self.frame_ids[i])
+            t.det_index = int(self.det_indices[i])
+            t.tracklet_len = int(self.tracklet_lens[i])
+            t.track_id = int(self.track_ids[i])
+            t.obs = self.obs[i]
+            t.curr_feat = self.curr_feats[i]
+            t.restore_gallery(self.galleries[i])
+
+        tracker.tracked_stracks = list(self.tracked_stracks)
+        tracker.lost_stracks = list(self.lost_stracks)
+        del tracker.removed_stracks[self.num_removed:]
+        if self.bank_state is not None:
+            tracker.kalman_filter.restore(self.bank_state)
@@ -0,0 +1,76 @@
+'''
+Per-step cost of the gallery terms of the agent observation against gallery
+size: full n x n cosine matrix (previous average_gallery_distance) vs the
+running statistics of FeatureGallery. One step is an append followed by an
+observation. Run from ahm-agent/:
+    python tools/bench_gallery_stats.py
+'''
+import time
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+import motgym
+from modified.gallery import FeatureGallery
+
+SIZES = [1, 2, 5, 10, 20, 50, 100, 200, 300, 400, 500]
+DIM = 128
+
+
+def full_observation(features, feat):
+    '''Previous AgentSTrack.get_observation gallery terms'''
+    feats = np.asarray(features)
+    similarity = np.max(1. - cdist([feat], feats, 'cosine'))
+    average = cdist([np.average(feats, axis=0)], [feat], 'cosine').item()
+    average_dist = 0.
+    n = len(features)
+    if n > 2:
+        pairwise_dists = np.tril(cdist(feats, feats, 'cosine'), -1)
+        average_dist = np.sum(pairwise_dists) / ((n - 1) * n / 2)
+    return similarity, average, average_dist
+
+
+def stats_observation(gallery, feat):
+    similarity = np.max(gallery.similarities(feat))
+    return similarity, gallery.mean_distance(feat), gallery.average_pairwise_distance()
+
+
+def time_steps(step, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        step()
+    return (time.perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f'{"size":>5} {"full (ms)":>10} {"stats (ms)":>11} {"speedup":>8} {"max diff":>9}')
+    for size in SIZES:
+        feats = rng.normal(size=(size + 1, DIM)).astype(np.float32)
+        feats /= np.linalg.norm(feats, axis=1, keepdims=True)
+        features = list(feats[:size])
+        gallery = FeatureGallery()
+        for f in features:
+            gallery.append(f)
+        new_feat = feats[size]
+        repeats = max(10, 2000 // size)
+
+        def full_step():
+            features.append(new_feat)
+            full_observation(features, new_feat)
+            features.pop()
+
+        def stats_step():
+            gallery.append(new_feat)
+            stats_observation(gallery, new_feat)
+            gallery.pop()
+
+        full_time = time_steps(full_step, repeats)
+        stats_time = time_steps(stats_step, repeats)
+
+        gallery.append(new_feat)
+        features.append(new_feat)
+        max_diff = np.max(np.abs(np.subtract(
+            full_observation(features, new_feat), stats_observation(gallery, new_feat))))
+        print(f'{size:>5} {full_time * 1e3:>10.3f} {stats_time * 1e3:>11.3f} '
+              f'{full_time / stats_time:>7.1f}x {max_diff:>9.1e}')
@@ -0,0 +1,69 @@
+'''
+Micro-benchmark of the vectorised get_min_iou_scores against the previous
+per-detection loop over the MOT17 and MOT20 detection caches.
+Run from ahm-agent/:
+    python tools/bench_min_iou.py
+'''
+import os
+import os.path as osp
+import time
+
+import numpy as np
+
+import motgym
+import motgym.trackers.FairMOT.src._init_paths
+from tracker import matching
+from modified.bbox import get_min_iou_scores
+from motgym.envs.base_env import BasicMotEnv
+from motgym.envs.utils.det_store import has_store, load_store
+
+
+def loop_min_iou_scores(dets):
+    '''Previous implementation, one iou_distance call per detection'''
+    min_iou_scores = []
+    n_dets = dets.shape[0]
+    for idx in range(n_dets):
+        mask = np.ones((n_dets,), dtype=bool)
+        mask[idx] = False
+        neighbours_dets = dets[mask, :]
+        ious = matching.iou_distance(np.expand_dims(
+            dets[idx, :], axis=0), neighbours_dets)
+        min_iou_scores.append(np.min(ious))
+    return min_iou_scores
+
+
+def load_frames(seq_dir):
+    if has_store(seq_dir):
+        dets, _ = load_store(seq_dir)
+        return [dets[f] for f in range(len(dets))]
+    with np.load(osp.join(seq_dir, 'dets.npz')) as dets:
+        return [dets[k] for k in dets.files]
+
+
+def run_benchmark(detections):
+    dets_dir = osp.join(BasicMotEnv._get_gym_path(), 'detections', detections)
+    frames = []
+    for seq in sorted(os.listdir(dets_dir)):
+        frames.extend(f[:, :4] for f in load_frames(osp.join(dets_dir, seq)) if len(f) > 1)
+
+    loop_time, vec_time, max_err = 0., 0., 0.
+    for dets in frames:
+        start = time.perf_counter()
+        expected = loop_min_iou_scores(dets)
+        mid = time.perf_counter()
+        scores = get_min_iou_scores(dets)
+        end = time.perf_counter()
+        loop_time += mid - start
+        vec_time += end - mid
+        max_err = max(max_err, np.max(np.abs(np.subtract(expected, scores))))
+
+    mean_dets = np.mean([len(d) for d in frames])
+    print(f'{detections}: {len(frames)} frames, {mean_dets:.1f} dets/frame, max abs diff {max_err:.2e}')
+    print(f'  loop {loop_time / len(frames) * 1e3:.3f} ms/frame, '
+          f'vectorised {vec_time / len(frames) * 1e3:.3f} ms/frame '
+          f'({loop_time / vec_time:.1f}x)')
+
+
+if __name__ == "__main__":
+    run_benchmark('FairMOT/MOT17/train_half')
+    run_benchmark('FairMOT/MOT20/train_half')
@@ -0,0 +1,70 @@
+'''
+Startup time and per-call latency of the evaluation trackers' agent:
+an RLlib trainer restored from a checkpoint against the same policy
+exported with tools/export_policy.py and loaded as PolicyMLP. Startup is
+timed in a fresh interpreter, imports included. Latency is per
+compute_single_action call and per batched compute_actions call.
+Run from ahm-agent/:
+    python tools/bench_policy.py fairmot|jde <checkpoint> <exported.npz>
+'''
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import motgym
+import motgym.trackers.FairMOT.src._init_paths
+from modified.policy import PolicyMLP
+
+from export_policy import build_trainer, random_observations
+
+NUM_CALLS = 200
+BATCH_SIZE = 40  # Tracks updated in a busy MOT17 frame
+
+STARTUP = '''
+import time
+start = time.perf_counter()
+import sys
+sys.path.insert(0, 'tools')
+{}
+print(time.perf_counter() - start)
+'''
+TRAINER_STARTUP = STARTUP.format(
+    'from export_policy import build_trainer; build_trainer({!r}, {!r})')
+POLICY_STARTUP = STARTUP.format(
+    'import motgym, motgym.trackers.FairMOT.src._init_paths\n'
+    'from modified.policy import PolicyMLP; PolicyMLP.load({!r})')
+
+
+def startup_time(code):
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def latency(agent, obs):
+    start = time.perf_counter()
+    for o in obs:
+        agent.compute_single_action(o)
+    single = (time.perf_counter() - start) / len(obs)
+    batches = [dict(enumerate(obs[i:i + BATCH_SIZE])) for i in range(0, len(obs), BATCH_SIZE)]
+    start = time.perf_counter()
+    for batch in batches:
+        agent.compute_actions(batch)
+    batched = (time.perf_counter() - start) / len(batches)
+    return single, batched
+
+
+if __name__ == "__main__":
+    tracker, checkpoint, exported = sys.argv[1:4]
+    obs = random_observations(np.random.default_rng(0), NUM_CALLS)
+    agents = {
+        'RLlib trainer': (TRAINER_STARTUP.format(tracker, checkpoint),
+                          build_trainer(tracker, checkpoint)),
+        'PolicyMLP': (POLICY_STARTUP.format(exported), PolicyMLP.load(exported)),
+    }
+    for name, (code, agent) in agents.items():
+        single, batched = latency(agent, obs)
+        print(f'{name:13s}: startup {startup_time(code):6.2f} s, '
+              f'single {single * 1e6:8.1f} us/call, '
+              f'batch of {BATCH_SIZE} {batched * 1e6:8.1f} us/call')
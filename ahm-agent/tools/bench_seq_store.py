@@ -0,0 +1,88 @@
+'''
+Memory and cold-start time of loading one sequence (ground truth index,
+image list, detections and features) in N concurrent worker processes,
+with the memory-mapped sequence store against private copies. Memory is
+the summed proportional set size (Pss) of the workers, so pages shared
+between them are only counted once. Linux only (reads /proc).
+Run from ahm-agent/:
+    python tools/bench_seq_store.py [num_workers ...]
+'''
+import multiprocessing as mp
+import os
+import os.path as osp
+import sys
+import time
+
+import numpy as np
+
+import motgym
+from motgym.envs.base_env import BasicMotEnv
+from motgym.envs.utils.det_store import load_or_convert
+from motgym.envs.utils.gt_index import GroundTruthIndex
+from motgym.envs.utils.seq_store import ImageList
+
+DATASET = 'MOT17/train_half'
+DETECTIONS = 'FairMOT/MOT17/train_half'
+SEQ = 'MOT17-04'
+
+
+def pss_kb():
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1])
+    return 0
+
+
+def load_sequence(shared):
+    gym_path = BasicMotEnv._get_gym_path()
+    seq_path = osp.join(gym_path, 'datasets', DATASET, SEQ)
+    gt_filename = osp.join(seq_path, 'gt', 'gt.txt')
+    img1_path = osp.join(seq_path, 'img1')
+    dets, feats = load_or_convert(osp.join(gym_path, 'detections', DETECTIONS, SEQ))
+    if shared:
+        gt_index = GroundTruthIndex.load(gt_filename)
+        images = ImageList(img1_path)
+        arrays = [dets.array, feats.array]
+    else:
+        gt_index = GroundTruthIndex.from_file(gt_filename)
+        images = sorted(osp.join(img1_path, x) for x in os.listdir(img1_path))
+        arrays = [np.array(dets.array), np.array(feats.array)]
+    # Touch every page like an episode over the whole sequence would
+    for array in arrays + [getattr(gt_index, f) for f in gt_index.fields]:
+        np.sum(array)
+    return (gt_index, images, arrays)
+
+
+def worker(shared, barrier, queue):
+    start = time.perf_counter()
+    data = load_sequence(shared)
+    load_time = time.perf_counter() - start
+    barrier.wait()  # All workers loaded, measure while every copy is alive
+    queue.put((load_time, pss_kb()))
+    barrier.wait()
+
+
+def run(num_workers, shared):
+    barrier = mp.Barrier(num_workers)
+    queue = mp.Queue()
+    procs = [mp.Process(target=worker, args=(shared, barrier, queue))
+             for _ in range(num_workers)]
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    load_time = max(r[0] for r in results)
+    total_mb = sum(r[1] for r in results) / 1024
+    label = 'shared ' if shared else 'private'
+    print(f'{label} workers={num_workers:2d}  total Pss {total_mb:8.1f} MB  '
+          f'slowest load {load_time * 1e3:7.1f} ms')
+
+
+if __name__ == "__main__":
+    worker_counts = [int(n) for n in sys.argv[1:]] or [1, 2, 4, 8]
+    load_sequence(True)  # Build the caches once, cold start is measured per worker
+    for num_workers in worker_counts:
+        run(num_workers, shared=False)
+        run(num_workers, shared=True)
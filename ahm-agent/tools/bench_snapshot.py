@@ -0,0 +1,72 @@
+'''
+Compare the cost of freezing/restoring the tracker for look-ahead rewards
+using deepcopy (previous ParallelFairmotEnv._evaluate) against the tracker
+snapshot()/restore() API. Run from ahm-agent/:
+    python tools/bench_snapshot.py
+'''
+import copy
+import time
+
+import gym
+import numpy as np
+
+
+def deepcopy_freeze(tracker):
+    frozen = (tracker.tracked_stracks, tracker.lost_stracks,
+              tracker.removed_stracks, tracker.kalman_filter)
+    tracker.tracked_stracks = copy.deepcopy(frozen[0])
+    tracker.lost_stracks = copy.deepcopy(frozen[1])
+    tracker.removed_stracks = copy.deepcopy(frozen[2])
+    tracker.kalman_filter = copy.deepcopy(frozen[3])
+    return frozen
+
+
+def deepcopy_restore(tracker, frozen):
+    tracker.tracked_stracks, tracker.lost_stracks, \
+        tracker.removed_stracks, tracker.kalman_filter = frozen
+
+
+def lookahead(env, num_frames):
+    frame_id = env.frame_id
+    eval_frame_id = min(env.seq_len - 1, frame_id + num_frames)
+    while frame_id < eval_frame_id:
+        frame_id += 1
+        env._track_update(frame_id)
+
+
+def time_path(env, freeze, restore, num_frames, repeats):
+    freeze_times, total_times = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        state = freeze(env.tracker)
+        freeze_times.append(time.perf_counter() - start)
+        lookahead(env, num_frames)
+        restore(env.tracker, state)
+        total_times.append(time.perf_counter() - start)
+    return np.mean(freeze_times) * 1e3, np.mean(total_times) * 1e3
+
+
+def run_benchmark(env_id="motgym:FairMOT/Mot17ParallelEnv-v0", warmup_frames=100, repeats=20):
+    env = gym.make(env_id).unwrapped
+    env.reset()
+    for _ in range(warmup_frames):
+        env._step_frame()
+
+    num_frames = int(env.frame_rate * 0.2)
+    num_tracks = len(env.tracker.tracked_stracks) + len(env.tracker.lost_stracks)
+    print(f'{env.seq} frame {env.frame_id}: {num_tracks} live tracks, '
+          f'{len(env.tracker.removed_stracks)} removed, look-ahead {num_frames} frames')
+
+    dc_freeze, dc_total = time_path(
+        env, deepcopy_freeze, deepcopy_restore, num_frames, repeats)
+    snap_freeze, snap_total = time_path(
+        env, lambda t: t.snapshot(), lambda t, s: t.restore(s), num_frames, repeats)
+
+    print(f'deepcopy: freeze {dc_freeze:.2f} ms, look-ahead {dc_total:.2f} ms')
+    print(f'snapshot: freeze {snap_freeze:.2f} ms, look-ahead {snap_total:.2f} ms')
+    print(f'Look-ahead speedup: {dc_total / snap_total:.1f}x')
+
+
+if __name__ == "__main__":
+    run_benchmark()
+    run_benchmark("motgym:JDE/Mot17ParallelEnv-v0")
@@ -0,0 +1,82 @@
+'''
+Memory traced with tracemalloc while the training trackers run over a
+sequence: detections built as one AgentSTrack per detection (previous
+tracker update) against slotted Detection rows of the frame arrays, the
+traced peak of a whole tracker update and the retained size of a track.
+Run from ahm-agent/:
+    python tools/bench_track_alloc.py
+'''
+import sys
+import time
+import tracemalloc
+
+import gym
+import numpy as np
+
+import motgym
+import motgym.trackers.FairMOT.src._init_paths
+from modified.detection import frame_detections
+
+
+def traced(fn, *args):
+    '''(result, bytes still allocated by fn, peak bytes) with only fn traced'''
+    tracemalloc.start()
+    result = fn(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def split_frame(env, frame_id):
+    '''(tlbrs, scores, feats) rows of a frame as the env's tracker reads them'''
+    dets = env.detections[str(frame_id)]
+    if env.features is not None:
+        return dets[:, :4], dets[:, 4], env.features[str(frame_id)]
+    return dets[:, :4], dets[:, 4], np.asarray(dets[:, 6:], dtype=float)
+
+
+def track_detections(track_cls, tlbrs, scores, feats):
+    return [track_cls(track_cls.tlbr_to_tlwh(tlbr), score, f, 1.)
+            for tlbr, score, f in zip(tlbrs, scores, feats)]
+
+
+def row_detections(tlbrs, scores, feats):
+    return frame_detections(tlbrs, scores, feats, np.ones(len(tlbrs)))
+
+
+def run_benchmark(env_id="motgym:FairMOT/Mot17ParallelEnv-v0", num_frames=300):
+    env = gym.make(env_id).unwrapped
+    env.reset()
+    track_cls = sys.modules[type(env.tracker).__module__].AgentSTrack
+    frames = range(env.frame_id + 1, min(env.seq_len, env.frame_id + num_frames))
+
+    totals = np.zeros(4)
+    num_dets = 0
+    for frame_id in frames:
+        rows = split_frame(env, frame_id)
+        num_dets += len(rows[0])
+        _, tracks_mem, tracks_peak = traced(track_detections, track_cls, *rows)
+        _, rows_mem, rows_peak = traced(row_detections, *rows)
+        totals += [tracks_mem, tracks_peak, rows_mem, rows_peak]
+    totals /= max(num_dets, 1)
+    print(f'{env.seq}: {len(frames)} frames, {num_dets / len(frames):.1f} detections/frame')
+    print(f'AgentSTrack detections: {totals[0]:7.0f} B retained, {totals[1]:7.0f} B peak per detection')
+    print(f'Detection rows:         {totals[2]:7.0f} B retained, {totals[3]:7.0f} B peak per detection')
+
+    peaks, times = [], []
+    for frame_id in frames:
+        start = time.perf_counter()
+        _, _, peak = traced(env._track_update, frame_id)
+        times.append(time.perf_counter() - start)
+        peaks.append(peak)
+    live = env.tracker.tracked_stracks + env.tracker.lost_stracks
+    print(f'Tracker update: {np.mean(peaks) / 1024:.1f} KiB mean peak, '
+          f'{np.max(peaks) / 1024:.1f} KiB max peak, {np.mean(times) * 1e3:.2f} ms (traced)')
+    if live:
+        # Attributes live in __slots__, the inherited __dict__ stays empty
+        print(f'{len(live)} live tracks, {len(vars(live[0]))} __dict__ entries per track')
+
+
+if __name__ == "__main__":
+    run_benchmark()
+    run_benchmark("motgym:JDE/Mot17ParallelEnv-v0")
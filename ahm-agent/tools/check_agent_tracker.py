@@ -0,0 +1,122 @@
+'''
+Run the update of an evaluation tracker (AgentJDETracker of FairMOT or
+AgentJdeTracker of JDE) on synthetic detections fed in place of the network
+forward (detect). Objects move at constant velocity, enter and leave the
+sequence and are missed for a few frames, so tracks are created, lost and
+re-activated. Runs without an agent and with a random agent managing the
+galleries, and checks that every track matched in a frame records the row
+and embedding of its detection (det_index, curr_feat). One tracker per
+process, as both import their own `models`. Run from ahm-agent/:
+    python tools/check_agent_tracker.py [FairMOT|JDE] [frames]
+'''
+import argparse
+import random
+import sys
+
+import numpy as np
+
+import motgym
+
+NUM_OBJECTS = 15
+
+
+def synthetic_frames(num_frames, feat_dim, seed=0):
+    '''Per frame (N, 4) tlbr, (N,) scores and (N, feat_dim) unit embeddings'''
+    rng = np.random.default_rng(seed)
+    spans = np.sort(rng.integers(1, num_frames + 1, (NUM_OBJECTS, 2)), axis=1)
+    spans[:NUM_OBJECTS // 3, 0] = 1  # Some objects from the first frame
+    gaps = rng.integers(1, num_frames + 1, NUM_OBJECTS)  # First missed frame
+    tl = rng.uniform(0, 1500, (NUM_OBJECTS, 2))
+    vel = rng.normal(0, 3, (NUM_OBJECTS, 2))
+    wh = rng.uniform(60, 200, NUM_OBJECTS)[:, None] * [0.4, 1.]
+    identities = rng.normal(0, 1, (NUM_OBJECTS, feat_dim))
+
+    frames = []
+    for frame_id in range(1, num_frames + 1):
+        visible = (spans[:, 0] <= frame_id) & (spans[:, 1] >= frame_id) & \
+            ((frame_id < gaps) | (frame_id >= gaps + 5))
+        idx = np.flatnonzero(visible)
+        box_tl = tl[idx] + vel[idx] * frame_id + rng.normal(0, 2, (len(idx), 2))
+        tlbrs = np.c_[box_tl, box_tl + wh[idx]].astype(np.float32)
+        scores = rng.uniform(0.6, 1., len(idx)).astype(np.float32)
+        feats = identities[idx] + rng.normal(0, 0.3, (len(idx), feat_dim))
+        feats = (feats / np.linalg.norm(feats, axis=1, keepdims=True)).astype(np.float32)
+        frames.append((tlbrs, scores, feats))
+    return frames
+
+
+def fairmot_trackers(frames):
+    import motgym.trackers.FairMOT.src._init_paths
+    from FairMOT.src.lib.opts import opts
+    from modified.fairmot_agent import AgentJDETracker
+    from modified.fairmot_train import TrainAgentJDETracker
+
+    class SyntheticTracker(AgentJDETracker):
+        '''AgentJDETracker without a network, detections come from frames'''
+
+        def __init__(self, opt, agent_path=None):
+            TrainAgentJDETracker.__init__(self, opt)
+            self.frame_id = 0
+            self.agent = self.build_agent(agent_path)
+
+        def detect(self, im_blob, img0):
+            tlbrs, scores, feats = frames[self.frame_id - 1]
+            return np.c_[tlbrs, scores], feats
+
+    return SyntheticTracker, opts().init(['mot'])
+
+
+def jde_trackers(frames):
+    from modified.jde_agent import AgentJdeTracker
+    from modified.jde_train import TrainAgentJdeTracker
+
+    class SyntheticTracker(AgentJdeTracker):
+        '''AgentJdeTracker without a network, detections come from frames'''
+
+        def __init__(self, opt, agent_path=None):
+            TrainAgentJdeTracker.__init__(self, opt)
+            self.agent = self.build_agent(agent_path)
+
+        def detect(self, im_blob, img0):
+            # Layout of the cached detections, 0:4 tlbr, 4 score, 5 class, 6: embedding
+            tlbrs, scores, feats = frames[self.frame_id - 1]
+            return np.c_[tlbrs, scores, np.zeros(len(scores), np.float32), feats]
+
+    opt = argparse.Namespace(conf_thres=0.5, nms_thres=0.4, min_box_area=200, track_buffer=30)
+    return SyntheticTracker, opt
+
+
+def check(name, num_frames):
+    from tracker.basetrack import BaseTrack
+
+    feat_dim = 128 if name == 'FairMOT' else 512
+    frames = synthetic_frames(num_frames, feat_dim)
+    build = fairmot_trackers if name == 'FairMOT' else jde_trackers
+    tracker_cls, opt = build(frames)
+
+    for agent_path in [None, 'random']:
+        random.seed(0)
+        BaseTrack._count = 0
+        tracker = tracker_cls(opt, agent_path)
+        seen, refound, gallery_sizes = set(), 0, []
+        for frame_id in range(1, num_frames + 1):
+            outputs = tracker.update(None, None)
+            _, _, feats = frames[frame_id - 1]
+            for track in outputs:
+                if track.frame_id == frame_id:
+                    assert 0 <= track.det_index < len(feats), (frame_id, track.track_id)
+                    assert np.allclose(track.curr_feat, feats[track.det_index])
+                if track.track_id not in seen:
+                    seen.add(track.track_id)
+                elif track.tracklet_len == 0:  # Re-activated this frame
+                    refound += 1
+                gallery_sizes.append(len(track.features))
+        assert refound, 'no track was re-activated, re_activate is not covered'
+        print(f'{name} {agent_path or "no agent"}: {num_frames} frames, {len(seen)} tracks, '
+              f'{refound} re-activations, mean gallery size {np.mean(gallery_sizes):.1f}')
+
+
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else 'FairMOT'
+    num_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    check(name, num_frames)
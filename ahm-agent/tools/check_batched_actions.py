@@ -0,0 +1,106 @@
+'''
+Check that observe_tracks gives the same observations, actions and
+galleries with the agent's actions computed in one batch (compute_actions,
+as the evaluation trackers do) as with compute_single_action per track,
+and time both. Uses a restored RLlib checkpoint with exploration disabled,
+or a fixed linear policy without one.
+Run from ahm-agent/:
+    python tools/check_batched_actions.py [checkpoint]
+'''
+import copy
+import sys
+import time
+
+import numpy as np
+
+import motgym
+import motgym.trackers.FairMOT.src._init_paths
+from modified.fairmot_agent import AgentJDETracker
+from modified.fairmot_train import AgentSTrack
+from modified.detection import frame_detections
+from modified.observation import observe_tracks
+
+NUM_FRAMES = 20
+FEAT_DIM = 128
+
+
+class LinearAgent:
+    '''Deterministic stand-in policy, action 1 if w.obs > 0'''
+
+    def __init__(self, seed=0):
+        self.w = np.random.default_rng(seed).normal(size=6)
+
+    def compute_single_action(self, obs):
+        return int(obs @ self.w > 0)
+
+    def compute_actions(self, observations):
+        return {k: int(obs @ self.w > 0) for k, obs in observations.items()}
+
+
+class GreedyTrainer:
+    '''RLlib trainer with exploration disabled, so both paths are deterministic'''
+
+    def __init__(self, trainer):
+        self.trainer = trainer
+
+    def compute_single_action(self, obs):
+        return self.trainer.compute_single_action(obs, explore=False)
+
+    def compute_actions(self, observations):
+        return self.trainer.compute_actions(observations, explore=False)
+
+
+def random_tracks(rng, num_tracks, agent):
+    tracks = []
+    for _ in range(num_tracks):
+        feat = rng.normal(size=FEAT_DIM).astype(np.float32)
+        track = AgentSTrack(rng.uniform(10, 200, 4), 1., feat, 1., agent=agent)
+        for _ in range(rng.integers(0, 10)):
+            track.update_gallery(1, feat + rng.normal(size=FEAT_DIM).astype(np.float32))
+        tracks.append(track)
+    return tracks
+
+
+def random_detections(rng, num_tracks):
+    tlbrs = rng.uniform(0, 1000, (num_tracks, 4)).astype(np.float32)
+    tlbrs[:, 2:] += tlbrs[:, :2]
+    return frame_detections(
+        tlbrs, rng.uniform(0.4, 1, num_tracks).astype(np.float32),
+        rng.normal(size=(num_tracks, FEAT_DIM)).astype(np.float32),
+        rng.uniform(0, 1, num_tracks))
+
+
+def run(agent, num_tracks, seed=0):
+    rng = np.random.default_rng(seed)
+    batched = random_tracks(rng, num_tracks, agent)
+    single = copy.deepcopy(batched, memo={id(agent): agent})
+
+    batch_time, single_time, num_actions = 0., 0., 0
+    for _ in range(NUM_FRAMES):
+        dets = random_detections(rng, num_tracks)
+        dets_copy = copy.deepcopy(dets)
+        start = time.perf_counter()
+        observe_tracks(list(zip(batched, dets)), batch_actions=True)
+        mid = time.perf_counter()
+        observe_tracks(list(zip(single, dets_copy)), batch_actions=False)
+        single_time += time.perf_counter() - mid
+        batch_time += mid - start
+
+        for b, s in zip(batched, single):
+            assert np.array_equal(b.obs, s.obs)
+            assert len(b.features) == len(s.features)
+            assert np.allclose(b.smooth_feat, s.smooth_feat)
+        num_actions += num_tracks
+
+    print(f'{num_tracks:3d} tracks: galleries match over {num_actions} actions, '
+          f'per-track {single_time / NUM_FRAMES * 1e3:7.2f} ms/frame, '
+          f'batched {batch_time / NUM_FRAMES * 1e3:7.2f} ms/frame')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        agent = GreedyTrainer(AgentJDETracker.build_agent(None, sys.argv[1]))
+    else:
+        agent = LinearAgent()
+    for num_tracks in [5, 20, 60]:
+        run(agent, num_tracks)
@@ -0,0 +1,102 @@
+'''
+Parity check and benchmark of the batched custom_embedding_distance (the
+lookup gallery association of ParallelFairmotEnv) against the previous
+per-track, per-detection loop. Tracks get galleries of 0 to 60 features
+from earlier frames of dense MOT20 sequences and are matched against the
+detections of a later frame. Run from ahm-agent/:
+    python tools/check_embedding_distance.py
+'''
+import os
+import os.path as osp
+import time
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+import motgym
+from modified.fairmot_train import AgentSTrack, custom_embedding_distance
+from motgym.envs.base_env import BasicMotEnv
+from motgym.envs.utils.det_store import has_store, load_store
+
+N = 10  # lookup_gallery of ParallelFairmotEnv
+DETS_DIR = osp.join(BasicMotEnv._get_gym_path(), 'detections', 'FairMOT', 'MOT20', 'train_half')
+
+
+def loop_embedding_distance(n, tracks, detections, metric='cosine'):
+    '''Previous implementation'''
+    cost_matrix = np.zeros((len(tracks), len(detections)), dtype=float)
+    if cost_matrix.size == 0:
+        return cost_matrix
+    det_features = np.asarray(
+        [track.curr_feat for track in detections], dtype=float)
+    num_dets = len(detections)
+    track_features = []
+    for track in tracks:
+        feats = np.asarray(track.features.array())
+        if len(track.features) > n:
+            gallery_cost_matrix = cdist(feats, det_features, metric)
+            min_row_idxs = np.argpartition(
+                gallery_cost_matrix, n, axis=0)[:n].T
+            smooth_feat_vs_det = np.zeros((num_dets, feats.shape[1]))
+            for det_n in range(num_dets):
+                best_n_feats = feats[min_row_idxs[det_n], :]
+                smooth_feat_vs_det[det_n, :] = np.average(best_n_feats, axis=0)
+        elif track.features:
+            smooth_feat_vs_det = np.tile(np.average(feats, axis=0), (num_dets, 1))
+        else:
+            smooth_feat_vs_det = np.tile(track.smooth_feat, (num_dets, 1))
+        track_features.append(smooth_feat_vs_det)
+
+    for det_n in range(num_dets):
+        track_features_vs_det = [track_features[t][det_n] for t in range(len(tracks))]
+        cost_col = cdist(track_features_vs_det, [det_features[det_n]], metric)
+        cost_matrix[:, det_n] = cost_col.flatten()
+    return np.maximum(0.0, cost_matrix)
+
+
+def make_tracks(feats, num_tracks, rng):
+    tracks = []
+    for _ in range(num_tracks):
+        track = AgentSTrack([0, 0, 1, 1], 1., feats[rng.integers(len(feats))].copy(), 1.)
+        for row in rng.choice(len(feats), size=rng.integers(0, 61)):
+            track.update_gallery(1, feats[row].copy())
+        tracks.append(track)
+    return tracks
+
+
+def sequence_frames():
+    '''(gallery features, detection features) per MOT20 sequence'''
+    if osp.isdir(DETS_DIR):
+        for seq in sorted(os.listdir(DETS_DIR)):
+            seq_dir = osp.join(DETS_DIR, seq)
+            if not has_store(seq_dir):
+                continue
+            _, feats = load_store(seq_dir)
+            if feats is None or len(feats) < 2:
+                continue
+            last = len(feats) - 1
+            yield seq, feats.array[:feats.offsets[last]], feats[last]
+        return
+    print('MOT20 features not found, using random features')
+    rng = np.random.default_rng(0)
+    yield 'random', rng.normal(size=(5000, 128)).astype(np.float32), \
+        rng.normal(size=(200, 128)).astype(np.float32)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    for seq, gallery_feats, frame_feats in sequence_frames():
+        tracks = make_tracks(np.asarray(gallery_feats), len(frame_feats), rng)
+        detections = [AgentSTrack([0, 0, 1, 1], 1., f.copy(), 1.) for f in frame_feats]
+
+        start = time.perf_counter()
+        expected = loop_embedding_distance(N, tracks, detections)
+        mid = time.perf_counter()
+        dists = custom_embedding_distance(N, tracks, detections)
+        end = time.perf_counter()
+
+        max_err = np.max(np.abs(expected - dists))
+        print(f'{seq}: {len(tracks)} tracks x {len(detections)} dets, max abs diff {max_err:.2e}, '
+              f'loop {(mid - start) * 1e3:.1f} ms, batched {(end - mid) * 1e3:.1f} ms '
+              f'({(mid - start) / (end - mid):.1f}x)')
+        assert max_err < 1e-5, 'batched custom_embedding_distance diverged'
@@ -0,0 +1,116 @@
+'''
+Parity check of EventMatcher against the motmetrics accumulator used by
+Evaluator.eval_frame. Hypotheses are generated from the ground truth of
+each sequence (jittered boxes, dropped objects, false positives and id
+swaps) and evaluated over the same windows the envs use: single frames
+(sequential env) and 0.2s look-ahead windows (parallel env).
+Run from ahm-agent/:
+    python tools/check_event_parity.py [dataset]
+'''
+import os
+import os.path as osp
+import random
+import sys
+import time
+
+import numpy as np
+
+from motgym.envs.base_env import BasicMotEnv
+from motgym.envs.utils.evaluation import Evaluator
+from motgym.envs.utils.events import EventMatcher
+from motgym.envs.utils.io import unzip_objs
+
+EVENT_TYPES = ['MATCH', 'SWITCH', 'MISS', 'FP']
+
+
+def generate_results(evaluator, rng):
+    '''Corrupt ground truth into tracker-like results'''
+    results = {}
+    id_swaps = {}
+    gt_index = evaluator.gt_index
+    for frame_id in gt_index.frame_ids.tolist():
+        frame_results = []
+        for tlwh, tid in zip(*gt_index.frame(frame_id)):
+            if rng.random() < 0.1:
+                continue
+            x, y, w, h = tlwh
+            jitter = rng.normal(0, 0.08, 4) * [w, h, w, h]
+            tlwh = (x + jitter[0], y + jitter[1], max(1., w + jitter[2]), max(1., h + jitter[3]))
+            if rng.random() < 0.005:
+                id_swaps[tid] = tid + 10000
+            frame_results.append((tlwh, id_swaps.get(tid, tid), 1))
+        for n in range(rng.poisson(1)):
+            tlwh = tuple(rng.uniform(0, 1000, 2)) + tuple(rng.uniform(20, 200, 2))
+            frame_results.append((tlwh, 20000 + n, 1))
+        results[frame_id] = frame_results
+    return results
+
+
+def motmetrics_events(evaluator, results, frames):
+    evaluator.reset_accumulator()
+    for frame_id in frames:
+        trk_tlwhs, trk_ids = unzip_objs(results[frame_id])[:2]
+        evaluator.eval_frame(frame_id, trk_tlwhs, trk_ids, rtn_events=False)
+    events = evaluator.acc.mot_events
+    return events[events['Type'].isin(EVENT_TYPES)]
+
+
+def matcher_events(matcher, results, frames):
+    matcher.reset()
+    for frame_id in frames:
+        trk_tlwhs, trk_ids = unzip_objs(results[frame_id])[:2]
+        matcher.update(frame_id, trk_tlwhs, trk_ids)
+    return matcher.events
+
+
+def compare(mm_events, events):
+    if len(mm_events) != len(events):
+        return False
+    for hid in set(h for h in events.hids if not np.isnan(h)):
+        if list(mm_events[mm_events['HId'] == hid]['Type'].values) != events.hypothesis_types(hid):
+            return False
+    for oid in set(o for o in events.oids if not np.isnan(o)):
+        mm_oid = mm_events[mm_events['OId'] == oid]
+        mm_hids = [None if np.isnan(h) else int(h) for h in mm_oid['HId'].values]
+        oid_events = events.object_events(oid)
+        hids = [None if np.isnan(h) else int(h) for _, h in oid_events]
+        if list(mm_oid['Type'].values) != [t for t, _ in oid_events] or mm_hids != hids:
+            return False
+    return True
+
+
+def run_parity(dataset='MOT17/train_half', seed=0):
+    data_dir = osp.join(BasicMotEnv._get_gym_path(), 'datasets', dataset)
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    all_passed = True
+    for seq in sorted(os.listdir(data_dir)):
+        evaluator = Evaluator(data_dir, seq, 'mot')
+        matcher = EventMatcher(evaluator)
+        results = generate_results(evaluator, rng)
+        frames = sorted(results.keys())
+        meta_info = open(osp.join(data_dir, seq, 'seqinfo.ini')).read()
+        frame_rate = int(meta_info[meta_info.find('frameRate') + 10:meta_info.find('\nseqLength')])
+
+        for window in [1, int(frame_rate * 0.2) + 1]:
+            mismatches, mm_time, matcher_time = 0, 0., 0.
+            for start in range(0, len(frames) - window + 1):
+                window_frames = frames[start:start + window]
+                t0 = time.perf_counter()
+                mm_events = motmetrics_events(evaluator, results, window_frames)
+                t1 = time.perf_counter()
+                events = matcher_events(matcher, results, window_frames)
+                t2 = time.perf_counter()
+                mm_time += t1 - t0
+                matcher_time += t2 - t1
+                mismatches += not compare(mm_events, events)
+            all_passed &= mismatches == 0
+            print(f'{seq} window {window}: {mismatches} mismatching windows, '
+                  f'motmetrics {mm_time:.2f}s vs matcher {matcher_time:.2f}s')
+    print('PASSED' if all_passed else 'FAILED')
+    return all_passed
+
+
+if __name__ == "__main__":
+    dataset = sys.argv[1] if len(sys.argv) == 2 else 'MOT17/train_half'
+    sys.exit(0 if run_parity(dataset) else 1)
@@ -0,0 +1,55 @@
+'''
+Rounding drift of the running sums of FeatureGallery over many append/pop
+cycles of a long-lived track (JDE maxlen eviction and prune pops), against
+the sums recomputed from the gallery features. Runs with the periodic
+recompute (refresh_every) and without it. Run from ahm-agent/:
+    python tools/check_gallery_drift.py [cycles]
+'''
+import sys
+
+import numpy as np
+
+import motgym
+from modified.gallery import FeatureGallery
+
+DIM = 512
+
+
+def scratch_stats(gallery):
+    feats = gallery.array().astype(float)
+    normed = feats / np.linalg.norm(feats, axis=1, keepdims=True)
+    n = len(feats)
+    similarity = normed @ normed.T
+    pair_similarity = (similarity.sum() - np.trace(similarity)) / 2
+    mean = feats.mean(axis=0)
+    return mean, 1. - pair_similarity / (n * (n - 1) / 2)
+
+
+def max_drift(cycles, refresh_every, seed=0):
+    rng = np.random.default_rng(seed)
+    identity = rng.normal(0, 1, DIM)
+    gallery = FeatureGallery(maxlen=100)
+    gallery.refresh_every = refresh_every
+    drift = {"mean": 0., "average_pairwise_distance": 0.}
+    for i in range(cycles):
+        # Similar features of one identity, as the gallery of one track
+        gallery.append((identity + rng.normal(0, 0.3, DIM)).astype(np.float32))
+        if i % 3 == 0 and len(gallery) > 3:
+            gallery.pop(int(rng.integers(len(gallery))))
+        if i % 1000 == 999:
+            mean, average_distance = scratch_stats(gallery)
+            drift["mean"] = max(drift["mean"], np.max(np.abs(gallery.mean() - mean)))
+            drift["average_pairwise_distance"] = max(
+                drift["average_pairwise_distance"],
+                abs(gallery.average_pairwise_distance() - average_distance))
+    return drift
+
+
+if __name__ == "__main__":
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for refresh_every in [FeatureGallery.refresh_every, sys.maxsize]:
+        drift = max_drift(cycles, refresh_every)
+        label = 'never' if refresh_every == sys.maxsize else refresh_every
+        print(f'refresh every {label}: max abs drift over {cycles} cycles, '
+              f'mean {drift["mean"]:.2e}, '
+              f'average pairwise distance {drift["average_pairwise_distance"]:.2e}')
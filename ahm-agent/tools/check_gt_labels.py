@@ -0,0 +1,81 @@
+'''
+Agreement of the label based events (LabelMatcher over the GT id labels of
+the tracks' detections) with the IoU matched events of EventMatcher over
+the track boxes, the two ways the envs pair tracker outputs with ground
+truth (use_gt_labels). Runs a parallel env over each sequence with random
+actions and compares the per-track event types of every look-ahead window
+(0.2s, as the rewards of the parallel env) under both, and times them.
+Run from ahm-agent/:
+    python tools/check_gt_labels.py [FairMOT|JDE]
+'''
+import sys
+import time
+
+import gym
+import numpy as np
+
+import motgym
+
+
+def episode_results(env, seq, seed=0):
+    '''{frame_id: results} of one episode, as used for rewards'''
+    env.seqs = [seq]
+    rng = np.random.default_rng(seed)
+    env.reset()
+    results = {}
+    env._add_results(results, env.frame_id, env.online_targets)
+    done = False
+    while not done:
+        frame_id = env.frame_id
+        _, _, done, _ = env.step(int(rng.integers(0, 2)))
+        if env.frame_id != frame_id:
+            env._add_results(results, env.frame_id, env.online_targets)
+    return results
+
+
+def timed_events(env, results, gt_labels):
+    env.gt_labels = gt_labels
+    start = time.perf_counter()
+    events = env._get_events(results)
+    return events, time.perf_counter() - start
+
+
+def compare(env, results):
+    labels = env.gt_labels
+    window = int(env.frame_rate * 0.2) + 1
+    frames = sorted(results)
+    agree = total = 0
+    label_time = box_time = 0.
+    for frame_id in frames:
+        window_results = {f: results[f] for f in range(frame_id, frame_id + window) if f in results}
+        label_events, t = timed_events(env, window_results, labels)
+        label_time += t
+        box_events, t = timed_events(env, window_results, None)
+        box_time += t
+        for _, tid, _, _ in results[frame_id]:
+            total += 1
+            agree += sorted(label_events.hypothesis_types(tid)) == \
+                sorted(box_events.hypothesis_types(tid))
+    env.gt_labels = labels
+    return agree, total, label_time / len(frames), box_time / len(frames)
+
+
+def check(env_id):
+    env = gym.make(env_id).unwrapped
+    env.shared_lookahead = True
+    env.use_gt_labels = True  # Off by default, load the labels
+    for seq in sorted(env.seqs):
+        results = episode_results(env, seq)
+        if env.gt_labels is None:
+            print(f'{env_id} {seq}: no detection labels (npz detections?)')
+            continue
+        agree, total, label_time, box_time = compare(env, results)
+        print(f'{env_id} {seq}: same event types for {agree / max(total, 1):.2%} of {total} '
+              f'track windows, labels {label_time * 1e6:.0f} us/window, '
+              f'boxes {box_time * 1e6:.0f} us/window')
+    env.close()
+
+
+if __name__ == "__main__":
+    for tracker in sys.argv[1:2] or ['FairMOT', 'JDE']:
+        check(f'motgym:{tracker}/Mot17ParallelEnv-v0')
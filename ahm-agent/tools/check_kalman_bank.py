@@ -0,0 +1,118 @@
+'''
+Check the batched KalmanBank predict, update and fuse_motion against the
+per-track FairMOT KalmanFilter and matching.fuse_motion they replace, on
+random tracks followed for a number of frames, and time both. Then replace
+tracks every frame for a long sequence and check that released slots are
+reused, so the bank stays the size of the live tracks, and that restoring
+a snapshot of the allocation state undoes the tracks created after it.
+Run from ahm-agent/:
+    python tools/check_kalman_bank.py
+'''
+import time
+
+import numpy as np
+
+import motgym
+import motgym.trackers.FairMOT.src._init_paths
+from tracker import matching
+from tracking_utils.kalman_filter import KalmanFilter
+from modified.kalman_bank import KalmanBank, KalmanSlot, batch_kalman_update, fuse_motion
+
+NUM_FRAMES = 50
+
+
+class Box(KalmanSlot):
+    '''Track/detection stand-in with only what the Kalman code reads'''
+
+    def __init__(self, xyah):
+        self.xyah = xyah
+        self.kalman_filter = None
+
+    def to_xyah(self):
+        return self.xyah
+
+
+def random_xyah(rng, n):
+    return np.c_[rng.uniform(0, 1900, (n, 2)), rng.uniform(0.3, 0.6, n), rng.uniform(50, 300, n)]
+
+
+def run(num_tracks, seed=0):
+    rng = np.random.default_rng(seed)
+    kf = KalmanFilter()
+    bank = KalmanBank(KalmanFilter())
+    xyah = random_xyah(rng, num_tracks)
+    ref = [Box(m) for m in xyah]
+    banked = [Box(m) for m in xyah]
+    for r, b, m in zip(ref, banked, xyah):
+        r.initiate_kalman(kf, m)
+        b.initiate_kalman(bank, m)
+
+    ref_time, bank_time, max_err = 0., 0., 0.
+    for _ in range(NUM_FRAMES):
+        stopped = rng.random(num_tracks) < 0.2
+        xyah = xyah + rng.normal(size=xyah.shape) * [3, 3, 0.01, 2]
+        dets = [Box(m) for m in xyah]
+        updated = rng.random(num_tracks) < 0.7
+        costs = rng.random((num_tracks, num_tracks))
+
+        start = time.perf_counter()
+        means = np.asarray([t.mean.copy() for t in ref])
+        means[stopped, 7] = 0
+        means, covariances = kf.multi_predict(means, np.asarray([t.covariance for t in ref]))
+        for t, mean, cov in zip(ref, means, covariances):
+            t.mean, t.covariance = mean, cov
+        ref_costs = matching.fuse_motion(kf, costs.copy(), ref, dets)
+        for i in np.flatnonzero(updated):
+            ref[i].mean, ref[i].covariance = kf.update(
+                ref[i].mean, ref[i].covariance, dets[i].to_xyah())
+        mid = time.perf_counter()
+        slots = np.fromiter((t.slot for t in banked), dtype=int)
+        bank.predict_slots(slots, stopped)
+        bank_costs = fuse_motion(bank, costs.copy(), banked, dets)
+        batch_kalman_update([(banked[i], dets[i]) for i in np.flatnonzero(updated)])
+        end = time.perf_counter()
+        ref_time += mid - start
+        bank_time += end - mid
+
+        finite = np.isfinite(ref_costs)
+        assert np.array_equal(finite, np.isfinite(bank_costs))
+        max_err = max(max_err, np.abs(ref_costs[finite] - bank_costs[finite]).max(initial=0.))
+        for r, b in zip(ref, banked):
+            max_err = max(max_err, np.abs(r.mean - b.mean).max() / np.abs(r.mean).max(),
+                          np.abs(r.covariance - b.covariance).max() / np.abs(r.covariance).max())
+
+    print(f'{num_tracks:4d} tracks: per-track {ref_time / NUM_FRAMES * 1e3:7.2f} ms/frame, '
+          f'bank {bank_time / NUM_FRAMES * 1e3:6.2f} ms/frame, max rel diff {max_err:.1e}')
+
+
+def churn(num_tracks, num_frames=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    bank = KalmanBank(KalmanFilter())
+    live = [Box(m) for m in random_xyah(rng, num_tracks)]
+    for t in live:
+        t.initiate_kalman(bank, t.xyah)
+    state, snapshot_live = bank.state(), list(live)
+    created = num_tracks
+    for frame in range(num_frames):
+        replaced = np.flatnonzero(rng.random(num_tracks) < 0.1)
+        for i in replaced:
+            live[i] = Box(random_xyah(rng, 1)[0])
+            live[i].initiate_kalman(bank, live[i].xyah)
+        created += len(replaced)
+        bank.release_unused(live)
+        slots = [t.slot for t in live]
+        assert len(set(slots)) == num_tracks, 'a slot is used by two live tracks'
+        assert bank.size <= 2 * num_tracks, (frame, bank.size)
+        if frame == 10:
+            bank.restore(state)
+            assert bank.state() == state
+            live = list(snapshot_live)
+    print(f'{num_tracks:4d} live tracks, {created} created over {num_frames} frames: '
+          f'bank size {bank.size}')
+
+
+if __name__ == "__main__":
+    for num_tracks in [10, 50, 200]:
+        run(num_tracks)
+    for num_tracks in [10, 50, 200]:
+        churn(num_tracks)
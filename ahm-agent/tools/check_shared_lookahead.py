@@ -0,0 +1,53 @@
+'''
+Parity check of the parallel envs' shared look-ahead (SharedLookahead)
+against simulating the look-ahead for every track. Each sequence is run
+twice with the same seeded random actions, shared_lookahead off and on,
+and the per-step rewards must be identical. Prints the run times and how
+many look-aheads were simulated and reused.
+Run from ahm-agent/:
+    python tools/check_shared_lookahead.py [FairMOT|JDE] [max_steps]
+'''
+import random
+import sys
+import time
+
+import gym
+import numpy as np
+
+import motgym
+
+
+def run(env, seq, shared, max_steps, seed=0):
+    env.unwrapped.seqs = [seq]
+    env.unwrapped.shared_lookahead = shared
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+
+    rewards = []
+    env.reset()
+    start = time.perf_counter()
+    done = False
+    while not done and len(rewards) < max_steps:
+        _, reward, done, info = env.step(int(rng.integers(0, 2)))
+        rewards.append(reward)
+    return rewards, time.perf_counter() - start, dict(info["seq_info"]["lookahead"])
+
+
+def check(env_id, max_steps):
+    env = gym.make(env_id)
+    for seq in sorted(env.unwrapped.seqs):
+        per_track, per_track_time, _ = run(env, seq, False, max_steps)
+        shared, shared_time, counts = run(env, seq, True, max_steps)
+        diff = sum(a != b for a, b in zip(per_track, shared))
+        status = 'OK' if per_track == shared else f'FAIL ({diff} rewards differ)'
+        print(f'{env_id} {seq}: {len(shared)} steps, per-track {per_track_time:.1f} s, '
+              f'shared {shared_time:.1f} s ({counts["simulated"]} simulated, '
+              f'{counts["reused"]} reused) {status}')
+    env.close()
+
+
+if __name__ == "__main__":
+    trackers = sys.argv[1:2] or ['FairMOT', 'JDE']
+    max_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    for tracker in trackers:
+        check(f'motgym:{tracker}/Mot17ParallelEnv-v0', max_steps)
@@ -0,0 +1,74 @@
+'''
+Check the incremental smooth_feat of the FairMOT AgentSTrack against the
+previous update_gallery, which recomputed the moving average over the
+whole gallery after every change. Long galleries are built from the
+MOT17-04 feature cache (random unit features if it is missing), with a
+prune every few appends. Run from ahm-agent/:
+    python tools/check_smooth_feat.py
+'''
+import os.path as osp
+import time
+
+import numpy as np
+
+import motgym
+from modified.fairmot_train import AgentSTrack
+from motgym.envs.base_env import BasicMotEnv
+from motgym.envs.utils.det_store import has_store, load_store
+
+SEQ_DIR = osp.join(BasicMotEnv._get_gym_path(), 'detections',
+                   'FairMOT', 'MOT17', 'train_half', 'MOT17-04')
+
+
+def reference_smooth_feat(features, alpha):
+    '''Previous update_gallery loop'''
+    smooth_feat = None
+    for feat in features:
+        feat = np.array(feat)
+        if smooth_feat is None:
+            smooth_feat = feat
+        else:
+            feat /= np.linalg.norm(feat)
+            smooth_feat = alpha * smooth_feat + (1 - alpha) * feat
+        smooth_feat /= np.linalg.norm(smooth_feat)
+    return smooth_feat
+
+
+def load_feats(num_feats):
+    if has_store(SEQ_DIR):
+        _, feats = load_store(SEQ_DIR)
+        if feats is not None:
+            rows = np.array(feats.array[:num_feats])
+            if len(rows) == num_feats:
+                return rows
+    print('MOT17-04 features not found, using random features')
+    rows = np.random.default_rng(0).normal(size=(num_feats, 128))
+    return rows.astype(np.float32)
+
+
+def run_track(feats, incremental, prune_every):
+    AgentSTrack.incremental_smooth = incremental
+    track = AgentSTrack([0, 0, 1, 1], 1., feats[0].copy(), 1.)
+    max_err, elapsed = 0., 0.
+    for i, feat in enumerate(feats):
+        start = time.perf_counter()
+        track.update_gallery(1, feat.copy())
+        if prune_every and i % prune_every == prune_every - 1:
+            track.update_gallery(-1, feat.copy())
+        elapsed += time.perf_counter() - start
+        if incremental:
+            expected = reference_smooth_feat(track.features, track.alpha)
+            max_err = max(max_err, np.max(np.abs(track.smooth_feat - expected)))
+    return len(track.features), elapsed, max_err
+
+
+if __name__ == "__main__":
+    feats = load_feats(1000)
+    for prune_every in [0, 10, 3]:
+        size, inc_time, max_err = run_track(feats, True, prune_every)
+        _, ref_time, _ = run_track(feats, False, prune_every)
+        print(f'prune every {prune_every or "-"}: final gallery {size}, '
+              f'max abs diff {max_err:.2e}, incremental {inc_time * 1e3:.1f} ms, '
+              f'recompute {ref_time * 1e3:.1f} ms')
+        assert max_err < 1e-5, 'incremental smooth_feat diverged'
+    AgentSTrack.incremental_smooth = True
@@ -0,0 +1,70 @@
+'''
+Export the gallery policy of an RLlib checkpoint to an npz of its network
+weights, which the evaluation trackers load without Ray as PolicyMLP
+(agent_path=<file>.npz). The checkpoint is restored the way the tracker
+restores it (build_agent), and the exported policy is checked to give the
+same logits/Q-values and greedy actions as the restored policy.
+Run from ahm-agent/:
+    python tools/export_policy.py fairmot|jde <checkpoint> <output.npz>
+'''
+import sys
+
+import numpy as np
+
+import motgym
+import motgym.trackers.FairMOT.src._init_paths
+from modified.policy import PolicyMLP, export_weights
+
+NUM_CHECKS = 1000
+
+
+def build_trainer(tracker, checkpoint):
+    if tracker == 'fairmot':
+        from modified.fairmot_agent import AgentJDETracker as Tracker
+    else:
+        from modified.jde_agent import AgentJdeTracker as Tracker
+    return Tracker.build_agent(None, checkpoint)
+
+
+def random_observations(rng, n):
+    '''Observations spanning the observation space, see BaseFairmotEnv'''
+    return np.c_[
+        rng.uniform(0.4, 1, n),  # Detection score
+        rng.uniform(0, 1, n),  # Max gallery similarity
+        rng.integers(0, 100, n),  # Gallery size
+        rng.uniform(0, 1, n),  # Min iou score
+        rng.uniform(0, 1, n),  # Distance to gallery mean
+        rng.uniform(0, 1, n)  # Average pairwise gallery distance
+    ]
+
+
+def export(trainer, output):
+    policy = trainer.get_policy()
+    state_dict = {k: v.detach().cpu().numpy() for k, v in policy.model.state_dict().items()}
+    epsilon = 0.
+    if hasattr(policy.exploration, 'get_state'):
+        epsilon = float(policy.exploration.get_state().get("cur_epsilon", 0.))
+    algorithm = type(trainer).__name__.lower().replace('trainer', '')
+    weights = export_weights(
+        state_dict, algorithm, trainer.config["model"]["fcnet_activation"], epsilon)
+    np.savez(output, **weights)
+    return policy
+
+
+def check(policy, exported, seed=0):
+    obs = random_observations(np.random.default_rng(seed), NUM_CHECKS)
+    actions, _, extra = policy.compute_actions(obs, explore=False)
+    scores = extra.get("action_dist_inputs", extra.get("q_values"))
+    exported_scores = exported.action_scores(obs)
+    max_diff = np.abs(np.asarray(scores) - exported_scores).max()
+    agree = np.mean(np.asarray(actions) == exported_scores.argmax(axis=1))
+    print(f'{exported.algorithm}: max score diff {max_diff:.1e}, '
+          f'greedy actions agree on {agree:.1%} of {NUM_CHECKS} observations')
+
+
+if __name__ == "__main__":
+    tracker, checkpoint, output = sys.argv[1:4]
+    trainer = build_trainer(tracker, checkpoint)
+    policy = export(trainer, output)
+    check(policy, PolicyMLP.load(output))
+    print(f'Exported {checkpoint} to {output}')
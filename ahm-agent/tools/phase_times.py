@@ -0,0 +1,50 @@
+'''
+Per-phase times of an episode of an env with random actions, as reported
+in the info of its last step with time_phases (PhaseTimerCallbacks reports
+the same to TensorBoard during training). Also times the episode with the
+timers off to show their overhead. Run from ahm-agent/:
+    python tools/phase_times.py [env_id] [seed]
+'''
+import random
+import sys
+import time
+
+import gym
+import numpy as np
+
+import motgym
+
+
+def run_episode(env, time_phases, seed):
+    env.phase_timer.enabled = time_phases
+    random.seed(seed)  # Sequence choice
+    env.action_space.seed(seed)
+    np.random.seed(seed)
+    start = time.perf_counter()
+    env.reset()
+    done, info, steps = False, {}, 0
+    while not done:
+        _, _, done, info = env.step(env.action_space.sample())
+        steps += 1
+    return info, steps, time.perf_counter() - start
+
+
+def report(env_id, seed):
+    env = gym.make(env_id).unwrapped
+    info, steps, timed = run_episode(env, True, seed)
+    _, _, untimed = run_episode(env, False, seed)
+    env.close()
+
+    print(f'{env_id}: {steps} steps, {timed:.2f}s timed, {untimed:.2f}s untimed')
+    print(f'{"phase":<60} {"calls":>7} {"total ms":>10} {"mean":>8} {"p50":>8} {"p95":>8} '
+          f'{"p99":>8} {"max":>8}')
+    for path, stats in sorted(info["phase_times"].items()):
+        print(f'{path:<60} {stats["calls"]:>7} {stats["total_ms"]:>10.1f} {stats["mean_ms"]:>8.3f} '
+              f'{stats["p50_ms"]:>8.3f} {stats["p95_ms"]:>8.3f} {stats["p99_ms"]:>8.3f} '
+              f'{stats["max_ms"]:>8.3f}')
+
+
+if __name__ == "__main__":
+    env_id = sys.argv[1] if len(sys.argv) > 1 else "motgym:FairMOT/Mot17ParallelEnv-v0"
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    report(env_id, seed)
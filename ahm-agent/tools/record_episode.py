@@ -0,0 +1,39 @@
+'''
+Record an episode of an env to an mp4 without a display: frames are
+rendered in rgb_array mode and encoded in the background by the env's
+recorder (start_recording). Prints the time spent rendering per step.
+Run from ahm-agent/:
+    python tools/record_episode.py [env_id] [output.mp4] [max_steps]
+'''
+import sys
+import time
+
+import gym
+
+import motgym
+
+
+def record(env_id, output, max_steps):
+    env = gym.make(env_id)
+    env.reset()
+    env.unwrapped.start_recording(output)
+
+    render_time = 0.
+    steps = 0
+    done = False
+    while not done and steps < max_steps:
+        start = time.perf_counter()
+        env.render(mode="rgb_array")
+        render_time += time.perf_counter() - start
+        _, _, done, _ = env.step(env.action_space.sample())
+        steps += 1
+    env.close()  # Finishes the video
+    print(f'Recorded {steps} steps of {env_id} to {output}, '
+          f'render {render_time / max(steps, 1) * 1e3:.1f} ms/step')
+
+
+if __name__ == "__main__":
+    env_id = sys.argv[1] if len(sys.argv) > 1 else "motgym:FairMOT/Mot17SequentialEnv-v0"
+    output = sys.argv[2] if len(sys.argv) > 2 else 'episode.mp4'
+    max_steps = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    record(env_id, output, max_steps)